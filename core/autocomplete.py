@@ -0,0 +1,374 @@
+# core/autocomplete.py
+# --- Gợi ý tìm kiếm theo tiền tố cho thanh search (mảng key đã sort + bisect) ---
+import copy
+from bisect import bisect_left
+
+import numpy as np
+
+from core.records import PackedStrings, bisect_strings, pack_lists, pack_strings
+from core.search import fold_text
+from core.search_index import tokenize
+from core.versioned import AppendList, LayeredDict, append_to
+
+MAX_SUGGESTIONS = 20  # limit tối đa 1 request
+_SCAN_LIMIT = 256  # Tiền tố khớp nhiều hơn số key này -> top gợi ý tính sẵn, còn lại duyệt trực tiếp
+_TOP_DEPTH = 2 * MAX_SUGGESTIONS  # Số gợi ý tính sẵn mỗi tiền tố nặng (dư cho gợi ý bị gỡ sau update())
+
+# Loại gợi ý (thứ tự ưu tiên khi cùng trọng số)
+KIND_RESTAURANT = 0
+KIND_DISH = 1
+KIND_TAG = 2
+KIND_NAMES = ('restaurant', 'dish', 'tag')
+
+_NONE = np.empty(0, dtype=np.int32)
+
+
+def _key(text):
+    return ' '.join(tokenize(text))
+
+
+def _rating(value):
+    return float(value) if isinstance(value, (int, float)) and not isinstance(value, bool) else 0.0
+
+
+def _label(value):
+    """Chuỗi hiển thị của gợi ý (None nếu không dùng được làm gợi ý)."""
+    return value.strip() if isinstance(value, str) and value.strip() else None
+
+
+def _labels(values):
+    return {label for label in map(_label, values or ()) if label}
+
+
+def _entries(label, index):
+    """(key, suggestion) của 1 gợi ý: phần tên bắt đầu từ mỗi từ, cả dạng có dấu và bỏ dấu."""
+    key = _key(label)
+    for form in {key, fold_text(key)}:
+        words = form.split()
+        for i in range(len(words)):
+            yield ' '.join(words[i:]), index
+
+
+def _appended(values, value):
+    """values + [value] dùng chung phần cũ (AppendList)."""
+    if not isinstance(values, AppendList):
+        values = AppendList(values)
+    return values.append(value)
+
+
+class AutocompleteIndex:
+    """
+    Gợi ý tên nhà hàng, tên món, tag. Mỗi gợi ý có trọng số tính sẵn (rating nhà hàng;
+    món / tag lấy rating cao nhất trong các nhà hàng có nó). Key là phần tên bắt đầu từ
+    mỗi từ ("pizza 4p s", "4p s"...) nên gõ từ giữa tên vẫn ra gợi ý; lưu cả dạng có dấu
+    và bỏ dấu như inverted index (gõ "phở" chỉ khớp "phở", gõ "pho" khớp cả hai).
+
+    update() sửa tăng dần trên bản clone(): gợi ý thêm mới / tăng trọng số được ghi key vào
+    list phụ đã sort (_extra_keys), gợi ý không còn nhà hàng nào có thì _counts = 0. Trọng số
+    món / tag chỉ tăng (nhà hàng có rating cao nhất bị hạ / gỡ thì giữ trọng số cũ tới lần
+    build lại, như max_weight của SearchIndex). Top tính sẵn giữ _TOP_DEPTH gợi ý nên vẫn
+    dùng được khi vài gợi ý trong đó bị gỡ / giảm trọng số.
+    """
+
+    def __init__(self, labels, kinds, ids, weights, keys, key_targets, top_prefixes=(), top_offsets=None,
+                 top_targets=_NONE, counts=None):
+        self._labels = labels  # suggestion -> chuỗi hiển thị
+        self._kinds = kinds  # suggestion -> KIND_*
+        self._ids = ids  # suggestion -> restaurant_id ('' / None với món / tag)
+        self._weights = weights
+        self._keys = keys  # key bỏ dấu đã sort
+        self._key_targets = key_targets  # key -> suggestion
+        # Tiền tố khớp > _SCAN_LIMIT key (đã sort) -> [suggestion] đã xếp hạng, dạng CSR
+        self._top_prefixes = top_prefixes
+        self._top_offsets = top_offsets if top_offsets is not None else np.zeros(1, dtype=np.int64)
+        self._top_targets = top_targets
+        # Số nhà hàng có gợi ý (0 = đã gỡ); trọng số lúc build (top tính sẵn theo trọng số này)
+        self._counts = counts if counts is not None else np.ones(len(weights), dtype=np.int32)
+        self._base_weights = weights
+        self._extra_keys = []  # Key của gợi ý thêm / tăng trọng số sau build (đã sort)
+        self._extra_targets = []
+        self._reindexed = LayeredDict()  # suggestion lúc build đã có key trong _extra_keys
+        self._appenders = {}
+        self._dirty = False  # Đã update() (không còn đúng nguyên bản build)
+
+    def __len__(self):
+        return len(self._labels)
+
+    @classmethod
+    def build(cls, restaurants, menus_by_restaurant_id):
+        labels, kinds, ids, weights, counts = [], [], [], [], []
+        shared = {}  # (kind, label) -> suggestion, món / tag trùng tên chỉ giữ 1
+        owners = set()  # (suggestion, restaurant_id) đã đếm
+
+        def add(label, kind, rid, weight):
+            if not isinstance(label, str) or not label.strip():
+                return
+            label = label.strip()
+            if kind != KIND_RESTAURANT:
+                index = shared.get((kind, label))
+                if index is not None:
+                    weights[index] = max(weights[index], weight)
+                    if (index, rid) not in owners:
+                        owners.add((index, rid))
+                        counts[index] += 1
+                    return
+                shared[(kind, label)] = len(labels)
+                owners.add((len(labels), rid))
+            labels.append(label)
+            kinds.append(kind)
+            ids.append(rid if kind == KIND_RESTAURANT else None)
+            weights.append(weight)
+            counts.append(1)
+
+        ratings = {}
+        for r in restaurants:
+            rid = str(r['id'])
+            ratings[rid] = rating = _rating(r.get('rating'))
+            add(r.get('name'), KIND_RESTAURANT, rid, rating)
+            for tag in r.get('tags') or []:
+                add(tag, KIND_TAG, rid, rating)
+        for restaurant_id, menu_items in menus_by_restaurant_id.items():
+            rating = ratings.get(str(restaurant_id), 0.0)
+            for item in menu_items:
+                add(item.get('dish_name'), KIND_DISH, str(restaurant_id), rating)
+
+        entries = sorted(entry for index, label in enumerate(labels) for entry in _entries(label, index))
+        key_targets = np.array([index for _, index in entries], dtype=np.int32)
+        return cls(
+            labels, np.array(kinds, dtype=np.int8), ids, np.array(weights, dtype=np.float64),
+            [key for key, _ in entries], key_targets, counts=np.array(counts, dtype=np.int32),
+        )._with_tops()
+
+    def _with_tops(self):
+        """Tính top cho mọi tiền tố nặng (gọi khi build / gộp lại, index chưa update())."""
+        prefixes = self._heavy_prefixes()
+        self._top_offsets, self._top_targets = pack_lists([self._rank(prefix, _TOP_DEPTH) for prefix in prefixes])
+        self._top_prefixes = prefixes
+        return self
+
+    def _range(self, prefix):
+        """Khoảng [lo, hi) các key bắt đầu bằng prefix."""
+        lo = bisect_left(self._keys, prefix)
+        return lo, bisect_left(self._keys, prefix + '\uffff', lo)
+
+    def _heavy_prefixes(self):
+        """
+        Các tiền tố (đã sort) khớp > _SCAN_LIMIT key. Chỉ đi xuống con của tiền tố nặng:
+        tiền tố nhẹ thì mọi tiền tố dài hơn cũng nhẹ.
+        """
+        keys = self._keys
+        heavy = []
+        stack = [('', 0, len(keys))]
+        while stack:
+            prefix, lo, hi = stack.pop()
+            if prefix:
+                heavy.append(prefix)
+            depth = len(prefix)
+            i = lo
+            while i < hi and len(keys[i]) == depth:  # key = đúng prefix, đứng đầu khoảng
+                i += 1
+            while i < hi:
+                child = prefix + keys[i][depth]
+                j = bisect_left(keys, child + '\uffff', i, hi)
+                if j - i > _SCAN_LIMIT:
+                    stack.append((child, i, j))
+                i = j
+        heavy.sort()
+        return heavy
+
+    def _merged(self):
+        """Index tương đương không còn phần update(): bỏ key của gợi ý đã gỡ, tính lại top."""
+        if not self._dirty:
+            return self
+        counts = self._counts
+        entries = {(key, target) for key, target in zip(self._keys, self._key_targets.tolist()) if counts[target]}
+        entries.update((key, target) for key, target in zip(self._extra_keys, self._extra_targets) if counts[target])
+        entries = sorted(entries)
+        return AutocompleteIndex(
+            list(self._labels), self._kinds, list(self._ids), self._weights, [key for key, _ in entries],
+            np.array([target for _, target in entries], dtype=np.int32), counts=counts,
+        )._with_tops()
+
+    def snapshot_state(self):
+        """Trạng thái để ghi snapshot nhị phân (core/snapshot.py), toàn bộ là mảng."""
+        index = self._merged()
+        labels = pack_strings(index._labels)
+        ids = pack_strings(index._ids if isinstance(index._ids, PackedStrings) else [rid or '' for rid in index._ids])
+        keys = pack_strings(index._keys)
+        top_prefixes = pack_strings(index._top_prefixes)
+        return {
+            'label_blob': labels.blob,
+            'label_offsets': labels.offsets,
+            'id_blob': ids.blob,
+            'id_offsets': ids.offsets,
+            'kinds': index._kinds,
+            'weights': index._weights,
+            'counts': index._counts,
+            'key_blob': keys.blob,
+            'key_offsets': keys.offsets,
+            'key_targets': index._key_targets,
+            'top_prefix_blob': top_prefixes.blob,
+            'top_prefix_offsets': top_prefixes.offsets,
+            'top_offsets': index._top_offsets,
+            'top_targets': index._top_targets,
+        }
+
+    @classmethod
+    def from_snapshot(cls, state):
+        return cls(
+            PackedStrings(state['label_blob'], state['label_offsets']), state['kinds'],
+            PackedStrings(state['id_blob'], state['id_offsets']), state['weights'],
+            PackedStrings(state['key_blob'], state['key_offsets']), state['key_targets'],
+            PackedStrings(state['top_prefix_blob'], state['top_prefix_offsets']),
+            state['top_offsets'], state['top_targets'], counts=state['counts'],
+        )
+
+    def clone(self):
+        """Bản copy-on-write cho update() (mảng / list bị thay bằng bản mới chứ không sửa tại chỗ)."""
+        index = copy.copy(self)
+        index._reindexed = self._reindexed.clone()
+        index._appenders = dict(self._appenders)
+        return index
+
+    # --- Cập nhật tăng dần ---
+
+    def _find(self, label, kind, rid):
+        """suggestion còn sống của (label, kind) (nhà hàng: kèm restaurant_id), không có thì None."""
+        key = _key(label)
+        for keys, targets in ((self._keys, self._key_targets), (self._extra_keys, self._extra_targets)):
+            lo = bisect_strings(keys, key)
+            hi = bisect_strings(keys, key + '\0', lo)  # Key không chứa \0: [lo, hi) là key == `key`
+            for index in (int(t) for t in targets[lo:hi]):
+                if (self._counts[index] and self._kinds[index] == kind and self._labels[index] == label
+                        and (kind != KIND_RESTAURANT or self._ids[index] == rid)):
+                    return index
+        return None
+
+    def _index_keys(self, index, label):
+        """Ghi key của suggestion vào _extra_keys (list mới, bản cũ giữ nguyên)."""
+        entries = sorted(zip(self._extra_keys, self._extra_targets))
+        entries.extend(_entries(label, index))
+        entries.sort()
+        self._extra_keys = [key for key, _ in entries]
+        self._extra_targets = [target for _, target in entries]
+
+    def _add(self, label, kind, rid, weight):
+        index = len(self._labels)
+        self._labels = _appended(self._labels, label)
+        self._ids = _appended(self._ids, rid if kind == KIND_RESTAURANT else None)
+        appenders = self._appenders
+        self._kinds = append_to(appenders, 'kinds', self._kinds, [kind])
+        self._weights = append_to(appenders, 'weights', self._weights, [weight])
+        self._counts = append_to(appenders, 'counts', self._counts, [1])
+        self._index_keys(index, label)
+
+    def _set(self, index, weight=None, count=None):
+        """Đổi trọng số / số nhà hàng của 1 suggestion (chép mảng, generation cũ không đổi)."""
+        if count is not None:
+            self._counts = self._counts.copy()
+            self._counts[index] = count
+        if weight is not None and weight != self._weights[index]:
+            raised = weight > self._weights[index]
+            self._weights = self._weights.copy()
+            self._weights[index] = weight
+            if raised and index < len(self._base_weights) and index not in self._reindexed:
+                # Có thể lọt vào top tính sẵn của tiền tố mà nó chưa có mặt -> tra qua _extra_keys
+                self._reindexed[index] = True
+                self._index_keys(index, self._labels[index])
+
+    def _update_shared(self, kind, rid, old_labels, new_labels, rating):
+        for label in old_labels - new_labels:
+            index = self._find(label, kind, rid)
+            if index is not None:
+                self._set(index, count=int(self._counts[index]) - 1)
+        for label in new_labels:
+            index = self._find(label, kind, rid)
+            if index is None:
+                self._add(label, kind, rid, rating)
+                continue
+            weight = max(float(self._weights[index]), rating)
+            self._set(index, weight, None if label in old_labels else int(self._counts[index]) + 1)
+
+    def update(self, rid, old=None, new=None, old_menu=(), new_menu=()):
+        """
+        Thay gợi ý của 1 nhà hàng: old / new là nhà hàng trước / sau (None = không có),
+        old_menu / new_menu là menu trước / sau. Chỉ chạm các gợi ý của nhà hàng này.
+        """
+        rid = str(rid)
+        self._dirty = True
+        old, new = old if old is not None else {}, new if new is not None else {}
+        old_name, new_name = _label(old.get('name')), _label(new.get('name'))
+        rating = _rating(new.get('rating'))
+        index = self._find(old_name, KIND_RESTAURANT, rid) if old_name else None
+        if index is not None and old_name == new_name:
+            self._set(index, rating)
+        else:
+            if index is not None:
+                self._set(index, count=0)
+            if new_name:
+                self._add(new_name, KIND_RESTAURANT, rid, rating)
+        self._update_shared(KIND_TAG, rid, _labels(old.get('tags')), _labels(new.get('tags')), rating)
+        self._update_shared(KIND_DISH, rid, _labels(item.get('dish_name') for item in old_menu),
+                            _labels(item.get('dish_name') for item in new_menu), rating)
+
+    # --- Truy vấn ---
+
+    def _top(self, prefix):
+        """Top gợi ý của prefix: tính sẵn nếu là tiền tố nặng, ngược lại duyệt <= _SCAN_LIMIT key."""
+        prefixes = self._top_prefixes
+        i = bisect_left(prefixes, prefix)
+        heavy = i < len(prefixes) and prefixes[i] == prefix
+        if not self._dirty:
+            if heavy:
+                return self._top_targets[self._top_offsets[i]:self._top_offsets[i + 1]][:MAX_SUGGESTIONS]
+            return self._rank(prefix, MAX_SUGGESTIONS)
+
+        candidates = None
+        if heavy:
+            top = self._top_targets[self._top_offsets[i]:self._top_offsets[i + 1]]
+            # Gợi ý ngoài top tính sẵn có trọng số lúc build thấp hơn mọi gợi ý trong top; còn đủ
+            # MAX_SUGGESTIONS gợi ý không bị gỡ / giảm trọng số thì chúng không thể lọt vào top
+            lowered = (self._counts[top] == 0) | (self._weights[top] < self._base_weights[top])
+            if len(top) - np.count_nonzero(lowered) >= MAX_SUGGESTIONS or len(top) < _TOP_DEPTH:
+                candidates = top
+        if candidates is None:
+            lo, hi = self._range(prefix)
+            candidates = self._key_targets[lo:hi]
+        lo = bisect_left(self._extra_keys, prefix)
+        hi = bisect_left(self._extra_keys, prefix + '\uffff', lo)
+        if hi > lo:
+            candidates = np.concatenate((candidates, np.array(self._extra_targets[lo:hi], dtype=np.int32)))
+        return self._ranked(candidates, MAX_SUGGESTIONS)
+
+    def _rank(self, prefix, limit):
+        """Top `limit` suggestion có key bắt đầu bằng prefix (trọng số giảm dần)."""
+        lo, hi = self._range(prefix)
+        return self._ranked(self._key_targets[lo:hi], limit)
+
+    def _ranked(self, candidates, limit):
+        candidates = np.unique(candidates)
+        candidates = candidates[self._counts[candidates] > 0]
+        # Thứ tự toàn phần: trọng số giảm dần, cùng trọng số thì nhà hàng > món > tag, rồi theo
+        # thứ tự build. Sort hết (không argpartition) để gợi ý sát giới hạn không đổi giữa các lần
+        order = np.lexsort((candidates, self._kinds[candidates], -self._weights[candidates]))
+        return candidates[order[:limit]].astype(np.int32)
+
+    def suggest(self, query, limit=8):
+        """List gợi ý {text, type[, id]} cho tiền tố query (có dấu hay không đều được)."""
+        prefix = _key(query)
+        if not prefix or limit <= 0:
+            return []
+        top = self._top(prefix)[:min(limit, MAX_SUGGESTIONS)]
+
+        suggestions = []
+        for index in top.tolist():
+            suggestion = {"text": self._labels[index], "type": KIND_NAMES[self._kinds[index]]}
+            if self._kinds[index] == KIND_RESTAURANT:
+                suggestion["id"] = self._ids[index]
+            suggestions.append(suggestion)
+        return suggestions
+
+
+def build_autocomplete(restaurants, menus_by_restaurant_id):
+    """Build AutocompleteIndex từ list nhà hàng và menu đã nhóm theo restaurant_id."""
+    return AutocompleteIndex.build(restaurants, menus_by_restaurant_id)
@@ -0,0 +1,135 @@
+# core/cache.py
+# --- Cache kết quả (LRU + TTL) cho các API tìm kiếm / lọc bản đồ ---
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# Cấu hình qua biến môi trường
+CACHE_MAX_SIZE = int(os.getenv('RESULT_CACHE_SIZE', 1024))  # Số entry tối đa mỗi cache
+CACHE_TTL = float(os.getenv('RESULT_CACHE_TTL', 60))  # Giây, 0 = tắt cache
+COORD_PRECISION = int(os.getenv('RESULT_CACHE_COORD_PRECISION', 3))  # 3 chữ số ~ 110m
+
+_CACHES = []  # Tất cả cache đã tạo, để invalidate khi data thay đổi
+
+
+def round_coord(value, precision=None):
+    """Làm tròn tọa độ để các request gần nhau dùng chung 1 entry cache."""
+    if value is None:
+        return None
+    try:
+        return round(float(value), COORD_PRECISION if precision is None else precision)
+    except (TypeError, ValueError):
+        return value
+
+
+def canonical_list(values):
+    """List filter (categories, tags) -> list đã bỏ trùng và sort, không phụ thuộc thứ tự client gửi."""
+    if not isinstance(values, list):
+        return values
+    return sorted({json.dumps(v, sort_keys=True, ensure_ascii=False) for v in values})
+
+
+class ResultCache:
+    """
+    Cache LRU có TTL, an toàn khi nhiều thread cùng dùng.
+    Key là dict tham số request đã chuẩn hóa (xem make_key).
+    """
+
+    def __init__(self, name, max_size=CACHE_MAX_SIZE, ttl=CACHE_TTL):
+        self.name = name
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        _CACHES.append(self)
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def enabled(self):
+        return self.max_size > 0 and self.ttl > 0
+
+    @staticmethod
+    def make_key(params):
+        """Chuẩn hóa dict tham số thành key dạng chuỗi."""
+        return json.dumps(params, sort_keys=True, ensure_ascii=False, default=str)
+
+    def get(self, key):
+        """Trả về (True, value) nếu có entry còn hạn, ngược lại (False, None)."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return True, entry[1]
+                del self._entries[key]
+                self.expirations += 1
+            self.misses += 1
+            return False, None
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_compute(self, params, compute):
+        """Lấy kết quả từ cache theo params, chưa có thì gọi compute() và lưu lại."""
+        if not self.enabled:
+            return compute()
+        key = self.make_key(params)
+        hit, value = self.get(key)
+        if not hit:
+            value = compute()
+            self.set(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+def invalidate_caches():
+    """Xóa toàn bộ cache kết quả (gọi khi data nhà hàng được load lại)."""
+    for cache in _CACHES:
+        cache.clear()
+
+
+def cache_stats():
+    """Thống kê hit/miss/eviction của từng cache."""
+    return {cache.name: cache.stats() for cache in _CACHES}
+
+
+# Cache dùng chung cho /api/search và /api/map/filter
+SEARCH_CACHE = ResultCache('search')
+MAP_FILTER_CACHE = ResultCache('map_filter')
+
+# Mask row ID của FilterPlan (core/filters.py) theo filter category / tỉnh / tag / giá / rating
+FILTER_CACHE = ResultCache('filter_plan', max_size=256)
+
+# Tile điểm nhà hàng /api/map/tiles/z/x/y (key gồm version dữ liệu nên không bao giờ cũ)
+TILE_CACHE = ResultCache('map_tiles', max_size=int(os.getenv('MAP_TILE_CACHE_SIZE', 2048)), ttl=3600)
+
+# Payload GET /api/restaurants?fields=... theo từng projection (chỉ đổi khi data đổi)
+PROJECTION_CACHE = ResultCache('restaurants_projection', max_size=32, ttl=3600)
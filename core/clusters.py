@@ -0,0 +1,62 @@
+# core/clusters.py
+# --- Gộp markers thành cluster theo lưới phân cấp (zoom thấp trên bản đồ) ---
+import os
+
+import numpy as np
+
+from core.geo import GRID_BITS
+
+# Mỗi tile 256px chia 2^CLUSTER_CELL_BITS ô mỗi chiều (4 -> ô ~64px), mỗi ô tối đa 1 cluster
+CLUSTER_CELL_BITS = 2
+# Từ mức zoom này trả markers riêng lẻ thay vì cluster
+CLUSTER_MAX_ZOOM = int(os.getenv('MAP_CLUSTER_MAX_ZOOM', 16))
+
+
+def cluster_rows(columns, rows, zoom):
+    """
+    Gộp rows (nhà hàng có tọa độ) theo ô lưới Web Mercator ở mức zoom. Ô của zoom z là ô
+    mịn nhất tính sẵn (columns.grid_x / grid_y) dịch phải nên chỉ cần 1 lần np.unique.
+    Trả về (clusters, singles):
+        clusters: list {count, position {lat, lon} (trọng tâm), bounds [south, west, north, east],
+            categories {category_id: count}} của các ô có >= 2 nhà hàng, nhiều nhà hàng trước
+        singles: mảng row đứng 1 mình trong ô (trả về như marker thường)
+    """
+    level = min(GRID_BITS, max(0, int(zoom)) + CLUSTER_CELL_BITS)
+    shift = GRID_BITS - level
+    keys = (columns.grid_x[rows].astype(np.uint64) >> shift) << np.uint64(32)
+    keys |= columns.grid_y[rows].astype(np.uint64) >> shift
+    cells, inverse, counts = np.unique(keys, return_inverse=True, return_counts=True)
+    n_cells = len(cells)
+
+    lat, lon = columns.lat[rows], columns.lon[rows]
+    lat_mean = np.bincount(inverse, weights=lat, minlength=n_cells) / np.maximum(counts, 1)
+    lon_mean = np.bincount(inverse, weights=lon, minlength=n_cells) / np.maximum(counts, 1)
+    south = np.full(n_cells, np.inf)
+    west = np.full(n_cells, np.inf)
+    north = np.full(n_cells, -np.inf)
+    east = np.full(n_cells, -np.inf)
+    np.minimum.at(south, inverse, lat)
+    np.minimum.at(west, inverse, lon)
+    np.maximum.at(north, inverse, lat)
+    np.maximum.at(east, inverse, lon)
+
+    # Số nhà hàng theo (ô, category)
+    pairs, pair_counts = np.unique(
+        np.stack([inverse, columns.category_id[rows]]), axis=1, return_counts=True
+    )
+    breakdown = [{} for _ in range(n_cells)]
+    for cell, category_id, count in zip(pairs[0].tolist(), pairs[1].tolist(), pair_counts.tolist()):
+        breakdown[cell][str(category_id)] = count
+
+    clusters = []
+    for cell in np.argsort(-counts, kind='stable').tolist():
+        if counts[cell] < 2:
+            break
+        clusters.append({
+            "count": int(counts[cell]),
+            "position": {"lat": round(float(lat_mean[cell]), 6), "lon": round(float(lon_mean[cell]), 6)},
+            "bounds": [float(south[cell]), float(west[cell]), float(north[cell]), float(east[cell])],
+            "categories": breakdown[cell],
+        })
+    singles = np.sort(rows[counts[inverse] == 1])
+    return clusters, singles
@@ -0,0 +1,229 @@
+# core/columns.py
+# --- Dữ liệu số của nhà hàng dạng cột (struct-of-arrays) để lọc bằng mask NumPy ---
+import copy
+
+import numpy as np
+
+from core.geo import mercator_grid
+from core.records import PackedStrings, pack_strings
+from core.search import parse_price_range
+from core.versioned import AppendList, LayeredDict, append_rows
+
+
+def _to_float(value, default=np.nan):
+    """Ép kiểu float, trả về default nếu thiếu/không hợp lệ."""
+    if isinstance(value, bool) or value is None:
+        return default
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+
+# Các cột số (kể cả cột dẫn xuất) ghi thêm 1 dòng khi upsert
+_ARRAY_COLUMNS = (
+    'min_price', 'max_price', 'rating', 'lat', 'lon', 'category_id', 'position',
+    'lat_rad', 'lon_rad', 'cos_lat', 'grid_x', 'grid_y',
+)
+_DERIVED_COLUMNS = ('lat_rad', 'lon_rad', 'cos_lat', 'grid_x', 'grid_y')
+
+
+def _row_values(r):
+    """Giá trị các cột (chưa gồm cột dẫn xuất) của 1 nhà hàng."""
+    min_price, max_price = parse_price_range(r.get('price_range', ''))
+    category_id = r.get('category_id')
+    return {
+        'min_price': min_price,
+        'max_price': max_price,
+        'rating': _to_float(r.get('rating', 0), 0.0),
+        'lat': _to_float(r.get('lat')),
+        'lon': _to_float(r.get('lon')),
+        'category_id': category_id if isinstance(category_id, int) else -1,
+    }
+
+
+def _derived(lat, lon):
+    """Cột dẫn xuất từ mảng lat / lon: radian cho haversine vector hóa, ô lưới Web Mercator mịn nhất."""
+    lat_rad, lon_rad = np.radians(lat), np.radians(lon)
+    grid_x, grid_y = mercator_grid(lat, lon)
+    return {'lat_rad': lat_rad, 'lon_rad': lon_rad, 'cos_lat': np.cos(lat_rad), 'grid_x': grid_x, 'grid_y': grid_y}
+
+
+class RestaurantColumns:
+    """
+    Các cột song song min_price, max_price, rating, lat, lon, category_id.
+    Row ID là vị trí dòng trong các cột; position là vị trí của nhà hàng trong list nguồn.
+
+    Dòng đã ghi không bao giờ bị sửa: upsert ghi nhà hàng vào 1 dòng mới cuối cột (ghi đè thì
+    dòng cũ alive = False, giữ position), delete chỉ đặt alive = False. Nhờ vậy các generation
+    dùng chung buffer cột (core/versioned.py), chỉ alive (1 byte / dòng) và order (position ->
+    row, chép khi ghi đè) là riêng. Dòng chết được dọn khi build lại (DataRegistry compaction).
+    """
+
+    def __init__(self, restaurants):
+        n = len(restaurants)
+        ids = [str(r['id']) for r in restaurants]
+        self.ids = AppendList(ids)
+        self.row_of = LayeredDict({rid: row for row, rid in enumerate(ids)})
+
+        self.min_price = np.empty(n, dtype=np.float64)
+        self.max_price = np.empty(n, dtype=np.float64)
+        self.rating = np.empty(n, dtype=np.float64)
+        self.lat = np.empty(n, dtype=np.float64)
+        self.lon = np.empty(n, dtype=np.float64)
+        self.category_id = np.empty(n, dtype=np.int64)
+        self.position = np.arange(n, dtype=np.int64)
+        self.order = np.arange(n, dtype=np.int64)  # position -> row ID hiện tại
+        self.alive = np.ones(n, dtype=bool)
+
+        for row, r in enumerate(restaurants):
+            for name, value in _row_values(r).items():
+                getattr(self, name)[row] = value
+
+        for name, values in _derived(self.lat, self.lon).items():
+            setattr(self, name, values)
+        self._appenders = {}  # Tên cột -> AppendArray, tạo khi upsert lần đầu
+
+    def snapshot_state(self):
+        """Trạng thái để ghi snapshot nhị phân (core/snapshot.py), gồm cả cột dẫn xuất."""
+        ids = pack_strings(self.ids)
+        state = {
+            'id_blob': ids.blob,
+            'id_offsets': ids.offsets,
+            'min_price': self.min_price,
+            'max_price': self.max_price,
+            'rating': self.rating,
+            'lat': self.lat,
+            'lon': self.lon,
+            'category_id': self.category_id,
+            'position': self.position,
+            'order': self.order,
+            'alive': self.alive,
+        }
+        for name in _DERIVED_COLUMNS:
+            state[name] = getattr(self, name)
+        return state
+
+    @classmethod
+    def from_snapshot(cls, state):
+        """Dựng lại RestaurantColumns từ snapshot_state() mà không cần list nhà hàng gốc."""
+        columns = cls.__new__(cls)
+        columns.ids = AppendList(PackedStrings(state['id_blob'], state['id_offsets']))
+        # Cột (kể cả cột dẫn xuất) đọc thẳng từ mmap, không tính lại ở từng worker
+        for name in _ARRAY_COLUMNS + ('order', 'alive'):
+            setattr(columns, name, state[name])
+        alive = columns.alive.nonzero()[0]
+        columns.row_of = LayeredDict(dict(zip(columns.ids.take(alive), alive.tolist())))
+        columns._appenders = {}
+        return columns
+
+    def __len__(self):
+        return len(self.ids)
+
+    def clone(self):
+        """
+        Bản copy-on-write cho generation mới: dùng chung buffer cột (chỉ ghi thêm), chỉ chép
+        phần row_of đã sửa (LayeredDict) và danh sách AppendArray.
+        """
+        columns = copy.copy(self)
+        columns.row_of = self.row_of.clone()
+        columns._appenders = dict(self._appenders)
+        return columns
+
+    # --- Cập nhật từng dòng (upsert / delete), chi phí O(1) khấu hao + chép mảng alive ---
+
+    def upsert_row(self, restaurant):
+        """Ghi 1 nhà hàng vào dòng mới cuối các cột (ID đã có thì dòng cũ thành alive = False). Trả về row ID."""
+        rid = str(restaurant['id'])
+        old = self.row_of.get(rid)
+        row = len(self)
+        values = {
+            name: np.array([value], dtype=getattr(self, name).dtype)
+            for name, value in _row_values(restaurant).items()
+        }
+        values.update(_derived(values['lat'], values['lon']))
+        position = len(self.order) if old is None else int(self.position[old])
+        values['position'] = [position]
+        for name in _ARRAY_COLUMNS:
+            append_rows(self, self._appenders, name, values[name])
+        self.ids = self.ids.append(rid)
+        self.row_of[rid] = row
+        if old is None:
+            append_rows(self, self._appenders, 'order', [row])
+        else:
+            order = self.order.copy()
+            order[position] = row
+            self.order = order
+
+        alive = np.empty(row + 1, dtype=bool)
+        alive[:row] = self.alive
+        alive[row] = True
+        if old is not None:
+            alive[old] = False
+        self.alive = alive
+        return row
+
+    def delete_row(self, rid):
+        """Đánh dấu nhà hàng đã xóa (alive = False). Trả về row ID hoặc None nếu không có."""
+        row = self.row_of.get(str(rid))
+        if row is None:
+            return None
+        del self.row_of[str(rid)]
+        alive = self.alive.copy()
+        alive[row] = False
+        self.alive = alive
+        return row
+
+    def dead_rows(self):
+        """Số dòng không còn dùng (nhà hàng đã xóa / đã ghi sang dòng mới)."""
+        return len(self) - len(self.row_of)
+
+    def all_rows(self):
+        """Mask chọn toàn bộ nhà hàng (bỏ các nhà hàng đã xóa)."""
+        return self.alive.copy()
+
+    def alive_rows(self):
+        """Row ID các nhà hàng hiện có, theo thứ tự trong list nguồn (position)."""
+        order = self.order
+        return order[self.alive[order]]
+
+    def in_order(self, rows):
+        """
+        rows (mảng row ID không trùng) theo thứ tự trong list nguồn. Chưa ghi đè nhà hàng nào
+        thì row tăng dần đã đúng thứ tự; nhiều row thì đi qua order (O(n), không sort).
+        """
+        if len(self.order) == len(self) or len(rows) < 2:
+            return np.sort(rows)
+        if len(rows) * 16 < len(self):
+            return rows[np.argsort(self.position[rows], kind='stable')]
+        mask = np.zeros(len(self), dtype=bool)
+        mask[rows] = True
+        return self.order[mask[self.order]]
+
+    def has_coords(self):
+        """Mask nhà hàng (chưa xóa) có tọa độ hợp lệ (khác None/0)."""
+        lat, lon = self.lat, self.lon
+        return self.alive & ~np.isnan(lat) & ~np.isnan(lon) & (lat != 0) & (lon != 0)
+
+    def price_ok(self, rows, min_price=None, max_price=None):
+        """Mask (theo rows) nhà hàng có khoảng giá giao với [min_price, max_price]."""
+        ok = np.ones(len(rows), dtype=bool)
+        if min_price is not None:
+            ok &= self.max_price[rows] >= min_price
+        if max_price is not None:
+            ok &= self.min_price[rows] <= max_price
+        return ok
+
+    def rating_ok(self, rows, min_rating=None, max_rating=None):
+        """Mask (theo rows) nhà hàng có rating trong [min_rating, max_rating]."""
+        ok = np.ones(len(rows), dtype=bool)
+        if min_rating is not None:
+            ok &= self.rating[rows] >= min_rating
+        if max_rating is not None:
+            ok &= self.rating[rows] <= max_rating
+        return ok
+
+
+def build_columns(restaurants):
+    """Build RestaurantColumns từ list nhà hàng."""
+    return RestaurantColumns(restaurants)
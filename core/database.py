@@ -2,7 +2,10 @@
 # --- Tải dữ liệu 1 lần duy nhất khi backend khởi động ---
 import json
 import os
-from collections import defaultdict
+
+from core.dataset import build_dataset
+from core.registry import DataRegistry
+from core.snapshot import load_snapshot
 
 # ⭐️ ĐỊNH NGHĨA BIẾN GLOBAL (Sẽ được import) ⭐️
 RESTAURANTS = {} # Chứa dictionary {id: restaurant_data}
@@ -36,31 +39,109 @@ MENUS_PATH = os.path.join(DATA_DIR, 'menus.json')
 CATEGORIES_PATH = os.path.join(DATA_DIR, 'categories.json')
 USERS_PATH = os.path.join(DATA_DIR, 'users.json')
 
-# --- Load toàn bộ dữ liệu thô (List) ---
-DB_RESTAURANTS = load_data(RESTAURANTS_PATH)
-DB_MENUS = load_data(MENUS_PATH)
+# Snapshot nhị phân build sẵn bằng scripts/build_snapshot.py (nhà hàng + menu + index)
+SNAPSHOT_PATH = os.getenv('DATA_SNAPSHOT_PATH', os.path.join(DATA_DIR, 'snapshot.bin'))
+SNAPSHOT_SOURCES = (RESTAURANTS_PATH, MENUS_PATH)
+
+def load_dataset():
+    """Load Dataset nhà hàng + menu: ưu tiên snapshot nếu còn khớp JSON, không thì build từ JSON."""
+    dataset = load_snapshot(SNAPSHOT_PATH, SNAPSHOT_SOURCES)
+    if dataset is not None:
+        print(f" ĐÃ TẢI {os.path.basename(SNAPSHOT_PATH)} ({len(dataset.restaurants_by_id)} nhà hàng, {len(dataset.menus)} món).")
+        return dataset
+    return build_dataset(load_data(RESTAURANTS_PATH), load_data(MENUS_PATH))
+
+
+# --- Dữ liệu nhà hàng + menu theo generation, reload được khi đang chạy ---
+# Route lấy `data = DATA.current` 1 lần mỗi request (xem core/registry.py).
+DATA = DataRegistry(load_dataset, watch_paths=SNAPSHOT_SOURCES + (SNAPSHOT_PATH,))
+
+# --- Load dữ liệu thô (List) còn lại ---
 DB_CATEGORIES = load_data(CATEGORIES_PATH)
 DB_USERS = load_data(USERS_PATH)
 
-# --- TẠO INDEX ĐỂ TỐI ƯU TÌM KIẾM ---
+# --- Tạo index tra cứu user (key: "id", value: {user_data}) ---
+USERS = {str(u['id']): u for u in DB_USERS}
+
+
+def _publish(dataset):
+    """
+    Gán các biến global tên cũ theo generation hiện tại (gọi lại sau mỗi lần reload).
+    Chỉ đúng khi truy cập qua module (core.database.COLUMNS); route nên dùng DATA.current.
+    DB_MENUS / RESTAURANTS_PAYLOAD đổi cả khi upsert nên đọc qua __getattr__ bên dưới.
+    """
+    global DATASET, COLUMNS, FACETS, MENUS_BY_RESTAURANT_ID, SEARCH_INDEX, FUZZY_INDEX
+    global DB_RESTAURANTS, RESTAURANTS, SPATIAL_INDEX, KNN_INDEX
+    DATASET = dataset
+
+    # 1. Cột số (min/max price, rating, lat, lon, category_id) theo row ID = vị trí trong DB_RESTAURANTS
+    COLUMNS = dataset.columns
+    # Bitset category / tỉnh / tag theo row ID cho các filter
+    FACETS = dataset.facets
+
+    # 2. Tạo index tra cứu menu (key: "restaurant_id", value: [list of menu items])
+    MENUS_BY_RESTAURANT_ID = dataset.menus_by_restaurant_id
+
+    # 3. Inverted index cho /api/search (token -> posting list nhà hàng theo name/tag/dish)
+    SEARCH_INDEX = dataset.search_index
+    # Index trigram (dạng bỏ dấu) cho chế độ tìm gần đúng (fuzzy)
+    FUZZY_INDEX = dataset.fuzzy_index
+
+    # 4. Record store gọn (struct-of-arrays + bảng chuỗi dùng chung) thay cho list dict thô.
+    #    DB_RESTAURANTS[row] / RESTAURANTS[id] trả về view chỉ đọc dùng như dict (.get, [], .copy()).
+    DB_RESTAURANTS = dataset.restaurants
+    RESTAURANTS = dataset.restaurants_by_id
+
+    # 5. Spatial index dạng lưới cho truy vấn bán kính / bbox (nearby, map filter, search)
+    SPATIAL_INDEX = dataset.spatial_index
+
+    # 6. KD-tree cho truy vấn k nhà hàng gần nhất (/api/restaurants/nearby?k=)
+    KNN_INDEX = dataset.knn_index
+
+
+def __getattr__(name):
+    # List menu phẳng và body JSON của GET /api/restaurants (build sẵn, kèm gzip/brotli + ETag)
+    if name == 'DB_MENUS':
+        return DATA.current.menus
+    if name == 'RESTAURANTS_PAYLOAD':
+        return DATA.current.payload
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
-# 1. Tạo index tra cứu nhà hàng (key: "id", value: {restaurant_data})
 # ⭐️ GÁN VÀO BIẾN GLOBAL ĐÚNG TÊN ĐỂ KHẮC PHỤC ImportError ⭐️
-RESTAURANTS = {str(r['id']): r for r in DB_RESTAURANTS}
+DATA.on_swap(_publish)
 
-# 2. Tạo index tra cứu menu (key: "restaurant_id", value: [list of menu items])
-MENUS_BY_RESTAURANT_ID = defaultdict(list)
-for item in DB_MENUS:
-    res_id_str = str(item.get('restaurant_id'))
-    if res_id_str:
-        MENUS_BY_RESTAURANT_ID[res_id_str].append(item)
+def upsert_restaurant(restaurant, menu_items=None):
+    """
+    Thêm / ghi đè 1 nhà hàng (và menu nếu truyền menu_items), tạo generation mới từ generation hiện tại.
+    Cập nhật tăng dần inverted index, spatial index, cột số, MENUS_BY_RESTAURANT_ID
+    chỉ cho nhà hàng này. Trả về row ID.
+    """
+    return DATA.apply(lambda dataset: dataset.upsert_restaurant(restaurant, menu_items))
 
-# 3. Tạo index tra cứu user (key: "id", value: {user_data})
-USERS = {str(u['id']): u for u in DB_USERS}
+
+def delete_restaurant(restaurant_id):
+    """Xóa 1 nhà hàng (và menu), tạo generation mới từ generation hiện tại. Trả về False nếu không có."""
+    return DATA.apply(lambda dataset: dataset.delete_restaurant(restaurant_id))
+
+
+# --- Theo dõi data/*.json + snapshot, file đổi thì tự reload (DATA_WATCH=1) ---
+if os.getenv('DATA_WATCH', '0') == '1':
+    DATA.start_watching()
 
 
 # ⭐️ LOGGING VÀ XÁC NHẬN LOAD THÀNH CÔNG ⭐️
 print(f"✔️ Đã tạo index tra cứu cho {len(RESTAURANTS)} nhà hàng.")
 print(f"✔️ Đã nhóm menu cho {len(MENUS_BY_RESTAURANT_ID)} nhà hàng.")
 print(f"✔️ Đã tạo index tra cứu cho {len(USERS)} người dùng.")
+print(f"✔️ Đã tạo inverted index với {len(SEARCH_INDEX)} token.")
+print(f"✔️ Đã tạo trigram index cho {len(FUZZY_INDEX)} chuỗi (fuzzy search).")
+print(f"✔️ Đã tạo index gợi ý cho {len(DATASET.autocomplete)} tên nhà hàng / món / tag.")
+print(f"✔️ Đã tạo cột số cho {len(COLUMNS)} nhà hàng.")
+print(f"✔️ Đã tạo {len(FACETS)} bitset category / tỉnh / tag.")
+print(f"✔️ Đã nén record nhà hàng ({len(DB_RESTAURANTS.strings)} chuỗi dùng chung).")
+print(f"✔️ Đã tạo spatial index với {len(SPATIAL_INDEX)} ô lưới.")
+print(f"✔️ Đã tạo KD-tree cho {len(KNN_INDEX)} nhà hàng có tọa độ.")
+print(f"✔️ Đã serialize sẵn danh sách nhà hàng ({len(DATASET.payload)} bytes).")
+print(f"✔️ Data generation {DATA.version}" + (" (đang theo dõi file nguồn)." if DATA.status()["watching"] else "."))
 print("🎯 Tất cả dữ liệu đã được load thành công!")
\ No newline at end of file
@@ -0,0 +1,348 @@
+# core/dataset.py
+# --- Bộ dữ liệu nhà hàng + toàn bộ index dẫn xuất (build từ JSON hoặc dựng lại từ snapshot) ---
+import copy
+import hashlib
+import json
+from collections import defaultdict
+from collections.abc import Sequence
+from itertools import chain, islice
+
+import numpy as np
+
+from core.autocomplete import AutocompleteIndex, build_autocomplete
+from core.columns import RestaurantColumns, build_columns
+from core.facets import FacetIndex, build_facets
+from core.fuzzy_index import TrigramIndex, build_fuzzy_index
+from core.payload import ListPayload
+from core.records import (
+    PackedGroups, PackedJSON, PackedStrings, RestaurantStore, build_store, pack_lists, pack_strings,
+)
+from core.search_index import FIELD_DISH, FIELD_NAME, FIELD_TAG, SearchIndex, build_search_index, rating_rank
+from core.spatial_index import GridIndex, KDTree, build_knn_index, build_spatial_index
+from core.versioned import LayeredDict
+
+
+def group_menus(menus):
+    """Nhóm menu theo restaurant_id (key: "restaurant_id", value: [list of menu items])."""
+    menus_by_restaurant_id = defaultdict(list)
+    for item in menus:
+        res_id_str = str(item.get('restaurant_id'))
+        if res_id_str:
+            menus_by_restaurant_id[res_id_str].append(item)
+    return menus_by_restaurant_id
+
+
+class MenuList(Sequence):
+    """
+    List menu phẳng (DB_MENUS) sau khi có nhà hàng bị thay menu: list gốc bỏ các món của
+    restaurant_id trong `patched`, nối thêm menu mới của chúng (LayeredDict {restaurant_id: món}).
+    Thay menu chỉ ghi 1 key, không dựng lại list.
+    """
+
+    __slots__ = ('_base', '_patched', '_len')
+
+    def __init__(self, base, patched=None, length=None):
+        self._base = base
+        self._patched = patched if patched is not None else LayeredDict()
+        self._len = len(base) if length is None else length
+
+    def clone(self):
+        return MenuList(self._base, self._patched.clone(), self._len)
+
+    def patch(self, rid, old_items, menu_items):
+        """Thay menu của rid (old_items = menu hiện tại của nó)."""
+        self._patched[rid] = menu_items
+        self._len += len(menu_items) - len(old_items)
+
+    def __len__(self):
+        return self._len
+
+    def __iter__(self):
+        patched = self._patched
+        base = (item for item in self._base if str(item.get('restaurant_id')) not in patched)
+        return chain(base, chain.from_iterable(patched.values()))
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self._len)
+            return list(islice(self, start, stop, step)) if step > 0 else list(self)[index]
+        if index < 0:
+            index += self._len
+        if not 0 <= index < self._len:
+            raise IndexError(index)
+        return next(islice(self, index, None))
+
+
+def build_restaurants_payload(restaurants):
+    """Body JSON của GET /api/restaurants serialize sẵn (kèm gzip/brotli + ETag), item theo vị trí trong list."""
+    return ListPayload.build('restaurants', [r.to_dict() for r in restaurants])
+
+
+def _restaurant_texts(restaurant):
+    """Các (text, field) của 1 nhà hàng đưa vào inverted index (name + tags)."""
+    if restaurant is None:
+        return []
+    tags = restaurant.get('tags') or []
+    return [(restaurant.get('name'), FIELD_NAME)] + [(tag, FIELD_TAG) for tag in tags]
+
+
+def _dish_texts(menu_items):
+    return [(item.get('dish_name'), FIELD_DISH) for item in menu_items or []]
+
+
+def _content_digest(columns, store):
+    """sha256 (16 ký tự hex) các mảng + phần không phải mảng trong snapshot_state() của cột và record store."""
+    digest = hashlib.sha256()
+    for state in (columns.snapshot_state(), store.snapshot_state()):
+        for name in sorted(state):
+            value = state[name]
+            digest.update(name.encode('utf-8'))
+            if isinstance(value, np.ndarray):
+                digest.update(np.ascontiguousarray(value).data)
+            else:
+                digest.update(json.dumps(value, sort_keys=True, default=str).encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+
+def _chain_tag(tag, action, value):
+    """content_tag sau 1 thay đổi: hash của tag trước + thay đổi (chỉ tốn O(kích thước record))."""
+    change = json.dumps([tag, action, value], sort_keys=True, default=str)
+    return hashlib.sha256(change.encode('utf-8')).hexdigest()[:16]
+
+
+def _menus_state(menus):
+    """Menu cho snapshot: mỗi món 1 chuỗi JSON gói UTF-8, nhóm theo restaurant_id dạng CSR vị trí món."""
+    positions = defaultdict(list)
+    for position, item in enumerate(menus):
+        positions[str(item.get('restaurant_id'))].append(position)
+    keys = sorted(positions)
+    offsets, positions = pack_lists([positions[key] for key in keys])
+    items = menus.strings if isinstance(menus, PackedJSON) else PackedJSON.pack(menus).strings
+    keys = pack_strings(keys)
+    return {
+        'item_blob': items.blob,
+        'item_offsets': items.offsets,
+        'key_blob': keys.blob,
+        'key_offsets': keys.offsets,
+        'offsets': offsets,
+        'positions': positions,
+    }
+
+
+class Dataset:
+    """
+    Nhà hàng, menu và mọi index dẫn xuất từ chúng. Build 1 lần, sau đó chỉ đổi qua
+    upsert_restaurant / delete_restaurant (cập nhật tăng dần từng index cho 1 nhà hàng)
+    trên bản clone() (DataRegistry.apply), generation đang phục vụ request không bị sửa;
+    row ID của columns / restaurants / spatial_index / knn_index luôn khớp nhau.
+    Upsert ghi nhà hàng sang row ID mới (dòng cũ thành dòng chết, xem core/columns.py);
+    dead_rows() lớn thì DataRegistry build lại Dataset ở nền để dọn.
+    """
+
+    def __init__(self, menus, columns, restaurants, search_index, fuzzy_index, spatial_index, knn_index, payload,
+                 autocomplete=None, facets=None, menus_by_restaurant_id=None, content_tag=None):
+        self.menus = menus
+        if menus_by_restaurant_id is None:
+            menus_by_restaurant_id = group_menus(menus)
+        self.menus_by_restaurant_id = LayeredDict(menus_by_restaurant_id)
+        self.columns = columns
+        self.restaurants = restaurants
+        self.search_index = search_index
+        self.fuzzy_index = fuzzy_index
+        self.spatial_index = spatial_index
+        self.knn_index = knn_index
+        self.facets = facets if facets is not None else build_facets(restaurants)
+        self._payload = payload
+        self._autocomplete = autocomplete
+        self._content_tag = content_tag  # None = tính khi cần, xem content_tag
+        # Gán bởi DataRegistry khi đưa vào sử dụng
+        self.version = 0
+        self.loaded_at = None
+        self.load_seconds = None
+
+    def clone(self):
+        """
+        Bản copy-on-write để upsert / delete: mỗi index chỉ chép phần đã sửa từ lúc build
+        (tầng delta của LayeredDict, xem core/versioned.py), mảng chỉ ghi thêm dùng chung
+        buffer. Không chép gì theo kích thước catalogue. version / loaded_at do DataRegistry gán.
+        """
+        dataset = copy.copy(self)
+        dataset.columns = columns = self.columns.clone()
+        dataset.restaurants = self.restaurants.clone(columns)
+        dataset.search_index = self.search_index.clone()
+        dataset.fuzzy_index = self.fuzzy_index.clone()
+        dataset.spatial_index = self.spatial_index.clone(columns)
+        dataset.knn_index = self.knn_index.clone(columns)
+        dataset.facets = self.facets.clone()
+        dataset.menus_by_restaurant_id = self.menus_by_restaurant_id.clone()
+        if self._autocomplete is not None:
+            dataset._autocomplete = self._autocomplete.clone()
+        if isinstance(self.menus, MenuList):
+            dataset.menus = self.menus.clone()
+        return dataset
+
+    def dead_rows(self):
+        """Số row ID không còn dùng (nhà hàng đã xóa / đã ghi sang dòng mới)."""
+        return self.columns.dead_rows()
+
+    def compacted(self):
+        """Dataset build lại từ nội dung hiện tại: không còn dòng chết / tầng delta (chạy ở nền)."""
+        dataset = build_dataset([r.to_dict() for r in self.restaurants], list(self.menus))
+        dataset._content_tag = self.content_tag
+        return dataset
+
+    @property
+    def restaurants_by_id(self):
+        """Mapping {restaurant_id: Restaurant}."""
+        return self.restaurants.by_id
+
+    @property
+    def payload(self):
+        """Payload GET /api/restaurants (ListPayload, upsert/delete chỉ thay item của nhà hàng đó)."""
+        return self._payload
+
+    def _splice_payload(self, row, restaurant):
+        """Thay item tại vị trí của row trong payload (restaurant None = bỏ), ETag theo content_tag mới."""
+        position = int(self.columns.position[row])
+        self._payload = self._payload.spliced(
+            position, restaurant, len(self.restaurants_by_id), etag=self._content_tag)
+
+    @property
+    def content_tag(self):
+        """
+        Version nội dung dữ liệu (giống nhau giữa các worker cùng dữ liệu): hash các mảng cột /
+        bảng chuỗi của nhà hàng khi load, mỗi upsert / delete nối thêm hash của thay đổi
+        (_chain_tag). Không cần serialize / nén lại payload.
+        """
+        tag = self._content_tag
+        if tag is None:
+            tag = self._content_tag = _content_digest(self.columns, self.restaurants)
+        return tag
+
+    @property
+    def autocomplete(self):
+        """Index gợi ý /api/autocomplete (upsert/delete sửa tăng dần, xem AutocompleteIndex.update)."""
+        index = self._autocomplete
+        if index is None:
+            index = self._autocomplete = build_autocomplete(self.restaurants, self.menus_by_restaurant_id)
+        return index
+
+    def upsert_restaurant(self, restaurant, menu_items=None):
+        """
+        Thêm / ghi đè 1 nhà hàng (dict đủ trường, có 'id'). menu_items khác None thì thay
+        luôn menu của nhà hàng. Chỉ cập nhật phần index liên quan tới nhà hàng này.
+        Trả về row ID (dòng mới).
+        """
+        rid = str(restaurant['id'])
+        tag = self.content_tag  # Lấy trước khi sửa (lần đầu là hash dữ liệu lúc load)
+        old = self.restaurants_by_id.get(rid)
+        old_row = None if old is None else old.row
+        menu = self.menus_by_restaurant_id.get(rid, [])
+        new_menu = menu if menu_items is None else list(menu_items)
+
+        row = self.columns.upsert_row(restaurant)
+        self.restaurants.upsert(row, restaurant)
+        self.facets.add(row, restaurant)
+        old_texts, new_texts = _restaurant_texts(old), _restaurant_texts(restaurant)
+        self.search_index.update(rid, old_texts + _dish_texts(menu), new_texts + _dish_texts(new_menu),
+                                 rank=rating_rank(restaurant.get('rating')), row=row)
+        self.fuzzy_index.update(rid, FIELD_NAME | FIELD_TAG, old_texts, new_texts)
+        self.spatial_index.move(old_row, row)
+        self.knn_index.update_row(old_row, row)
+        if menu_items is not None:
+            self._set_menu(rid, menu, new_menu)
+        self._content_tag = _chain_tag(tag, 'upsert', restaurant)
+        self._splice_payload(row, self.restaurants[row].to_dict())
+        self.autocomplete.update(rid, old, self.restaurants[row], menu, new_menu)
+        return row
+
+    def delete_restaurant(self, rid):
+        """Xóa 1 nhà hàng (và menu của nó) khỏi mọi index. Trả về False nếu không có."""
+        rid = str(rid)
+        tag = self.content_tag
+        old = self.restaurants_by_id.get(rid)
+        if old is None:
+            return False
+        row = old.row
+        menu = self.menus_by_restaurant_id.get(rid, [])
+
+        self.search_index.update(rid, _restaurant_texts(old) + _dish_texts(menu))
+        self.fuzzy_index.update(rid, FIELD_NAME | FIELD_TAG, _restaurant_texts(old))
+        self.columns.delete_row(rid)
+        self.spatial_index.move(row, None)
+        self.knn_index.update_row(row, None)
+        self._set_menu(rid, menu, [])
+        self._content_tag = _chain_tag(tag, 'delete', rid)
+        self._splice_payload(row, None)
+        self.autocomplete.update(rid, old, None, menu, ())
+        return True
+
+    def _set_menu(self, rid, old_items, menu_items):
+        """Thay menu của rid trong fuzzy index, menus_by_restaurant_id và list phẳng menus."""
+        if not old_items and not menu_items:
+            return
+        self.fuzzy_index.update(rid, FIELD_DISH, _dish_texts(old_items), _dish_texts(menu_items))
+        if menu_items:
+            self.menus_by_restaurant_id[rid] = menu_items
+        elif rid in self.menus_by_restaurant_id:
+            del self.menus_by_restaurant_id[rid]
+        if not isinstance(self.menus, MenuList):
+            self.menus = MenuList(self.menus)
+        self.menus.patch(rid, old_items, menu_items)
+
+    def snapshot_components(self):
+        """Các thành phần ghi vào snapshot nhị phân (xem core/snapshot.py)."""
+        return {
+            'menus': _menus_state(self.menus),
+            'columns': self.columns.snapshot_state(),
+            'facets': self.facets.snapshot_state(),
+            'restaurants': self.restaurants.snapshot_state(),
+            'search_index': self.search_index.snapshot_state(),
+            'fuzzy_index': self.fuzzy_index.snapshot_state(),
+            'spatial_index': self.spatial_index.snapshot_state(),
+            'knn_index': self.knn_index.snapshot_state(),
+            'payload': self.payload.snapshot_state(),
+            'autocomplete': self.autocomplete.snapshot_state(),
+            'meta': {'content_tag': self.content_tag},
+        }
+
+    @classmethod
+    def from_snapshot_components(cls, components):
+        """Dựng lại Dataset từ snapshot mà không parse JSON hay build lại index."""
+        columns = RestaurantColumns.from_snapshot(components['columns'])
+        menus = components['menus']
+        items = PackedJSON(PackedStrings(menus['item_blob'], menus['item_offsets']))
+        return cls(
+            menus=items,
+            menus_by_restaurant_id=PackedGroups(
+                items, PackedStrings(menus['key_blob'], menus['key_offsets']), menus['offsets'], menus['positions']),
+            columns=columns,
+            restaurants=RestaurantStore.from_snapshot(components['restaurants'], columns),
+            search_index=SearchIndex.from_snapshot(components['search_index']),
+            fuzzy_index=TrigramIndex.from_snapshot(components['fuzzy_index']),
+            spatial_index=GridIndex.from_snapshot(components['spatial_index'], columns),
+            knn_index=KDTree.from_snapshot(components['knn_index'], columns),
+            payload=ListPayload.from_snapshot(components['payload']),
+            autocomplete=AutocompleteIndex.from_snapshot(components['autocomplete']),
+            facets=FacetIndex.from_snapshot(components['facets']),
+            content_tag=components['meta']['content_tag'],
+        )
+
+
+def build_dataset(restaurants, menus):
+    """Build Dataset từ list nhà hàng và list menu thô (đọc từ data/*.json)."""
+    columns = build_columns(restaurants)
+    store = build_store(restaurants, columns)
+    menus_by_restaurant_id = group_menus(menus)
+    return Dataset(
+        menus=menus,
+        columns=columns,
+        restaurants=store,
+        search_index=build_search_index(restaurants, menus_by_restaurant_id),
+        fuzzy_index=build_fuzzy_index(restaurants, menus_by_restaurant_id),
+        spatial_index=build_spatial_index(columns),
+        knn_index=build_knn_index(columns),
+        payload=build_restaurants_payload(store),
+        autocomplete=build_autocomplete(store, menus_by_restaurant_id),
+        facets=build_facets(store),
+    )
@@ -0,0 +1,206 @@
+# core/facets.py
+# --- Bitset (mask NumPy theo row ID) tính sẵn cho filter category / tỉnh / tag ---
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from core.search import fold_text, normalize_text
+from core.versioned import LayeredDict, append_to
+
+# Tỉnh / thành có mask tính sẵn: các tag tỉnh trong check_province_stats.py + tên hay gõ
+# (địa chỉ Google ghi "Thành phố Hồ Chí Minh" nên "TP. Hồ Chí Minh" ít khi khớp)
+PROVINCES = [
+    "TP. Hồ Chí Minh", "Hà Nội", "Đà Nẵng", "Lâm Đồng", "Khánh Hòa",
+    "Bà Rịa - Vũng Tàu", "Quảng Nam", "Thừa Thiên Huế", "Cần Thơ",
+    "Kiên Giang", "Bình Định", "Quảng Ninh", "Bình Thuận", "Đắk Lắk",
+    "Lào Cai", "Hải Phòng", "Ninh Bình", "Bình Dương", "Long An", "Tây Ninh",
+    "Hồ Chí Minh", "Huế", "Vũng Tàu", "Đà Lạt", "Nha Trang",
+]
+
+_CUSTOM_CACHE_SIZE = 128  # Số mask tỉnh ngoài danh sách (vd. "quận 1") giữ lại
+
+
+def _province_key(province):
+    """
+    (folded, tỉnh đã normalize): tỉnh gõ không dấu ("ha noi") thì so với địa chỉ đã bỏ dấu,
+    gõ có dấu thì so với địa chỉ chỉ lowercase (giống filter cũ trong search_algorithm).
+    """
+    normalized = normalize_text(province)
+    return normalized == fold_text(province), normalized
+
+
+def _address_has(address, key):
+    folded, normalized = key
+    return normalized in (fold_text if folded else normalize_text)(address)
+
+
+def _category_key(category_id):
+    # Giống RestaurantColumns.category_id: không phải số nguyên thì -1
+    return category_id if isinstance(category_id, int) else -1
+
+
+def _tag_keys(restaurant):
+    return {tag for tag in restaurant.get('tags') or [] if isinstance(tag, str)}
+
+
+def _fit(mask, n):
+    """Mask đúng n dòng (dòng mới thêm sau khi build chưa có trong mask = False)."""
+    if len(mask) >= n:
+        return mask[:n]
+    fitted = np.zeros(n, dtype=bool)
+    fitted[:len(mask)] = mask
+    return fitted
+
+
+class FacetIndex:
+    """
+    Mỗi category_id, mỗi tag và mỗi tỉnh trong PROVINCES (cả dạng có dấu / bỏ dấu) có sẵn
+    1 mask bool theo row ID. Filter chỉ còn OR / AND các mask, không duyệt list tag hay
+    tìm chuỗi trong địa chỉ của từng nhà hàng.
+
+    Upsert ghi nhà hàng sang dòng mới (core/columns.py) nên mask chỉ ghi thêm (AppendArray,
+    generation cũ giữ view ngắn hơn); bit của dòng đã chết không bị gỡ, caller luôn AND với
+    columns.alive (FilterPlan bắt đầu từ columns.all_rows()).
+    """
+
+    def __init__(self, n, categories, tags, provinces, appenders=None):
+        self._n = n
+        self._categories = categories  # category_id -> mask (LayeredDict)
+        self._tags = tags  # tag -> mask (LayeredDict)
+        self._provinces = provinces  # _province_key -> mask (LayeredDict)
+        self._appenders = appenders if appenders is not None else LayeredDict()  # (loại, key) -> AppendArray
+        self._custom = OrderedDict()  # Tỉnh ngoài danh sách: _province_key -> mask (LRU)
+        self._custom_lock = threading.Lock()  # Nhiều request cùng đọc / ghi LRU
+
+    def __len__(self):
+        return len(self._categories) + len(self._tags) + len(self._provinces)
+
+    def clone(self):
+        """Bản copy-on-write: chỉ chép tầng delta (mask của key đã sửa) của các LayeredDict."""
+        return FacetIndex(self._n, self._categories.clone(), self._tags.clone(), self._provinces.clone(),
+                          self._appenders.clone())
+
+    @classmethod
+    def build(cls, restaurants):
+        n = len(restaurants)
+        province_keys = {_province_key(form) for p in PROVINCES for form in (p, fold_text(p))}
+        rows = {'categories': {}, 'tags': {}, 'provinces': {key: [] for key in province_keys}}
+        for row in range(n):
+            r = restaurants[row]
+            rows['categories'].setdefault(_category_key(r.get('category_id')), []).append(row)
+            for tag in _tag_keys(r):
+                rows['tags'].setdefault(tag, []).append(row)
+            address = r.get('address', '')
+            for key in province_keys:
+                if _address_has(address, key):
+                    rows['provinces'][key].append(row)
+
+        masks = {}
+        for kind, by_key in rows.items():
+            masks[kind] = {}
+            for key, key_rows in by_key.items():
+                mask = np.zeros(n, dtype=bool)
+                mask[key_rows] = True
+                masks[kind][key] = mask
+        return cls(n, *(LayeredDict(masks[kind]) for kind in ('categories', 'tags', 'provinces')))
+
+    def snapshot_state(self):
+        """Trạng thái để ghi snapshot nhị phân (core/snapshot.py): mask nén 8 dòng / byte."""
+        state = {'n': self._n}
+        for kind in ('categories', 'tags', 'provinces'):
+            masks = getattr(self, f'_{kind}')
+            keys = list(masks)
+            state[f'{kind}_keys'] = [list(key) if isinstance(key, tuple) else key for key in keys]
+            bits = np.array([_fit(masks[key], self._n) for key in keys], dtype=bool).reshape(len(keys), self._n)
+            state[f'{kind}_bits'] = np.packbits(bits, axis=1)
+        return state
+
+    @classmethod
+    def from_snapshot(cls, state):
+        n = state['n']
+        masks = {}
+        for kind in ('categories', 'tags', 'provinces'):
+            bits = np.unpackbits(state[f'{kind}_bits'], axis=1, count=n).astype(bool)
+            keys = [tuple(key) if isinstance(key, list) else key for key in state[f'{kind}_keys']]
+            masks[kind] = LayeredDict(dict(zip(keys, bits)))
+        return cls(n, masks['categories'], masks['tags'], masks['provinces'])
+
+    def keys(self, restaurant):
+        """(category, tag, tỉnh) của 1 nhà hàng, dùng cho add()."""
+        address = restaurant.get('address', '')
+        return (
+            {_category_key(restaurant.get('category_id'))},
+            _tag_keys(restaurant),
+            {key for key in self._provinces if _address_has(address, key)},
+        )
+
+    def add(self, row, restaurant):
+        """
+        Bật bit của dòng mới `row` (dòng cuối, xem RestaurantColumns.upsert_row) trong mask
+        các key của nhà hàng: chỉ ghi thêm vào cuối mask, không chép mask.
+        """
+        self._n = max(self._n, row + 1)
+        self._custom = OrderedDict()
+        kinds = ('categories', 'tags', 'provinces')
+        for kind, keys in zip(kinds, self.keys(restaurant)):
+            masks = getattr(self, f'_{kind}')
+            for key in keys:
+                mask = masks.get(key, np.zeros(0, dtype=bool))
+                values = np.zeros(row + 1 - len(mask), dtype=bool)
+                values[-1] = True
+                masks[key] = append_to(self._appenders, (kind, key), mask, values)
+
+    def category_mask(self, categories, n):
+        """Mask nhà hàng có category_id thuộc list categories."""
+        mask = np.zeros(n, dtype=bool)
+        for category_id in categories:
+            if isinstance(category_id, (int, float)) and category_id in self._categories:
+                mask |= _fit(self._categories[category_id], n)
+        return mask
+
+    def tag_mask(self, tags, n):
+        """Mask nhà hàng có ít nhất 1 tag trong list tags."""
+        mask = np.zeros(n, dtype=bool)
+        for tag in tags:
+            if isinstance(tag, str) and tag in self._tags:
+                mask |= _fit(self._tags[tag], n)
+        return mask
+
+    def tag_text_mask(self, text, n):
+        """Mask nhà hàng có ít nhất 1 tag mà dạng bỏ dấu chứa chuỗi `text` (đã bỏ dấu)."""
+        mask = np.zeros(n, dtype=bool)
+        for tag, tag_mask in self._tags.items():
+            if text in fold_text(tag):
+                mask |= _fit(tag_mask, n)
+        return mask
+
+    def province_mask(self, province, restaurants):
+        """
+        Mask nhà hàng có địa chỉ chứa tên tỉnh. Tỉnh trong PROVINCES dùng mask tính sẵn;
+        chuỗi khác (vd. "quận 1") mới duyệt địa chỉ 1 lần rồi giữ trong LRU nhỏ.
+        """
+        n = len(restaurants)
+        key = _province_key(province)
+        mask = self._provinces.get(key)
+        if mask is None:
+            with self._custom_lock:
+                mask = self._custom.get(key)
+                if mask is not None:
+                    self._custom.move_to_end(key)
+            if mask is None:
+                # Duyệt địa chỉ ngoài lock; 2 request cùng tính thì kết quả như nhau
+                mask = np.zeros(n, dtype=bool)
+                for row in range(n):
+                    if _address_has(restaurants[row].get('address', ''), key):
+                        mask[row] = True
+                with self._custom_lock:
+                    self._custom[key] = mask
+                    if len(self._custom) > _CUSTOM_CACHE_SIZE:
+                        self._custom.popitem(last=False)
+        return _fit(mask, n)
+
+
+def build_facets(restaurants):
+    """Build FacetIndex từ list nhà hàng (row ID = vị trí trong list)."""
+    return FacetIndex.build(restaurants)
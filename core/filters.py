@@ -0,0 +1,158 @@
+# core/filters.py
+# --- Filter plan dùng chung cho /api/search, /api/map/filter, /api/restaurants/nearby ---
+import numpy as np
+
+from core.cache import FILTER_CACHE, canonical_list
+from core.geo import distances_from, haversine_km
+from core.search import normalize_text
+
+
+class FilterPlan:
+    """
+    Request filter đã compile thành các bước chạy theo thứ tự:
+      1. Bitset tính sẵn (category / tỉnh / tag, FacetIndex): AND mask chọn lọc nhất trước,
+         mask rỗng thì dừng luôn
+      2. Cột số (giá / rating): chỉ so trên các row còn lại sau bước 1
+      3. Không gian: khung nhìn bbox / bán kính qua grid index, k gần nhất qua KD-tree,
+         hoặc chỉ tính khoảng cách
+    Bước 1-2 (mask theo row ID) được cache theo version dữ liệu trong FILTER_CACHE.
+    Chấm điểm / xếp hạng do endpoint làm trên các row trả về.
+
+        categories: list category_id (None = không lọc, [] = không nhà hàng nào)
+        province: tên tỉnh / chuỗi cần có trong địa chỉ (có dấu hoặc không dấu)
+        tags: list tag, giữ nhà hàng có ít nhất 1 tag
+        require_coords: chỉ giữ nhà hàng có tọa độ
+        lat, lon: vị trí người dùng (None = không tính khoảng cách)
+        radius_km: bán kính (None = không giới hạn); keep_unlocated = giữ cả nhà hàng
+            không có tọa độ khi lọc bán kính
+        k: chỉ lấy k nhà hàng gần nhất (KD-tree)
+        bbox: (south, west, north, east) chỉ lấy nhà hàng trong khung nhìn bản đồ (grid index),
+            thay cho radius_km / k; có lat, lon thì vẫn tính khoảng cách
+    """
+
+    def __init__(self, categories=None, province=None, tags=None, min_price=None, max_price=None,
+                 min_rating=None, max_rating=None, require_coords=False,
+                 lat=None, lon=None, radius_km=None, keep_unlocated=False, k=None, bbox=None):
+        self.categories = categories
+        self.province = province if normalize_text(province) else None
+        self.tags = tags or None
+        self.min_price, self.max_price = min_price, max_price
+        self.min_rating, self.max_rating = min_rating, max_rating
+        self.require_coords = require_coords
+        self.lat, self.lon = lat, lon
+        self.radius_km = radius_km
+        self.keep_unlocated = keep_unlocated
+        self.k = k
+        self.bbox = bbox
+
+    def mask_key(self):
+        """Tham số của phần mask (bước 1-2), dùng làm key cache."""
+        return {
+            "categories": canonical_list(self.categories),
+            "province": self.province,
+            "tags": canonical_list(self.tags),
+            "min_price": self.min_price,
+            "max_price": self.max_price,
+            "min_rating": self.min_rating,
+            "max_rating": self.max_rating,
+            "require_coords": self.require_coords,
+        }
+
+    def _bitsets(self, columns, facets, restaurants):
+        n = len(columns)
+        if self.categories is not None:
+            yield facets.category_mask(self.categories, n)
+        if self.tags:
+            yield facets.tag_mask(self.tags, n)
+        if self.province is not None:
+            yield facets.province_mask(self.province, restaurants)
+        if self.require_coords:
+            yield columns.has_coords()
+
+    def _column_predicates(self, columns):
+        if self.min_price is not None or self.max_price is not None:
+            yield lambda rows: columns.price_ok(rows, self.min_price, self.max_price)
+        if self.min_rating is not None or self.max_rating is not None:
+            yield lambda rows: columns.rating_ok(rows, self.min_rating, self.max_rating)
+
+    def _compute_mask(self, columns, facets, restaurants):
+        mask = columns.all_rows()
+        for bitset in sorted(self._bitsets(columns, facets, restaurants), key=np.count_nonzero):
+            mask &= bitset
+            if not mask.any():
+                return mask
+        for predicate in self._column_predicates(columns):
+            rows = mask.nonzero()[0]
+            if not len(rows):
+                break
+            mask[rows[~predicate(rows)]] = False
+        return mask
+
+    def mask(self, columns, facets, restaurants, version=None):
+        """Mask row ID qua bước 1-2 (bản sao, caller sửa thoải mái). version khác None thì dùng cache."""
+        if version is None:
+            return self._compute_mask(columns, facets, restaurants)
+
+        def compute():
+            mask = self._compute_mask(columns, facets, restaurants)
+            mask.setflags(write=False)
+            return mask
+
+        return FILTER_CACHE.get_or_compute({"version": version, **self.mask_key()}, compute).copy()
+
+    def execute(self, columns, facets, restaurants, spatial_index=None, knn_index=None, version=None):
+        """
+        Chạy plan, trả về (rows, distances): rows là mảng row ID (theo thứ tự trong list nguồn,
+        columns.in_order; chế độ k thì theo khoảng cách tăng dần), distances là {row: km} của
+        các row có tọa độ khi có vị trí.
+        """
+        mask = self.mask(columns, facets, restaurants, version)
+        if self.bbox is not None:
+            rows = columns.in_order(spatial_index.query_bbox(*self.bbox, mask=mask))
+            if self.lat is None or self.lon is None:
+                return rows, {}
+            return rows, dict(zip(rows.tolist(), haversine_km(columns, self.lat, self.lon, rows).tolist()))
+
+        if self.lat is None or self.lon is None:
+            return columns.in_order(mask.nonzero()[0]), {}
+
+        if self.k is not None:
+            rows, dists = knn_index.query_knn(
+                self.lat, self.lon, self.k, max_km=self.radius_km, predicate=lambda candidates: mask[candidates]
+            )
+            return rows, dict(zip(rows.tolist(), dists.tolist()))
+
+        if self.radius_km is None:
+            rows, dists = distances_from(columns, self.lat, self.lon, mask)
+            return columns.in_order(mask.nonzero()[0]), dict(zip(rows.tolist(), dists.tolist()))
+
+        located = mask & columns.has_coords() if self.keep_unlocated else mask
+        rows, dists = spatial_index.query_radius(self.lat, self.lon, self.radius_km, located)
+        distances = dict(zip(rows.tolist(), dists.tolist()))
+        if self.keep_unlocated:
+            # Nhà hàng không có tọa độ không lọc được theo bán kính -> giữ lại
+            mask &= ~located
+            mask[rows] = True
+            rows = mask.nonzero()[0]
+        return columns.in_order(rows), distances
+
+    def run(self, dataset):
+        """execute() trên 1 generation dữ liệu (Dataset), có cache mask theo dataset.version."""
+        return self.execute(dataset.columns, dataset.facets, dataset.restaurants,
+                            dataset.spatial_index, dataset.knn_index, dataset.version)
+
+
+def top_ranked(columns, rows, limit=None):
+    """
+    rows sắp theo thứ hạng tĩnh (rating giảm dần, cùng rating thì theo vị trí trong list nguồn),
+    chỉ giữ `limit` row đầu (None = tất cả).
+    """
+    rows = np.asarray(rows, dtype=np.int64)
+    if limit is not None and len(rows) > limit:
+        if limit <= 0:
+            return rows[:0]
+        # Chỉ sort các row có rating >= rating thứ `limit` (kể cả các row bằng điểm)
+        ratings = columns.rating[rows]
+        rows = rows[ratings >= -np.partition(-ratings, limit - 1)[limit - 1]]
+    order = np.lexsort((columns.position[rows], -columns.rating[rows]))
+    return rows[order[:limit]]
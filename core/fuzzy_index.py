@@ -0,0 +1,415 @@
+# core/fuzzy_index.py
+# --- Index trigram cho tìm kiếm gần đúng (gõ sai chính tả, thiếu/thừa khoảng trắng) ---
+import copy
+import os
+import re
+from collections import defaultdict
+from collections.abc import Mapping
+
+import numpy as np
+
+from core.records import PackedIndex, PackedStrings, bisect_strings, pack_lists, pack_strings
+from core.search import fold_text
+from core.search_index import FIELD_DISH, FIELD_NAME, FIELD_TAG, field_score
+from core.versioned import AppendList, LayeredDict
+
+FUZZY_THRESHOLD = float(os.getenv('FUZZY_THRESHOLD', 0.4))  # Độ giống tối thiểu mặc định (0..1]
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def fuzzy_key(text):
+    """Dạng chuỗi lưu trong index: bỏ dấu, chỉ giữ chữ/số ("Phở Bò!" -> "pho bo")."""
+    return ' '.join(_WORD_RE.findall(fold_text(text)))
+
+
+def trigrams(text):
+    """
+    Tập trigram của chuỗi sau khi bỏ khoảng trắng, đệm 2 space đầu + 1 space cuối
+    ("hai di lao" và "haidilao" cho cùng 1 tập).
+    """
+    padded = '  ' + text.replace(' ', '') + ' '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _indexed_trigrams(words):
+    """
+    Hợp trigram của mọi cụm từ liên tiếp trong chuỗi (trigram bên trong + phần đệm ở
+    đầu/cuối mỗi từ), nên số trigram chung với query là cận trên cho mọi cụm.
+    """
+    joined = ''.join(words)
+    grams = trigrams(joined)
+    pos = 0
+    for word in words:
+        rest = joined[pos:]
+        grams.add('  ' + rest[0])
+        grams.add((' ' + rest + ' ')[:3])
+        if len(word) == 1:
+            grams.add(' ' + word + ' ')
+        pos += len(word)
+        grams.add((' ' + joined[:pos] + ' ')[-3:])
+    return grams
+
+
+def similarity(query, text):
+    """
+    Độ giống (Jaccard trigram) giữa query và cụm từ liên tiếp giống nhất trong text,
+    để tên dài như "Haidilao Hot Pot" vẫn khớp tốt với "hai di lao".
+    """
+    query_grams = trigrams(query)
+    words = text.split()
+    best = 0.0
+    for i in range(len(words)):
+        for j in range(i + 1, len(words) + 1):
+            window = trigrams(''.join(words[i:j]))
+            common = len(query_grams & window)
+            best = max(best, common / (len(query_grams) + len(window) - common))
+            # Cụm dài hơn có >= len(window) - 1 trigram nên độ giống <= |query| / (len(window) - 1)
+            if best and (len(window) - 1) * best >= len(query_grams):
+                break
+    return best
+
+
+class _PackedTexts(Mapping):
+    """text_id -> chuỗi trên PackedStrings từ snapshot ('' = đã gỡ, không có trong mapping)."""
+
+    __slots__ = ('_texts', '_n')
+
+    def __init__(self, texts, n):
+        self._texts = texts
+        self._n = n
+
+    def __getitem__(self, tid):
+        if isinstance(tid, int) and 0 <= tid < len(self._texts):
+            text = self._texts[tid]
+            if text:
+                return text
+        raise KeyError(tid)
+
+    def __iter__(self):
+        return (tid for tid, text in enumerate(self._texts) if text)
+
+    def __len__(self):
+        return self._n
+
+
+class _PackedOwnerMap(Mapping):
+    """
+    {restaurant_id: bitmask} của 1 text_id trên CSR từ snapshot: đoạn [start, end) của
+    rids / masks, `order` là các vị trí của đoạn sắp theo restaurant_id (tìm nhị phân).
+    Chuỗi phổ biến (tag) có rất nhiều chủ sở hữu nên không dựng dict khi đọc.
+    """
+
+    __slots__ = ('_rids', '_masks', '_order', '_start', '_end')
+
+    def __init__(self, rids, masks, order, start, end):
+        self._rids = rids
+        self._masks = masks
+        self._order = order
+        self._start = start
+        self._end = end
+
+    def __getitem__(self, rid):
+        if not isinstance(rid, str):
+            raise KeyError(rid)
+        rids, order = self._rids, self._order
+        lo, hi = self._start, self._end
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if rids[order[mid]] < rid:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self._end:
+            p = int(order[lo])
+            if rids[p] == rid:
+                return int(self._masks[p])
+        raise KeyError(rid)
+
+    def __iter__(self):
+        return iter(self._rids.take(np.arange(self._start, self._end)))
+
+    def __len__(self):
+        return self._end - self._start
+
+    def items(self):
+        start, end = self._start, self._end
+        return zip(self._rids.take(np.arange(start, end)), self._masks[start:end].tolist())
+
+    def values(self):
+        return self._masks[self._start:self._end].tolist()
+
+
+class _PackedOwners(Mapping):
+    """text_id -> {restaurant_id: bitmask} (_PackedOwnerMap) trên CSR từ snapshot."""
+
+    __slots__ = ('_offsets', '_rids', '_masks', '_order')
+
+    def __init__(self, offsets, rids, masks, order):
+        self._offsets = offsets
+        self._rids = rids
+        self._masks = masks
+        self._order = order
+
+    def __getitem__(self, tid):
+        if not (isinstance(tid, int) and 0 <= tid < len(self._offsets) - 1):
+            raise KeyError(tid)
+        start, end = int(self._offsets[tid]), int(self._offsets[tid + 1])
+        if start == end:
+            raise KeyError(tid)
+        return _PackedOwnerMap(self._rids, self._masks, self._order, start, end)
+
+    def __iter__(self):
+        sizes = np.diff(self._offsets)
+        return iter(sizes.nonzero()[0].tolist())
+
+    def __len__(self):
+        return int(np.count_nonzero(np.diff(self._offsets)))
+
+
+class _PackedPostings(Mapping):
+    """trigram -> [text_id] trên CSR theo trigram đã sort từ snapshot."""
+
+    __slots__ = ('_grams', '_offsets', '_tids')
+
+    def __init__(self, grams, offsets, tids):
+        self._grams = grams
+        self._offsets = offsets
+        self._tids = tids
+
+    def __getitem__(self, gram):
+        grams = self._grams
+        i = bisect_strings(grams, gram) if isinstance(gram, str) else len(grams)
+        if i == len(grams) or grams[i] != gram:
+            raise KeyError(gram)
+        return self._tids[self._offsets[i]:self._offsets[i + 1]].tolist()
+
+    def __iter__(self):
+        return iter(self._grams)
+
+    def __len__(self):
+        return len(self._grams)
+
+
+class TrigramIndex:
+    """
+    Index trigram trên tên, tag và tên món (dạng bỏ dấu). Mỗi chuỗi khác nhau lưu 1 lần
+    cùng danh sách nhà hàng sở hữu nó: text_id -> {restaurant_id: bitmask trường}.
+    Ứng viên lấy từ posting list của trigram trong query, không so query với mọi chuỗi.
+
+    Mọi bảng là LayeredDict trên dict lúc build hoặc view trên mảng snapshot (mmap), nên
+    clone() chỉ chép phần đã sửa. Posting chỉ ghi thêm (AppendList): text_id đã gỡ vẫn nằm
+    trong posting và bị bỏ qua khi tra (chuỗi không còn trong _texts).
+    """
+
+    def __init__(self):
+        self._texts = LayeredDict()  # text_id -> chuỗi
+        self._text_ids = LayeredDict()  # chuỗi -> text_id
+        self._owners = LayeredDict()  # text_id -> {restaurant_id: bitmask}
+        self._postings = LayeredDict()  # trigram -> [text_id]
+        self._next_tid = 0
+
+    def __len__(self):
+        return len(self._texts)
+
+    def clone(self):
+        """Bản copy-on-write: chỉ chép tầng delta của các bảng (update() không sửa giá trị tại chỗ)."""
+        index = copy.copy(self)
+        for name in ('_texts', '_text_ids', '_owners', '_postings'):
+            setattr(index, name, getattr(self, name).clone())
+        return index
+
+    def snapshot_state(self):
+        """
+        Trạng thái để ghi snapshot nhị phân (core/snapshot.py), toàn bộ là mảng: chuỗi gói UTF-8
+        ('' = đã gỡ), chủ sở hữu dạng CSR theo text_id, posting dạng CSR theo trigram đã sort,
+        text_id sắp theo chuỗi (tra chuỗi -> text_id bằng tìm nhị phân).
+        """
+        n = self._next_tid
+        texts = pack_strings([self._texts.get(tid, '') for tid in range(n)])
+        owners = [self._owners.get(tid, {}) for tid in range(n)]
+        owner_offsets, owner_masks = pack_lists([list(o.values()) for o in owners], np.int8)
+        owner_rids = pack_strings([rid for o in owners for rid in o])
+        # Trong đoạn của từng text_id: vị trí sắp theo restaurant_id (xem _PackedOwnerMap)
+        owner_order = np.array([
+            start + i
+            for o, start in zip(owners, owner_offsets[:-1].tolist())
+            for i in sorted(range(len(o)), key=list(o).__getitem__)
+        ], dtype=np.int64)
+        grams = sorted(self._postings)
+        posting_offsets, posting_tids = pack_lists([
+            [tid for tid in self._postings[gram] if tid in self._texts] for gram in grams
+        ])
+        keep = np.diff(posting_offsets) > 0
+        grams = pack_strings([gram for gram, kept in zip(grams, keep.tolist()) if kept])
+        posting_offsets = np.concatenate(([0], posting_offsets[1:][keep]))
+        return {
+            'n_texts': len(self._texts),
+            'n_tids': n,
+            'text_blob': texts.blob,
+            'text_offsets': texts.offsets,
+            'text_order': PackedIndex.sorted_positions(texts, list(self._texts)),
+            'owner_offsets': owner_offsets,
+            'owner_rid_blob': owner_rids.blob,
+            'owner_rid_offsets': owner_rids.offsets,
+            'owner_masks': owner_masks,
+            'owner_order': owner_order,
+            'gram_blob': grams.blob,
+            'gram_offsets': grams.offsets,
+            'posting_offsets': posting_offsets,
+            'posting_tids': posting_tids,
+        }
+
+    @classmethod
+    def from_snapshot(cls, state):
+        index = cls()
+        texts = PackedStrings(state['text_blob'], state['text_offsets'])
+        index._texts = LayeredDict(_PackedTexts(texts, state['n_texts']))
+        index._text_ids = LayeredDict(PackedIndex(texts, state['text_order']))
+        index._owners = LayeredDict(_PackedOwners(
+            state['owner_offsets'], PackedStrings(state['owner_rid_blob'], state['owner_rid_offsets']),
+            state['owner_masks'], state['owner_order'],
+        ))
+        index._postings = LayeredDict(_PackedPostings(
+            PackedStrings(state['gram_blob'], state['gram_offsets']), state['posting_offsets'], state['posting_tids'],
+        ))
+        index._next_tid = state['n_tids']
+        return index
+
+    def seal(self):
+        """Gọi sau khi build xong: dữ liệu build thành tầng root dùng chung của các bảng."""
+        for name in ('_texts', '_text_ids', '_owners', '_postings'):
+            setattr(self, name, getattr(self, name).sealed())
+
+    def _entry(self, tid):
+        """(chuỗi, {restaurant_id: bitmask}) của text_id, chuỗi None = đã gỡ."""
+        text = self._texts.get(tid)
+        return text, (self._owners.get(tid, {}) if text is not None else {})
+
+    def _posting(self, gram):
+        """[text_id] chứa trigram (có thể gồm text_id đã gỡ)."""
+        return self._postings.get(gram, ())
+
+    def _new_text(self, text, build=False):
+        """
+        text_id mới cho chuỗi. build=True (lúc build) thì nối thẳng vào list posting;
+        khi update thì posting thành AppendList mới (bản cũ giữ nguyên).
+        """
+        tid = self._next_tid
+        self._next_tid += 1
+        self._texts[tid] = text
+        self._text_ids[text] = tid
+        postings = self._postings
+        for gram in _indexed_trigrams(text.split()):
+            posting = postings.get(gram)
+            if posting is None:
+                postings[gram] = [tid] if build else AppendList((), [tid])
+            elif build:
+                posting.append(tid)
+            else:
+                if not isinstance(posting, AppendList):
+                    posting = AppendList(posting)
+                postings[gram] = posting.append(tid)
+        return tid
+
+    def _drop_text(self, tid):
+        del self._text_ids[self._texts[tid]]
+        del self._texts[tid]
+        del self._owners[tid]
+
+    def add(self, rid, text, field):
+        """Gắn chuỗi text (trường field) cho nhà hàng rid (chỉ dùng lúc build, sửa dict tại chỗ)."""
+        key = fuzzy_key(text)
+        if key:
+            tid = self._text_ids.get(key)
+            if tid is None:
+                tid = self._new_text(key, build=True)
+                self._owners[tid] = {}
+            owners = self._owners[tid]
+            owners[str(rid)] = owners.get(str(rid), 0) | field
+
+    def update(self, rid, fields, old=(), new=()):
+        """Giống SearchIndex.update: gỡ chuỗi cũ, thêm chuỗi mới (list (text, field)) của 1 nhà hàng."""
+        rid = str(rid)
+        new_masks = {}
+        for text, field in new:
+            key = fuzzy_key(text)
+            if key:
+                new_masks[key] = new_masks.get(key, 0) | field
+        old_keys = {fuzzy_key(text) for text, _ in old} - {''}
+
+        for key in old_keys | set(new_masks):
+            tid = self._text_ids.get(key)
+            owners = self._owners[tid] if tid is not None else {}
+            current = owners.get(rid, 0)
+            mask = (current & ~fields) | new_masks.get(key, 0)
+            if mask == current:
+                continue
+            if tid is None:
+                tid = self._new_text(key)
+            # Chuỗi phổ biến (tag) có rất nhiều chủ sở hữu -> LayeredDict, không chép cả dict
+            owners = owners.clone() if isinstance(owners, LayeredDict) else LayeredDict(owners)
+            if mask:
+                owners[rid] = mask
+            elif rid in owners:
+                del owners[rid]
+            if owners:
+                self._owners[tid] = owners
+            else:
+                self._drop_text(tid)
+
+    def similar(self, query, threshold=None, fields=FIELD_NAME | FIELD_TAG | FIELD_DISH):
+        """
+        Các chuỗi giống query (độ giống >= threshold) thuộc các trường `fields`.
+        Trả về list (độ giống, chuỗi, {restaurant_id: bitmask}) sắp xếp giảm dần.
+        """
+        threshold = FUZZY_THRESHOLD if threshold is None else threshold
+        query = fuzzy_key(query)
+        if not query:
+            return []
+        query_grams = trigrams(query)
+
+        counts = defaultdict(int)
+        for gram in query_grams:
+            for tid in self._posting(gram):
+                counts[tid] += 1
+
+        # Jaccard >= threshold cần ít nhất threshold * |query| trigram chung
+        min_common = threshold * len(query_grams)
+        results = []
+        for tid, common in counts.items():
+            if common < min_common:
+                continue
+            text, owners = self._entry(tid)
+            if text is None or not any(mask & fields for mask in owners.values()):
+                continue
+            score = similarity(query, text)
+            if score >= threshold:
+                results.append((score, text, owners))
+        results.sort(key=lambda item: -item[0])
+        return results
+
+    def match(self, query, threshold=None):
+        """
+        {restaurant_id: điểm} cho các nhà hàng có chuỗi giống query; điểm = độ giống
+        x trọng số trường (name 10, tag 5, dish 2), lấy chuỗi có điểm cao nhất.
+        """
+        scores = {}
+        for score, _, owners in self.similar(query, threshold):
+            for rid, mask in owners.items():
+                scores[rid] = max(scores.get(rid, 0), round(score * field_score(mask), 2))
+        return scores
+
+
+def build_fuzzy_index(restaurants, menus_by_restaurant_id):
+    """Build TrigramIndex từ list nhà hàng và menu đã nhóm theo restaurant_id."""
+    index = TrigramIndex()
+    for r in restaurants:
+        index.add(r['id'], r.get('name'), FIELD_NAME)
+        for tag in r.get('tags') or []:
+            index.add(r['id'], tag, FIELD_TAG)
+    for restaurant_id, menu_items in menus_by_restaurant_id.items():
+        for item in menu_items:
+            index.add(restaurant_id, item.get('dish_name'), FIELD_DISH)
+    index.seal()
+    return index
@@ -0,0 +1,81 @@
+# core/geo.py
+# --- Tính khoảng cách dùng chung: haversine vector hóa trên các cột tọa độ (radian) ---
+import numpy as np
+
+from core.cache import round_coord
+
+EARTH_RADIUS_KM = 6371  # Bán kính Trái Đất (km)
+KM_PER_DEGREE_LAT = np.pi * EARTH_RADIUS_KM / 180  # ~111.19 km cho 1 độ vĩ
+GRID_BITS = 24  # Lưới Web Mercator mịn nhất: 2^24 ô mỗi chiều (~2.4 m ở xích đạo)
+MAX_MERCATOR_LAT = 85.05112878  # Vĩ độ giới hạn của Web Mercator (tile bản đồ)
+
+
+def radius_bbox(lat, lon, radius_km):
+    """
+    Hình chữ nhật (south, west, north, east) bao quanh vòng tròn bán kính radius_km.
+    Dùng để lọc thô bằng phép so sánh độ trước khi tính haversine chính xác.
+    """
+    dlat = radius_km / KM_PER_DEGREE_LAT
+    south, north = max(-90.0, lat - dlat), min(90.0, lat + dlat)
+    cos_lat = np.cos(np.radians(lat))
+    if cos_lat > 1e-6 and radius_km < EARTH_RADIUS_KM * cos_lat:
+        dlon = float(np.degrees(np.arcsin(radius_km / (EARTH_RADIUS_KM * cos_lat))))
+        if abs(lon) + dlon < 180:
+            return south, lon - dlon, north, lon + dlon
+    # Quá gần cực, bán kính quá lớn hoặc vắt qua kinh tuyến 180 -> không giới hạn kinh độ
+    return south, -180.0, north, 180.0
+
+
+def mercator_grid(lat, lon, bits=GRID_BITS):
+    """
+    Ô lưới Web Mercator (x, y nguyên trong [0, 2^bits), y tăng dần về phía nam) của các điểm.
+    Ô ở mức thô hơn (ít bit hơn) chỉ là dịch phải: ô ở zoom z = (x, y) >> (bits - z),
+    cùng cách đánh số với tile bản đồ z/x/y. Tọa độ NaN cho ô 0.
+    """
+    lat = np.clip(np.nan_to_num(np.asarray(lat, dtype=np.float64)), -MAX_MERCATOR_LAT, MAX_MERCATOR_LAT)
+    lon = np.nan_to_num(np.asarray(lon, dtype=np.float64))
+    sin_lat = np.sin(np.radians(lat))
+    x = (lon + 180.0) / 360.0
+    y = 0.5 - np.log((1 + sin_lat) / (1 - sin_lat)) / (4 * np.pi)
+    scale = 1 << bits
+    grid_x = np.clip(np.floor(x * scale), 0, scale - 1).astype(np.uint32)
+    grid_y = np.clip(np.floor(y * scale), 0, scale - 1).astype(np.uint32)
+    return grid_x, grid_y
+
+
+def parse_bbox(value):
+    """
+    Khung nhìn bản đồ [south, west, north, east] (list / tuple, dict cùng tên key hoặc chuỗi
+    "s,w,n,e") -> tuple float đã làm tròn như tọa độ cache. ValueError nếu không hợp lệ.
+    """
+    if isinstance(value, dict):
+        value = [value.get(key) for key in ('south', 'west', 'north', 'east')]
+    elif isinstance(value, str):
+        value = value.split(',')
+    if not isinstance(value, (list, tuple)) or len(value) != 4:
+        raise ValueError("cần 4 giá trị south, west, north, east")
+    south, west, north, east = (round_coord(float(v)) for v in value)
+    if not (-90 <= south <= north <= 90) or not (-180 <= west <= 180 and -180 <= east <= 180):
+        raise ValueError("tọa độ ngoài phạm vi hoặc south > north")
+    return south, west, north, east
+
+
+def haversine_km(columns, lat, lon, rows):
+    """Khoảng cách (km) từ (lat, lon) tới các nhà hàng `rows` trong 1 lần tính vector."""
+    lat1 = np.radians(lat)
+    lon1 = np.radians(lon)
+    lat2 = columns.lat_rad[rows]
+    dlat = lat2 - lat1
+    dlon = columns.lon_rad[rows] - lon1
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * columns.cos_lat[rows] * np.sin(dlon / 2) ** 2
+    c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+    return EARTH_RADIUS_KM * c
+
+
+def distances_from(columns, lat, lon, mask=None):
+    """Trả về (rows, distances) tới mọi nhà hàng có tọa độ (trong mask nếu có)."""
+    located = columns.has_coords()
+    if mask is not None:
+        located &= mask
+    rows = located.nonzero()[0]
+    return rows, haversine_km(columns, lat, lon, rows)
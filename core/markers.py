@@ -0,0 +1,104 @@
+# core/markers.py
+# --- Marker bản đồ (format frontend dùng chung cho /api/search và /api/map/filter) ---
+import base64
+import hashlib
+import json
+import os
+
+# Số marker tối đa của 1 khung nhìn (bbox): đủ MAP_MAX_MARKERS từ zoom MAP_FULL_ZOOM,
+# mỗi mức zoom nhỏ hơn giảm 1 nửa nhưng không dưới MAP_MIN_MARKERS
+MAP_MAX_MARKERS = int(os.getenv('MAP_MAX_MARKERS', 500))
+MAP_MIN_MARKERS = int(os.getenv('MAP_MIN_MARKERS', 50))
+MAP_FULL_ZOOM = 15
+
+# category_id -> kiểu món + màu pin
+CATEGORY_STYLES = {
+    1: {"dishType": "dry", "pinColor": "red"},
+    2: {"dishType": "soup", "pinColor": "blue"},
+    3: {"dishType": "vegetarian", "pinColor": "green"},
+    4: {"dishType": "salty", "pinColor": "orange"},
+    5: {"dishType": "seafood", "pinColor": "purple"},
+}
+DEFAULT_STYLE = CATEGORY_STYLES[1]
+
+
+def category_style(category_id):
+    """{dishType, pinColor} của 1 category (category lạ dùng kiểu mặc định)."""
+    try:
+        return CATEGORY_STYLES.get(category_id, DEFAULT_STYLE)
+    except TypeError:  # category_id không hash được (dữ liệu lỗi)
+        return DEFAULT_STYLE
+
+
+def to_marker(restaurant, distance=None):
+    """Marker object của 1 nhà hàng; distance (km, đã làm tròn) khác None thì thêm vào."""
+    style = category_style(restaurant.get('category_id', 1))
+    marker = {
+        "id": restaurant.get('id'),
+        "name": restaurant.get('name'),
+        "address": restaurant.get('address'),
+        "position": {
+            "lat": restaurant.get('lat'),
+            "lon": restaurant.get('lon')
+        },
+        "dishType": style["dishType"],
+        "pinColor": style["pinColor"],
+        "rating": restaurant.get('rating', 0),
+        "price_range": restaurant.get('price_range'),
+        "phone_number": restaurant.get('phone_number'),
+        "open_hours": restaurant.get('open_hours'),
+        "main_image_url": restaurant.get('main_image_url'),
+        "tags": restaurant.get('tags', [])
+    }
+    if distance is not None:
+        marker['distance'] = distance
+    return marker
+
+
+def viewport_cap(zoom=None, limit=None):
+    """Số marker tối đa trả về cho 1 khung nhìn ở mức zoom (None = MAP_MAX_MARKERS), limit nhỏ hơn thì theo limit."""
+    cap = MAP_MAX_MARKERS
+    if zoom is not None and zoom < MAP_FULL_ZOOM:
+        cap = max(MAP_MIN_MARKERS, cap >> min(int(MAP_FULL_ZOOM - zoom), 30))
+    if limit is not None:
+        cap = min(cap, limit)
+    return max(cap, 0)
+
+
+def _filters_digest(filters):
+    return hashlib.sha1(json.dumps(filters, sort_keys=True, ensure_ascii=False, default=str).encode('utf-8')).hexdigest()[:12]
+
+
+def view_token(tag, bbox, zoom, filters):
+    """
+    Token của 1 kết quả khung nhìn: version dữ liệu (tag), bbox, zoom và digest các filter khác.
+    Client gửi lại ở lần pan sau (since) để chỉ nhận markers thay đổi.
+    """
+    raw = json.dumps([tag, list(bbox), zoom, _filters_digest(filters)], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def parse_view_token(token, tag, filters):
+    """
+    (bbox, zoom) của token nếu token cùng version dữ liệu và cùng filters, ngược lại None
+    (client nhận lại đầy đủ). ValueError nếu token không đọc được.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(str(token) + '=' * (-len(str(token)) % 4))
+        token_tag, bbox, zoom, digest = json.loads(raw)
+        bbox = tuple(float(v) for v in bbox)
+        zoom = float(zoom) if zoom is not None else None
+    except (TypeError, ValueError) as e:
+        raise ValueError("token không hợp lệ") from e
+    if len(bbox) != 4 or token_tag != tag or digest != _filters_digest(filters):
+        return None
+    return bbox, zoom
+
+
+def marker_delta(old_markers, new_markers):
+    """(added, removed): markers mới chưa có trong old_markers, ID các marker cũ không còn trong new_markers."""
+    old_ids = {marker['id'] for marker in old_markers}
+    new_ids = {marker['id'] for marker in new_markers}
+    added = [marker for marker in new_markers if marker['id'] not in old_ids]
+    removed = [marker['id'] for marker in old_markers if marker['id'] not in new_ids]
+    return added, removed
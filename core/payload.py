@@ -0,0 +1,253 @@
+# core/payload.py
+# --- Response JSON serialize sẵn 1 lần (kèm bản nén gzip/brotli và ETag) ---
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+
+import numpy as np
+from flask import Response, request
+
+try:
+    import brotli
+except ImportError:  # brotli là tùy chọn, thiếu thì chỉ phục vụ gzip
+    brotli = None
+
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 9
+LIST_BLOCK_ITEMS = 256  # Số item mỗi khối của ListPayload (splice chỉ chép 1 khối)
+# Giây chờ gom các lần splice liên tiếp trước khi nén lại (nén tối đa 1 lần mỗi khoảng này)
+PAYLOAD_COMPRESS_DELAY = float(os.getenv('PAYLOAD_COMPRESS_DELAY', 1.0))
+
+
+class CachedPayload:
+    """
+    Body JSON đã serialize sẵn cùng các biến thể nén và ETag mạnh.
+    Chỉ build lại khi data thay đổi, mỗi request chỉ chọn biến thể phù hợp.
+    Load từ snapshot thì body / biến thể là mảng uint8 trên mmap (dùng chung giữa các worker),
+    chỉ chép ra bytes khi gửi response.
+    """
+
+    def __init__(self, body):
+        self.body = body
+        self.etag = hashlib.sha256(self.body).hexdigest()[:32]
+        self.compress()
+
+    def compress(self):
+        """Tính các biến thể nén của body (gán 1 lần, request đang đọc variants cũ không bị ảnh hưởng)."""
+        body = self.body
+        variants = {'gzip': gzip.compress(body, GZIP_LEVEL, mtime=0)}
+        if brotli is not None:
+            variants['br'] = brotli.compress(body, quality=BROTLI_QUALITY)
+        self.variants = variants
+
+    def __len__(self):
+        return len(self.body)
+
+    def snapshot_state(self):
+        """Trạng thái để ghi snapshot nhị phân (giữ luôn các bản đã nén), body / biến thể là mảng uint8."""
+        state = {'body': np.frombuffer(self.body, dtype=np.uint8), 'etag': self.etag, 'encodings': list(self.variants)}
+        for encoding, body in self.variants.items():
+            state[f'variant_{encoding}'] = np.frombuffer(body, dtype=np.uint8)
+        return state
+
+    @classmethod
+    def from_snapshot(cls, state):
+        """Dựng lại payload từ snapshot mà không phải nén lại."""
+        payload = cls.__new__(cls)
+        payload.body = state['body']
+        payload.etag = state['etag']
+        payload.variants = {encoding: state[f'variant_{encoding}'] for encoding in state['encodings']}
+        if brotli is None:
+            payload.variants.pop('br', None)
+        return payload
+
+    def _etag_for(self, encoding):
+        """ETag mạnh riêng cho từng biến thể nén."""
+        return f"{self.etag}-{encoding}" if encoding else self.etag
+
+    def _pick_encoding(self):
+        """Chọn biến thể nén nhỏ nhất mà client chấp nhận (Accept-Encoding)."""
+        accepted = [
+            encoding for encoding in self.variants
+            if request.accept_encodings[encoding] > 0
+        ]
+        if not accepted:
+            return None
+        return min(accepted, key=lambda encoding: len(self.variants[encoding]))
+
+    def to_response(self):
+        """Response cho request hiện tại: 304 nếu If-None-Match khớp ETag, ngược lại body đã nén."""
+        encoding = self._pick_encoding()
+        etag = self._etag_for(encoding)
+        if any(request.if_none_match.contains_weak(self._etag_for(e)) for e in (None, *self.variants)):
+            response = Response(status=304)
+        else:
+            body = self.variants[encoding] if encoding else self.body
+            response = Response(bytes(body), status=200, mimetype='application/json')
+            if encoding:
+                response.headers['Content-Encoding'] = encoding
+        response.set_etag(etag)
+        response.headers['Vary'] = 'Accept-Encoding'
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+
+
+class _Compressor:
+    """
+    1 thread nén nền cho ListPayload sau splice: chờ PAYLOAD_COMPRESS_DELAY rồi chỉ nén
+    payload mới nhất, các bản bị thay trong lúc đó thì bỏ qua (upsert liên tục không chiếm
+    CPU của writer / request cho các lần nén sẽ bị bỏ ngay sau đó).
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._pending = None
+        self._thread = None
+
+    def submit(self, payload):
+        with self._condition:
+            self._pending = payload
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='payload-compress', daemon=True)
+                self._thread.start()
+            self._condition.notify()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while self._pending is None:
+                    self._condition.wait()
+            time.sleep(PAYLOAD_COMPRESS_DELAY)
+            with self._condition:
+                payload, self._pending = self._pending, None
+            try:
+                payload.compress()
+            except Exception as e:
+                print(f"❌ Nén payload thất bại: {e}")
+
+
+COMPRESSOR = _Compressor()
+
+
+class ListPayload(CachedPayload):
+    """
+    Body {"success": true, "count": N, "<key>": [...]} của 1 list lớn, ghép từ các item đã
+    serialize sẵn theo vị trí. Mỗi item lưu dạng b',' + JSON (b'' = vị trí không còn item),
+    gom thành khối LIST_BLOCK_ITEMS vị trí kèm offset của từng item trong khối.
+    spliced() thay 1 item chỉ chép 1 khối + list khối, không serialize lại cả list; body
+    ghép lại ở lần đọc đầu tiên, bản nén tính ở thread nền (COMPRESSOR), trong lúc chờ
+    response không nén. Load từ snapshot thì các khối là view trên body (mmap).
+    """
+
+    def __init__(self, key, blocks, starts, count, etag=None):
+        self.key = key
+        self._blocks = blocks  # list bytes-like: các item của khối nối nhau
+        self._starts = starts  # list mảng int64: offset item i của khối = starts[k][i]
+        self.count = count
+        self._body = None
+        self.etag = etag
+        self.variants = {}
+
+    @classmethod
+    def build(cls, key, items):
+        """ListPayload của list dict items (tính luôn ETag + bản nén như CachedPayload)."""
+        fragments = [b',' + dumps(item).encode('utf-8') for item in items]
+        blocks, starts = [], []
+        for i in range(0, len(fragments), LIST_BLOCK_ITEMS):
+            chunk = fragments[i:i + LIST_BLOCK_ITEMS]
+            offsets = np.zeros(len(chunk) + 1, dtype=np.int64)
+            np.cumsum([len(fragment) for fragment in chunk], out=offsets[1:])
+            blocks.append(b''.join(chunk))
+            starts.append(offsets)
+        payload = cls(key, blocks, starts, len(fragments))
+        payload.etag = hashlib.sha256(payload.body).hexdigest()[:32]
+        payload.compress()
+        return payload
+
+    def _head(self):
+        return f'{{"success":true,"count":{self.count},"{self.key}":['.encode('utf-8')
+
+    @property
+    def body(self):
+        body = self._body
+        if body is None:
+            region = b''.join(self._blocks)
+            # Item đầu tiên không có dấu phẩy phía trước
+            body = self._body = b''.join((self._head(), region[1:], b']}'))
+        return body
+
+    def __len__(self):
+        size = sum(len(block) for block in self._blocks)
+        return len(self._head()) + max(size - 1, 0) + 2
+
+    def spliced(self, position, item, count, etag):
+        """
+        Bản mới với item tại `position` thay bằng `item` (dict, None = bỏ), count nhà hàng mới
+        và ETag mới (bản này không đổi). position == số vị trí hiện có thì nối vào cuối.
+        """
+        fragment = b'' if item is None else b',' + dumps(item).encode('utf-8')
+        k, i = divmod(position, LIST_BLOCK_ITEMS)
+        blocks, starts = list(self._blocks), list(self._starts)
+        if k == len(blocks):
+            blocks.append(b'')
+            starts.append(np.zeros(1, dtype=np.int64))
+        block, offsets = blocks[k], starts[k]
+        if i == len(offsets) - 1:
+            start = end = offsets[-1]
+            offsets = np.append(offsets, offsets[-1])
+        else:
+            start, end = offsets[i], offsets[i + 1]
+            offsets = offsets.copy()
+        offsets[i + 1:] += len(fragment) - (end - start)
+        blocks[k] = b''.join((block[:start], fragment, block[end:]))
+        starts[k] = offsets
+        payload = ListPayload(self.key, blocks, starts, count, etag)
+        COMPRESSOR.submit(payload)
+        return payload
+
+    def snapshot_state(self):
+        """Như CachedPayload, thêm offset từng item (theo vị trí) để dựng lại các khối khi load."""
+        if not self.variants:
+            self.compress()
+        state = super().snapshot_state()
+        sizes = [np.diff(offsets) for offsets in self._starts]
+        starts = np.zeros(sum(len(size) for size in sizes) + 1, dtype=np.int64)
+        if sizes:
+            np.cumsum(np.concatenate(sizes), out=starts[1:])
+        state.update(key=self.key, count=self.count, starts=starts)
+        return state
+
+    @classmethod
+    def from_snapshot(cls, state):
+        payload = cls(state['key'], [], [], state['count'], state['etag'])
+        body, starts = state['body'], state['starts']
+        base = len(payload._head()) - 1  # Byte j (>= 1) của các item nối nhau nằm ở body[base + j]
+        for k in range(0, len(starts) - 1, LIST_BLOCK_ITEMS):
+            offsets = starts[k:k + LIST_BLOCK_ITEMS + 1]
+            start, end = int(offsets[0]), int(offsets[-1])
+            if start == end:
+                block = b''
+            elif start == 0:
+                block = b',' + bytes(body[base + 1:base + end])
+            else:
+                block = body[base + start:base + end]
+            payload._blocks.append(block)
+            payload._starts.append(offsets - start)
+        payload._body = body
+        payload.variants = {encoding: state[f'variant_{encoding}'] for encoding in state['encodings']}
+        if brotli is None:
+            payload.variants.pop('br', None)
+        return payload
+
+
+def dumps(obj):
+    """Serialize JSON gọn (không escape tiếng Việt) dùng chung cho các payload dựng sẵn."""
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':'))
+
+
+def build_payload(obj):
+    """Serialize obj thành CachedPayload."""
+    return CachedPayload(dumps(obj).encode('utf-8'))
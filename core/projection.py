@@ -0,0 +1,149 @@
+# core/projection.py
+# --- Projection `fields=` cho các API danh sách nhà hàng ---
+import math
+from functools import lru_cache
+from json.encoder import encode_basestring
+
+from flask import Response
+
+from core.payload import dumps
+from core.records import LIST_FIELDS, NUMBER_FIELDS, RESTAURANT_FIELDS, TEXT_FIELDS, Restaurant, RestaurantStore
+
+
+class ProjectionError(ValueError):
+    """Tham số fields chứa trường không tồn tại."""
+
+
+def parse_fields(raw, extra_fields=()):
+    """
+    Parse "id,lat,lon" (hoặc list) thành tuple trường, giữ thứ tự và bỏ trùng.
+    None/rỗng = không projection. Trường lạ -> ProjectionError.
+    """
+    if raw is None:
+        return None
+    if isinstance(raw, str):
+        raw = raw.split(',')
+    if not isinstance(raw, list):
+        raise ProjectionError("fields phải là chuỗi 'a,b,c' hoặc list")
+
+    fields = []
+    for field in raw:
+        field = str(field).strip()
+        if field and field not in fields:
+            fields.append(field)
+    if not fields:
+        return None
+
+    allowed = set(RESTAURANT_FIELDS) | set(extra_fields)
+    unknown = [f for f in fields if f not in allowed]
+    if unknown:
+        raise ProjectionError(
+            f"Trường không hợp lệ: {', '.join(unknown)}. "
+            f"Các trường hợp lệ: {', '.join(RESTAURANT_FIELDS + tuple(extra_fields))}"
+        )
+    return tuple(fields)
+
+
+def _string_json(value):
+    return 'null' if value is None else encode_basestring(value)
+
+
+def _number_json(value):
+    return repr(value) if value is not None and math.isfinite(value) else dumps(value)
+
+
+def _value_json(value):
+    """JSON của 1 giá trị bất kỳ (override / trường thêm), kiểu hay gặp không qua dumps."""
+    if value is None or isinstance(value, str):
+        return _string_json(value)
+    if type(value) in (int, float):
+        return _number_json(value)
+    return dumps(value)
+
+
+# Encoder theo cột: list giá trị (lấy từ cột, không override) -> list JSON
+
+def _strings_json(values):
+    return [encode_basestring(v) if v is not None else 'null' for v in values]
+
+
+def _numbers_json(values):
+    if math.isfinite(sum(values)):
+        return list(map(repr, values))
+    return list(map(_number_json, values))
+
+
+def _lists_json(values):
+    return ['[' + ','.join(_strings_json(items)) + ']' for items in values]
+
+
+def _column_encoder(field):
+    if field == 'id' or field in TEXT_FIELDS:
+        return _strings_json
+    if field in NUMBER_FIELDS:
+        return _numbers_json
+    if field in LIST_FIELDS:
+        return _lists_json
+    return None  # Trường ngoài schema (VD distance): chỉ có trong extras
+
+
+@lru_cache(maxsize=128)
+def compile_serializer(fields):
+    """
+    Tạo (và cache) hàm serialize danh sách nhà hàng thành list JSON object chỉ gồm `fields`.
+    Template object và encoder theo cột của từng trường tính sẵn 1 lần; giá trị lấy theo cột
+    (RestaurantStore.project_columns) nên không tạo dict cho từng nhà hàng.
+    """
+    template = '{' + ','.join(dumps(field).replace('%', '%%') + ':%s' for field in fields) + '}'
+    encoders = [_column_encoder(field) for field in fields]
+    stored = tuple(field for field, encode in zip(fields, encoders) if encode)
+
+    def serialize(restaurants, extras=None):
+        store = _store_of(restaurants)
+        if store is not None:
+            rows = store.columns.alive_rows() if store is restaurants else [r.row for r in restaurants]
+            values, overridden = store.project_columns(rows, stored)
+            values = iter(values)
+            columns = [encode(next(values)) if encode else ['null'] * len(rows) for encode in encoders]
+        else:
+            # List dict thường: tra từng giá trị
+            restaurants, overridden = list(restaurants), {}
+            columns = [[_value_json(r.get(field)) for r in restaurants] for field in fields]
+        for i, restaurant in overridden.items():
+            for column, field in zip(columns, fields):
+                column[i] = _value_json(restaurant.get(field))
+        if extras:
+            for field, column in zip(fields, columns):
+                for i, extra in enumerate(extras):
+                    if field in extra:
+                        column[i] = _value_json(extra[field])
+        return [template % values for values in zip(*columns)]
+
+    return serialize
+
+
+def _store_of(restaurants):
+    """RestaurantStore chung của restaurants (cả store hoặc list Restaurant cùng store), không có thì None."""
+    if isinstance(restaurants, RestaurantStore):
+        return restaurants
+    if not restaurants or not isinstance(restaurants[0], Restaurant):
+        return None
+    store = restaurants[0].store
+    if all(isinstance(r, Restaurant) and r.store is store for r in restaurants):
+        return store
+    return None
+
+
+def projected_body(restaurants, fields, extras=None):
+    """
+    Body {"success", "count", "restaurants"} đã projection, dạng bytes (count = số item thật sự trả về).
+    restaurants: RestaurantStore (toàn bộ danh sách, bỏ qua nhà hàng đã xóa) hoặc list nhà hàng;
+    extras: list dict trường thêm (VD distance), cùng thứ tự.
+    """
+    items = compile_serializer(fields)(restaurants, extras)
+    return ('{"success":true,"count":%d,"restaurants":[%s]}' % (len(items), ','.join(items))).encode('utf-8')
+
+
+def projected_response(restaurants, fields, extras=None, status=200):
+    """Response JSON danh sách nhà hàng chỉ gồm các trường trong `fields`."""
+    return Response(projected_body(restaurants, fields, extras), status=status, mimetype='application/json')
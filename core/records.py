@@ -0,0 +1,636 @@
+# core/records.py
+# --- Lưu nhà hàng dạng struct-of-arrays gọn nhẹ thay cho list dict thô ---
+import copy
+import json
+from bisect import bisect_left
+from collections.abc import Mapping, Sequence
+
+import numpy as np
+
+from core.versioned import AppendList, LayeredDict, append_to
+
+# Schema của 1 nhà hàng (theo data/restaurants.json), giữ đúng thứ tự key gốc
+RESTAURANT_FIELDS = (
+    'id', 'name', 'category_id', 'rating', 'price_range', 'address', 'lat', 'lon',
+    'phone_number', 'open_hours', 'opening_hours_full', 'image_url', 'tags',
+)
+
+# Trường chuỗi lưu bằng ID trong bảng chuỗi dùng chung
+TEXT_FIELDS = ('name', 'price_range', 'address', 'phone_number', 'open_hours', 'image_url')
+
+# Trường list chuỗi lưu dạng CSR (offsets + ID trong bảng chuỗi)
+LIST_FIELDS = ('tags', 'opening_hours_full')
+
+# Trường số lưu trong RestaurantColumns (giá trị không phải số nằm trong override)
+NUMBER_FIELDS = ('category_id', 'rating', 'lat', 'lon')
+
+_MISSING = object()  # Đánh dấu key không có trong record gốc
+
+
+class PackedStrings(Sequence):
+    """
+    List chuỗi chỉ đọc gói trong 1 buffer UTF-8 + mảng offsets. Khi load từ snapshot
+    cả 2 mảng nằm trên mmap (dùng chung giữa các worker), chỉ decode chuỗi khi được đọc.
+    """
+
+    __slots__ = ('blob', 'offsets')
+
+    def __init__(self, blob, offsets):
+        self.blob = blob
+        self.offsets = offsets
+
+    @classmethod
+    def pack(cls, strings):
+        encoded = [value.encode('utf-8') for value in strings]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(b) for b in encoded], out=offsets[1:])
+        return cls(np.frombuffer(b''.join(encoded), dtype=np.uint8), offsets)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        index = int(index)
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return self.blob[self.offsets[index]:self.offsets[index + 1]].tobytes().decode('utf-8')
+
+    def bisect_left(self, value, lo=0, hi=None):
+        """
+        Như bisect.bisect_left(self, value) với list đã sort nhưng so trên byte UTF-8 (cùng
+        thứ tự với chuỗi), không decode từng chuỗi được so.
+        """
+        key = value.encode('utf-8')
+        blob, offsets = self.blob, self.offsets
+        hi = len(offsets) - 1 if hi is None else hi
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if blob[offsets[mid]:offsets[mid + 1]].tobytes() < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def take(self, indices):
+        """Các chuỗi tại `indices` (mảng số nguyên không âm), decode thẳng từ buffer."""
+        raw = memoryview(self.blob)
+        indices = np.asarray(indices, dtype=np.int64)
+        starts, ends = self.offsets[indices].tolist(), self.offsets[indices + 1].tolist()
+        return [str(raw[start:end], 'utf-8') for start, end in zip(starts, ends)]
+
+
+def bisect_strings(strings, value, lo=0, hi=None):
+    """bisect_left trên list chuỗi đã sort (list hoặc PackedStrings)."""
+    if isinstance(strings, PackedStrings):
+        return strings.bisect_left(value, lo, hi)
+    return bisect_left(strings, value, lo, len(strings) if hi is None else hi)
+
+
+def take_strings(strings, indices):
+    """strings[i] cho từng i trong `indices` (list chuỗi, PackedStrings hoặc AppendList)."""
+    if isinstance(strings, (PackedStrings, AppendList)):
+        return strings.take(indices)
+    return [strings[i] for i in np.asarray(indices).tolist()]
+
+
+def pack_strings(strings):
+    """PackedStrings của list chuỗi (giữ nguyên nếu đã gói sẵn)."""
+    if isinstance(strings, AppendList) and len(strings) == len(strings.base):
+        strings = strings.base
+    return strings if isinstance(strings, PackedStrings) else PackedStrings.pack(strings)
+
+
+class PackedIndex(Mapping):
+    """
+    Mapping chỉ đọc {strings[p]: p} cho các vị trí p trong `positions` (đã sort theo chuỗi),
+    tra bằng tìm nhị phân trên PackedStrings từ snapshot thay vì dựng dict ở từng worker.
+    """
+
+    __slots__ = ('_strings', '_positions')
+
+    def __init__(self, strings, positions):
+        self._strings = strings
+        self._positions = positions
+
+    @classmethod
+    def sorted_positions(cls, strings, positions):
+        """positions sắp theo strings[p] (để ghi snapshot)."""
+        positions = np.asarray(positions, dtype=np.int64)
+        keys = take_strings(strings, positions)
+        return positions[sorted(range(len(keys)), key=keys.__getitem__)]
+
+    def __getitem__(self, key):
+        if not isinstance(key, str):
+            raise KeyError(key)
+        strings, positions = self._strings, self._positions
+        # So byte UTF-8 (cùng thứ tự với chuỗi), không decode từng chuỗi được so
+        blob, offsets, raw = strings.blob, strings.offsets, key.encode('utf-8')
+        lo, hi = 0, len(positions)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            p = positions[mid]
+            if blob[offsets[p]:offsets[p + 1]].tobytes() < raw:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(positions):
+            p = int(positions[lo])
+            if blob[offsets[p]:offsets[p + 1]].tobytes() == raw:
+                return p
+        raise KeyError(key)
+
+    def __iter__(self):
+        return iter(take_strings(self._strings, self._positions))
+
+    def __len__(self):
+        return len(self._positions)
+
+
+def pack_lists(lists, dtype=np.int32):
+    """List các list số -> CSR (offsets, items): list thứ i là items[offsets[i]:offsets[i + 1]]."""
+    offsets = np.zeros(len(lists) + 1, dtype=np.int64)
+    np.cumsum([len(items) for items in lists], out=offsets[1:])
+    items = np.fromiter((value for items in lists for value in items), dtype=dtype, count=int(offsets[-1]))
+    return offsets, items
+
+
+class PackedJSON(Sequence):
+    """
+    List dict chỉ đọc, mỗi phần tử là 1 chuỗi JSON trong PackedStrings (menu từ snapshot).
+    Chỉ parse khi được đọc, mỗi lần đọc trả về dict mới.
+    """
+
+    __slots__ = ('strings',)
+
+    def __init__(self, strings):
+        self.strings = strings
+
+    @classmethod
+    def pack(cls, items):
+        return cls(PackedStrings.pack([json.dumps(item, ensure_ascii=False, separators=(',', ':')) for item in items]))
+
+    def __len__(self):
+        return len(self.strings)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        return json.loads(self.strings[index])
+
+
+class PackedGroups(Mapping):
+    """
+    Mapping chỉ đọc {key: [phần tử]} trên 1 Sequence: key đã sort (PackedStrings) + CSR
+    vị trí phần tử theo từng key (menus_by_restaurant_id từ snapshot).
+    """
+
+    __slots__ = ('_items', '_keys', '_offsets', '_positions')
+
+    def __init__(self, items, keys, offsets, positions):
+        self._items = items
+        self._keys = keys
+        self._offsets = offsets
+        self._positions = positions
+
+    def __getitem__(self, key):
+        keys = self._keys
+        i = bisect_strings(keys, key) if isinstance(key, str) else len(keys)
+        if i == len(keys) or keys[i] != key:
+            raise KeyError(key)
+        return [self._items[p] for p in self._positions[self._offsets[i]:self._offsets[i + 1]].tolist()]
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+
+class StringTable:
+    """
+    Bảng chuỗi: mỗi chuỗi khác nhau chỉ lưu 1 lần, tham chiếu bằng số nguyên (-1 = None).
+    Chỉ ghi thêm (AppendList + LayeredDict) nên clone() không chép bảng.
+    """
+
+    def __init__(self):
+        self.strings = AppendList()
+        self._ids = LayeredDict()
+
+    def __len__(self):
+        return len(self.strings)
+
+    def clone(self):
+        table = copy.copy(self)
+        table._ids = self._ids.clone()
+        return table
+
+    def intern(self, value):
+        if value is None:
+            return -1
+        sid = self._ids.get(value)
+        if sid is None:
+            sid = len(self.strings)
+            self.strings = self.strings.append(value)
+            self._ids[value] = sid
+        return sid
+
+    def get(self, sid):
+        return None if sid < 0 else self.strings[sid]
+
+    def seal(self):
+        """Gọi sau khi build xong (xem LayeredDict.sealed)."""
+        self._ids = self._ids.sealed()
+
+    @classmethod
+    def from_packed(cls, strings):
+        """
+        Bảng chuỗi trên PackedStrings từ snapshot. Chuỗi thêm sau đó không dò trùng với
+        phần đã gói (không cần dựng index chuỗi -> ID ở từng worker), chỉ tốn vài chuỗi lặp.
+        """
+        table = cls()
+        table.strings = AppendList(strings)
+        return table
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+class Restaurant(Mapping):
+    """
+    View chỉ đọc tới 1 dòng trong RestaurantStore. Dùng như dict
+    (r.get('name'), r['tags'], dict(r), {**r}); r.copy()/r.to_dict() trả về dict thật.
+    """
+
+    __slots__ = ('_store', '_row')
+
+    def __init__(self, store, row):
+        self._store = store
+        self._row = row
+
+    @property
+    def row(self):
+        """Row ID của nhà hàng (khớp với core/columns.py)."""
+        return self._row
+
+    @property
+    def store(self):
+        """RestaurantStore chứa dòng này."""
+        return self._store
+
+    def __getitem__(self, key):
+        return self._store.value(self._row, key)
+
+    def get(self, key, default=None):
+        try:
+            return self._store.value(self._row, key)
+        except KeyError:
+            return default
+
+    def __iter__(self):
+        return iter(self._store.keys(self._row))
+
+    def __len__(self):
+        return len(self._store.keys(self._row))
+
+    def __repr__(self):
+        return f"Restaurant({self._store.ids[self._row]!r})"
+
+    def to_dict(self):
+        return self._store.to_dict(self._row)
+
+    copy = to_dict
+
+
+class RestaurantStore(Sequence):
+    """
+    Struct-of-arrays cho toàn bộ nhà hàng, index theo row ID.
+    - id / category_id / rating / lat / lon: dùng chung cột của RestaurantColumns
+    - Trường chuỗi: mảng int32 trỏ vào bảng chuỗi dùng chung (tag, tỉnh, giờ mở cửa... chỉ lưu 1 lần)
+    - tags, opening_hours_full: CSR (offsets + ID chuỗi)
+    Giá trị lệch schema (thiếu key, sai kiểu, key lạ) giữ nguyên trong _overrides theo từng dòng.
+    Upsert ghi record vào dòng mới cuối các mảng (giống RestaurantColumns), dòng cũ không đổi.
+    """
+
+    def __init__(self, restaurants, columns):
+        self.columns = columns
+        self.strings = StringTable()
+        text = {field: [] for field in TEXT_FIELDS}
+        rating_is_int = []
+        list_offsets = {field: [0] for field in LIST_FIELDS}
+        list_items = {field: [] for field in LIST_FIELDS}
+        overrides_by_row = {}  # row -> {field: giá trị gốc hoặc _MISSING}
+
+        for row, r in enumerate(restaurants):
+            texts, lists, is_int, overrides = self._encode(r)
+            for field in TEXT_FIELDS:
+                text[field].append(texts[field])
+            for field in LIST_FIELDS:
+                list_items[field].extend(lists[field])
+                list_offsets[field].append(len(list_items[field]))
+            rating_is_int.append(is_int)
+            if overrides:
+                overrides_by_row[row] = overrides
+
+        self._text = {field: np.array(text[field], dtype=np.int32) for field in TEXT_FIELDS}
+        self._rating_is_int = np.array(rating_is_int, dtype=bool)
+        self._overrides = LayeredDict(overrides_by_row)
+        self._lists = {
+            field: (np.array(list_offsets[field], dtype=np.int32), np.array(list_items[field], dtype=np.int32))
+            for field in LIST_FIELDS
+        }
+        self._appenders = {}
+        self.strings.seal()
+        self._finish()
+
+    def _encode(self, r):
+        """
+        1 record -> (ID chuỗi theo TEXT_FIELDS, list ID chuỗi theo LIST_FIELDS, rating là int,
+        overrides); giá trị lệch schema nằm trong overrides (cột tương ứng = -1 / list rỗng).
+        """
+        overrides = {}
+        texts, lists = {}, {}
+
+        if not isinstance(r.get('id'), str):
+            overrides['id'] = r.get('id', _MISSING)
+
+        rating = r.get('rating', _MISSING)
+        rating_is_int = _is_number(rating) and isinstance(rating, int)
+        if not _is_number(rating):
+            overrides['rating'] = rating
+
+        for field in ('lat', 'lon'):
+            value = r.get(field, _MISSING)
+            if not isinstance(value, float):
+                overrides[field] = value
+
+        category_id = r.get('category_id', _MISSING)
+        if not (isinstance(category_id, int) and not isinstance(category_id, bool)):
+            overrides['category_id'] = category_id
+
+        for field in TEXT_FIELDS:
+            value = r.get(field, _MISSING)
+            if value is None or isinstance(value, str):
+                texts[field] = self.strings.intern(value)
+            else:
+                texts[field] = -1
+                overrides[field] = value
+
+        for field in LIST_FIELDS:
+            value = r.get(field, _MISSING)
+            if isinstance(value, list) and all(isinstance(v, str) for v in value):
+                lists[field] = [self.strings.intern(v) for v in value]
+            else:
+                lists[field] = []
+                overrides[field] = value
+
+        for key, value in r.items():
+            if key not in RESTAURANT_FIELDS:
+                overrides[key] = value
+        return texts, lists, rating_is_int, overrides
+
+    def _finish(self):
+        self._getters = self._make_getters()
+        self.by_id = RestaurantsById(self)
+
+    def clone(self, columns):
+        """
+        Bản copy-on-write trên columns (RestaurantColumns.clone()) của generation mới: mảng
+        chỉ ghi thêm (AppendArray) nên chỉ chép phần bảng chuỗi / override đã sửa.
+        """
+        store = copy.copy(self)
+        store.columns = columns
+        store.strings = self.strings.clone()
+        store._text = dict(self._text)
+        store._lists = dict(self._lists)
+        store._overrides = self._overrides.clone()
+        store._appenders = dict(self._appenders)
+        store._finish()
+        return store
+
+    @property
+    def ids(self):
+        return self.columns.ids
+
+    def snapshot_state(self):
+        """Trạng thái để ghi snapshot nhị phân (core/snapshot.py); cột số nằm ở RestaurantColumns."""
+        strings = pack_strings(self.strings.strings)
+        state = {
+            'string_blob': strings.blob,
+            'string_offsets': strings.offsets,
+            'rating_is_int': self._rating_is_int,
+            # _MISSING không serialize được -> tách riêng danh sách key bị thiếu
+            'overrides': {
+                row: {k: v for k, v in overrides.items() if v is not _MISSING}
+                for row, overrides in self._overrides.items()
+            },
+            'missing': {
+                row: [k for k, v in overrides.items() if v is _MISSING]
+                for row, overrides in self._overrides.items()
+            },
+        }
+        for field in TEXT_FIELDS:
+            state[f'text_{field}'] = self._text[field]
+        for field, (offsets, items) in self._lists.items():
+            state[f'{field}_offsets'] = offsets
+            state[f'{field}_items'] = items
+        return state
+
+    @classmethod
+    def from_snapshot(cls, state, columns):
+        store = cls.__new__(cls)
+        store.columns = columns
+        store.strings = StringTable.from_packed(PackedStrings(state['string_blob'], state['string_offsets']))
+        store._text = {field: state[f'text_{field}'] for field in TEXT_FIELDS}
+        store._lists = {field: (state[f'{field}_offsets'], state[f'{field}_items']) for field in LIST_FIELDS}
+        store._rating_is_int = state['rating_is_int']
+        overrides_by_row = {}
+        for row, overrides in state['overrides'].items():
+            overrides = dict(overrides)
+            for field in state['missing'].get(row, []):
+                overrides[field] = _MISSING
+            overrides_by_row[row] = overrides
+        store._overrides = LayeredDict(overrides_by_row)
+        store._appenders = {}
+        store._finish()
+        return store
+
+    def _make_getters(self):
+        columns, strings = self.columns, self.strings.strings
+
+        def text_getter(ids):
+            return lambda row: strings[ids[row]] if ids[row] >= 0 else None
+
+        def list_getter(offsets, items):
+            return lambda row: [strings[sid] for sid in items[offsets[row]:offsets[row + 1]].tolist()]
+
+        getters = {
+            'id': lambda row: self.ids[row],
+            'category_id': lambda row: int(columns.category_id[row]),
+            'rating': lambda row: (int if self._rating_is_int[row] else float)(columns.rating[row]),
+            'lat': lambda row: float(columns.lat[row]),
+            'lon': lambda row: float(columns.lon[row]),
+        }
+        for field in TEXT_FIELDS:
+            getters[field] = text_getter(self._text[field])
+        for field, (offsets, items) in self._lists.items():
+            getters[field] = list_getter(offsets, items)
+        return getters
+
+    # --- Sequence: truy cập theo row ID ---
+
+    def __len__(self):
+        """Số row ID (kể cả nhà hàng đã xóa); số nhà hàng hiện có là len(by_id)."""
+        return len(self.ids)
+
+    def __getitem__(self, row):
+        if isinstance(row, slice):
+            return [Restaurant(self, i) for i in range(*row.indices(len(self)))]
+        if row < 0:
+            row += len(self)
+        if not 0 <= row < len(self):
+            raise IndexError(row)
+        return Restaurant(self, row)
+
+    def __iter__(self):
+        """Nhà hàng hiện có theo thứ tự trong list nguồn."""
+        for row in self.columns.alive_rows().tolist():
+            yield Restaurant(self, row)
+
+    def upsert(self, row, restaurant):
+        """
+        Ghi record vào dòng mới `row` (= dòng vừa thêm cuối columns, xem upsert_row): ghi thêm
+        vào cột chuỗi / CSR, không sửa dòng cũ. O(số trường) khấu hao.
+        """
+        texts, lists, rating_is_int, overrides = self._encode(restaurant)
+        appenders = self._appenders
+        for field in TEXT_FIELDS:
+            self._text[field] = append_to(appenders, ('text', field), self._text[field], [texts[field]])
+        for field in LIST_FIELDS:
+            offsets, items = self._lists[field]
+            items = append_to(appenders, ('items', field), items, lists[field])
+            offsets = append_to(appenders, ('offsets', field), offsets, [len(items)])
+            self._lists[field] = (offsets, items)
+        self._rating_is_int = append_to(appenders, 'rating_is_int', self._rating_is_int, [rating_is_int])
+        if overrides:
+            self._overrides[row] = overrides
+        self._finish()
+
+    # --- Accessor theo trường ---
+
+    def get(self, rid, default=None):
+        """Restaurant theo ID (Google Places ID), không có thì trả về default."""
+        row = self.columns.row_of.get(str(rid))
+        return default if row is None else Restaurant(self, row)
+
+    def value(self, row, field):
+        """Giá trị 1 trường của 1 dòng; KeyError nếu record gốc không có trường này."""
+        overrides = self._overrides.get(row)
+        if overrides is not None and field in overrides:
+            value = overrides[field]
+            if value is _MISSING:
+                raise KeyError(field)
+            return value
+        getter = self._getters.get(field)
+        if getter is None:
+            raise KeyError(field)
+        return getter(row)
+
+    def _lookup(self, sids):
+        """Chuỗi theo mảng ID trong bảng chuỗi (-1 = None), mỗi chuỗi khác nhau chỉ decode 1 lần."""
+        unique, inverse = np.unique(sids, return_inverse=True)
+        present = unique >= 0
+        decoded = [None] * int(np.count_nonzero(~present)) + take_strings(self.strings.strings, unique[present])
+        return [decoded[i] for i in inverse.tolist()]
+
+    def _column_values(self, field, rows):
+        """Giá trị 1 trường của các dòng `rows` (list, bỏ qua override), tra cả cột 1 lần."""
+        if field == 'id':
+            return take_strings(self.ids, rows)
+        if field in ('category_id', 'lat', 'lon'):
+            return getattr(self.columns, field)[rows].tolist()
+        if field == 'rating':
+            values = self.columns.rating[rows].tolist()
+            for i in self._rating_is_int[rows].nonzero()[0].tolist():
+                values[i] = int(values[i])
+            return values
+        if field in self._text:
+            return self._lookup(self._text[field][rows])
+        if field in self._lists:
+            offsets, items = self._lists[field]
+            starts = offsets[rows].astype(np.int64)
+            lengths = offsets[rows + 1] - starts
+            bounds = np.concatenate(([0], np.cumsum(lengths))).tolist()
+            # Vị trí trong items của mọi phần tử thuộc các dòng rows, theo đúng thứ tự
+            positions = np.arange(bounds[-1]) + np.repeat(starts - bounds[:-1], lengths)
+            values = self._lookup(items[positions])
+            return [values[start:end] for start, end in zip(bounds, bounds[1:])]
+        return [None] * len(rows)
+
+    def project_columns(self, rows, fields):
+        """
+        Giá trị `fields` (trường thiếu = None) của các dòng `rows` theo cột, dùng cho projection
+        fields=: (list cột giá trị, {vị trí trong rows: Restaurant} của các dòng có override,
+        giá trị của chúng phải tra qua Restaurant.get).
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        columns = [self._column_values(field, rows) for field in fields]
+        overrides = self._overrides
+        if len(overrides) < len(rows):
+            # Ít override hơn số dòng: tìm vị trí bằng np.isin thay vì tra từng dòng
+            positions = np.isin(rows, np.fromiter(overrides, dtype=np.int64, count=len(overrides))).nonzero()[0]
+            positions = positions.tolist()
+        else:
+            positions = [i for i, row in enumerate(rows.tolist()) if row in overrides]
+        return columns, {i: Restaurant(self, int(rows[i])) for i in positions}
+
+    def keys(self, row):
+        """Danh sách key của dòng theo đúng thứ tự record gốc."""
+        overrides = self._overrides.get(row)
+        if not overrides:
+            return RESTAURANT_FIELDS
+        keys = [f for f in RESTAURANT_FIELDS if overrides.get(f) is not _MISSING]
+        keys.extend(k for k in overrides if k not in RESTAURANT_FIELDS)
+        return keys
+
+    def to_dict(self, row):
+        """Dựng lại dict đầy đủ của 1 dòng (dùng khi cần serialize / sửa)."""
+        return {field: self.value(row, field) for field in self.keys(row)}
+
+
+class RestaurantsById(Mapping):
+    """Mapping chỉ đọc {restaurant_id: Restaurant} trên RestaurantStore (thay cho dict RESTAURANTS)."""
+
+    __slots__ = ('_store',)
+
+    def __init__(self, store):
+        self._store = store
+
+    def __getitem__(self, rid):
+        restaurant = self._store.get(rid)
+        if restaurant is None:
+            raise KeyError(rid)
+        return restaurant
+
+    def get(self, rid, default=None):
+        return self._store.get(rid, default)
+
+    def __contains__(self, rid):
+        return rid in self._store.columns.row_of
+
+    def __iter__(self):
+        # Theo thứ tự trong list nhà hàng (upsert giữ vị trí cũ), đọc ra list trước khi duyệt
+        columns = self._store.columns
+        return iter(columns.ids.take(columns.alive_rows()))
+
+    def __len__(self):
+        return len(self._store.columns.row_of)
+
+
+def build_store(restaurants, columns):
+    """Build RestaurantStore từ list dict nhà hàng và RestaurantColumns tương ứng."""
+    return RestaurantStore(restaurants, columns)
@@ -0,0 +1,195 @@
+# core/registry.py
+# --- Registry các generation dữ liệu: load lại nền + swap nguyên tử, không cần restart ---
+import os
+import threading
+import time
+
+from core.cache import invalidate_caches
+
+DATA_WATCH_INTERVAL = float(os.getenv('DATA_WATCH_INTERVAL', 5))  # Giây giữa 2 lần kiểm tra file
+# Dọn (build lại ở nền) khi số dòng chết > max(ngưỡng này, số nhà hàng còn sống)
+COMPACT_MIN_DEAD = int(os.getenv('DATA_COMPACT_MIN_DEAD', 1024))
+
+
+class ReloadInProgress(Exception):
+    """Đang có 1 lần reload chạy, không nhận thêm."""
+
+
+class DataRegistry:
+    """
+    Giữ Dataset hiện tại (1 "generation"). Reload build Dataset mới ở thread nền
+    rồi mới thay tham chiếu self._current trong 1 phép gán, nên request đang chạy
+    vẫn dùng trọn vẹn generation cũ.
+
+    Route lấy `data = DATA.current` 1 lần ở đầu request và chỉ dùng `data` đó.
+    """
+
+    def __init__(self, loader, watch_paths=()):
+        self._loader = loader
+        self._watch_paths = tuple(watch_paths)
+        self._reload_lock = threading.Lock()
+        self._write_lock = threading.Lock()  # Tuần tự hóa upsert/delete và swap generation
+        self._listeners = []
+        self._watcher = None
+        self._replay = None  # Change áp dụng trong lúc đang dọn ở nền (None = không dọn)
+        self.last_error = None
+        self.reloading = False
+
+        self._current = self._load()
+        self._current.version = 1
+        self._stamps = self._file_stamps()
+
+    @property
+    def current(self):
+        return self._current
+
+    @property
+    def version(self):
+        return self._current.version
+
+    def on_swap(self, listener):
+        """Đăng ký hàm listener(dataset) gọi ngay và sau mỗi lần swap generation."""
+        self._listeners.append(listener)
+        listener(self._current)
+
+    def _load(self):
+        started = time.perf_counter()
+        dataset = self._loader()
+        dataset.loaded_at = time.time()
+        dataset.load_seconds = round(time.perf_counter() - started, 3)
+        return dataset
+
+    def _file_stamps(self):
+        stamps = {}
+        for path in self._watch_paths:
+            try:
+                stat = os.stat(path)
+                stamps[path] = (stat.st_mtime_ns, stat.st_size)
+            except OSError:
+                stamps[path] = None
+        return stamps
+
+    def _swap_locked(self, dataset):
+        dataset.version = self._current.version + 1
+        self._current = dataset
+
+    def _published(self, dataset):
+        invalidate_caches()
+        for listener in self._listeners:
+            listener(dataset)
+        return dataset
+
+    def swap(self, dataset):
+        """Đưa dataset (đã build xong) vào làm generation hiện tại."""
+        with self._write_lock:
+            self._replay = None  # Bản đang dọn ở nền dựng từ dữ liệu cũ -> bỏ
+            self._swap_locked(dataset)
+        return self._published(dataset)
+
+    def apply(self, change):
+        """
+        Chạy change(dataset) trên bản clone() của generation hiện tại (upsert/delete tăng dần,
+        tuần tự với nhau) rồi swap như reload: request đang chạy vẫn đọc trọn vẹn generation cũ,
+        không thấy trạng thái sửa dở. Version mới làm cache key cũ không còn được dùng.
+        Thay đổi chỉ nằm trong bộ nhớ; reload từ file sẽ thay bằng dữ liệu trong file.
+        """
+        with self._write_lock:
+            dataset = self._current.clone()
+            result = change(dataset)
+            self._swap_locked(dataset)
+            if self._replay is not None:
+                self._replay.append(change)
+            elif dataset.dead_rows() > max(COMPACT_MIN_DEAD, len(dataset.restaurants_by_id)):
+                self._replay = []
+                threading.Thread(target=self._compact, args=(dataset,), name='data-compact', daemon=True).start()
+        self._published(dataset)
+        return result
+
+    def _compact(self, dataset):
+        """
+        Upsert ghi sang dòng mới nên dòng chết tăng dần: build lại Dataset từ nội dung của `dataset`
+        ở thread nền, chạy lại các change áp dụng trong lúc đó rồi swap. Reload xen vào thì bỏ.
+        """
+        replay = self._replay
+        try:
+            compacted = dataset.compacted()
+        except Exception as e:
+            print(f"❌ Dọn dữ liệu thất bại: {e}")
+            compacted = None
+        with self._write_lock:
+            if compacted is None or self._replay is not replay:
+                if self._replay is replay:
+                    self._replay = None
+                return
+            self._replay = None
+            for change in replay:
+                change(compacted)
+            compacted._content_tag = self._current.content_tag
+            self._swap_locked(compacted)
+        self._published(compacted)
+
+    def _reload(self):
+        try:
+            dataset = self._load()
+            if len(dataset.restaurants_by_id) == 0 and len(self._current.restaurants_by_id) > 0:
+                # load_data trả về [] khi file lỗi/đang ghi dở -> giữ generation cũ
+                raise ValueError("Dữ liệu mới rỗng, giữ nguyên generation hiện tại")
+            self.swap(dataset)
+            self.last_error = None
+            print(f"🔄 Đã reload dữ liệu: generation {dataset.version} ({len(dataset.restaurants_by_id)} nhà hàng).")
+        except Exception as e:
+            self.last_error = str(e)
+            print(f"❌ Reload dữ liệu thất bại: {e}")
+        finally:
+            self._stamps = self._file_stamps()
+            self.reloading = False
+            self._reload_lock.release()
+
+    def reload(self, wait=False):
+        """
+        Load generation mới ở thread nền. wait=True: chờ xong mới trả về.
+        Raise ReloadInProgress nếu đang có lần reload khác.
+        """
+        if not self._reload_lock.acquire(blocking=False):
+            raise ReloadInProgress("Đang reload dữ liệu")
+        self.reloading = True
+        thread = threading.Thread(target=self._reload, name='data-reload', daemon=True)
+        thread.start()
+        if wait:
+            thread.join()
+        return thread
+
+    def _watch_loop(self, interval):
+        while True:
+            time.sleep(interval)
+            stamps = self._file_stamps()
+            if stamps == self._stamps:
+                continue
+            # Chờ file ghi xong (không đổi trong 1 chu kỳ) rồi mới reload
+            time.sleep(interval)
+            if self._file_stamps() != stamps:
+                continue
+            try:
+                self.reload(wait=True)
+            except ReloadInProgress:
+                pass
+
+    def start_watching(self, interval=DATA_WATCH_INTERVAL):
+        """Bật chế độ theo dõi file nguồn: file đổi thì tự reload."""
+        if self._watcher is None:
+            self._watcher = threading.Thread(target=self._watch_loop, args=(interval,), name='data-watch', daemon=True)
+            self._watcher.start()
+        return self._watcher
+
+    def status(self):
+        dataset = self._current
+        return {
+            "version": dataset.version,
+            "loaded_at": dataset.loaded_at,
+            "load_seconds": dataset.load_seconds,
+            "restaurants": len(dataset.restaurants_by_id),
+            "menus": len(dataset.menus),
+            "reloading": self.reloading,
+            "watching": self._watcher is not None,
+            "last_error": self.last_error,
+        }
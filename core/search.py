@@ -1,6 +1,18 @@
-# Chứa các hàm normalize_text, search_algorithm
+# Chứa các hàm normalize_text, fold_text, search_algorithm
+import heapq
+import os
 import unicodedata
-from math import radians, sin, cos, sqrt, atan2
+from functools import lru_cache
+
+import numpy as np
+
+
+# Cách chấm điểm mặc định của search_algorithm: 'bm25' hoặc 'legacy' (+10/+5/+2 và rating*2 như cũ)
+SEARCH_SCORING = os.getenv('SEARCH_SCORING', 'bm25')
+SCORING_MODES = ('bm25', 'legacy')
+# Điểm cộng (chế độ bm25): mỗi 1 sao rating, và tối đa khi ở sát người dùng (giảm theo 1 / (1 + km))
+RATING_BOOST = float(os.getenv('SEARCH_RATING_BOOST', 0.5))
+DISTANCE_BOOST = float(os.getenv('SEARCH_DISTANCE_BOOST', 1.0))
 
 def normalize_text(text):
 	"""Normalize text - giữ nguyên dấu tiếng Việt để search chính xác hơn"""
@@ -8,20 +20,11 @@ def normalize_text(text):
 		return ""
 	return text.lower().strip()
 
-def calculate_distance(lat1, lon1, lat2, lon2):
-	"""Tính khoảng cách giữa 2 điểm (km) dùng Haversine formula."""
-	if not all([lat1, lon1, lat2, lon2]):
-		return None
-	try:
-		R = 6371  # Bán kính Trái Đất (km)
-		lat1, lon1, lat2, lon2 = map(radians, [lat1, lon1, lat2, lon2])
-		dlat = lat2 - lat1
-		dlon = lon2 - lon1
-		a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
-		c = 2 * atan2(sqrt(a), sqrt(1-a))
-		return R * c
-	except:
-		return None
+@lru_cache(maxsize=8192)
+def fold_text(text):
+	"""Normalize + bỏ dấu tiếng Việt: "Phở Hà Nội" -> "pho ha noi" (NFD, bỏ dấu, đ -> d)"""
+	decomposed = unicodedata.normalize('NFD', normalize_text(text).replace('đ', 'd'))
+	return ''.join(ch for ch in decomposed if not unicodedata.combining(ch))
 
 def parse_price_range(price_range_str):
 	"""
@@ -52,7 +55,10 @@ def parse_price_range(price_range_str):
 
 def search_algorithm(query, restaurants_db, menus_db, province=None, user_lat=None, user_lon=None, 
                      radius=None, categories=None, min_price=None, max_price=None, 
-                     min_rating=None, max_rating=None, tags=None):
+                     min_rating=None, max_rating=None, tags=None, search_index=None,
+                     columns=None, spatial_index=None, offset=0, limit=None,
+                     fuzzy=False, fuzzy_threshold=None, fuzzy_index=None, scoring=None,
+                     operator='auto', facets=None, version=None):
 	"""
 	Tìm kiếm và lọc nhà hàng với đầy đủ tham số
 	
@@ -67,151 +73,183 @@ def search_algorithm(query, restaurants_db, menus_db, province=None, user_lat=No
 		min_price, max_price: Khoảng giá (VND)
 		min_rating, max_rating: Khoảng rating
 		tags: List tags để lọc
+		search_index: SearchIndex đã build sẵn (core.database.SEARCH_INDEX),
+			None = build tạm từ restaurants_db/menus_db
+		columns: RestaurantColumns đã build sẵn (core.database.COLUMNS), row i
+			tương ứng restaurants_db[i]; None = build tạm từ restaurants_db
+		spatial_index: GridIndex đã build sẵn (core.database.SPATIAL_INDEX) cho
+			filter bán kính; None = build tạm từ columns
+		offset, limit: Phân trang kết quả, limit=None = lấy hết
+		fuzzy: True = tìm gần đúng theo trigram (chịu lỗi gõ sai / thiếu dấu / khoảng trắng),
+			chỉ giữ nhà hàng có độ giống >= fuzzy_threshold (None = FUZZY_THRESHOLD)
+		fuzzy_index: TrigramIndex đã build sẵn (core.database.FUZZY_INDEX),
+			None = build tạm từ restaurants_db/menus_db
+		scoring: 'bm25' (BM25F theo token + RATING_BOOST / DISTANCE_BOOST) hoặc
+			'legacy' (+10 name / +5 tag / +2 dish + rating*2), None = SEARCH_SCORING
+		facets: FacetIndex đã build sẵn (core.database.FACETS) cho filter category / tỉnh / tags,
+			None = build tạm từ restaurants_db
+		operator: Cách ghép các token của query khi scoring bm25: 'and' (đủ mọi token),
+			'or' (ít nhất 1 token), 'auto' (and, không có kết quả thì or)
+		version: Version dữ liệu (Dataset.version) để cache mask filter, None = không cache
+
+	Returns:
+		(results, total): results là trang kết quả đã xếp hạng, total là tổng số nhà hàng khớp
 	"""
 	normalized_query = normalize_text(query) if query else ""
-	normalized_province = normalize_text(province) if province else ""
-	
-	scores = {}  # restaurant_id: score
+	legacy = (scoring or SEARCH_SCORING) == 'legacy'
+	if columns is None:
+		from core.columns import build_columns
+		columns = build_columns(restaurants_db)
+
+	scores = {}  # restaurant_id: (score, restaurant)
 	distances = {}  # restaurant_id: distance (km)
-	# 1. Lọc theo province trước (nếu có)
-	filtered_restaurants = restaurants_db
-	if normalized_province:
-		# Lọc theo tên thành phố trong địa chỉ
-		# VD: "Thành phố Hồ Chí Minh", "Hà Nội", "Đà Nẵng"
-		filtered_restaurants = []
-		for r in restaurants_db:
-			address = normalize_text(r.get('address', ''))
-			# Kiểm tra nếu province xuất hiện trong địa chỉ
-			if normalized_province in address:
-				filtered_restaurants.append(r)
 
-	
-	# 1. Áp dụng tất cả filters trước
+	# 1-3. Filter category / tỉnh / tags (bitset) -> giá / rating (cột số) -> bán kính, qua FilterPlan
+	from core.filters import FilterPlan
+	if facets is None:
+		from core.facets import build_facets
+		facets = build_facets(restaurants_db)
+	if radius is not None and spatial_index is None and user_lat is not None and user_lon is not None:
+		from core.spatial_index import build_spatial_index
+		spatial_index = build_spatial_index(columns)
+	located = user_lat is not None and user_lon is not None
+	# bm25 chỉ cần khoảng cách của các nhà hàng được chấm điểm -> không bán kính thì không để
+	# plan tính khoảng cách cho mọi row
+	bm25 = bool(normalized_query) and not fuzzy and not legacy
+	plan_lat, plan_lon = (user_lat, user_lon) if radius is not None or not bm25 else (None, None)
+	plan = FilterPlan(
+		categories=categories, province=province, tags=tags,
+		min_price=min_price, max_price=max_price, min_rating=min_rating, max_rating=max_rating,
+		lat=plan_lat, lon=plan_lon, radius_km=radius, keep_unlocated=True,
+	)
+	rows, row_distances = plan.execute(columns, facets, restaurants_db, spatial_index, version=version)
+
+	if bm25:
+		# BM25F: query tách token, AND / OR trên posting list; chỉ nhà hàng khớp mới có trong kết quả.
+		# Index lọc ứng viên theo mask row ID, điểm gồm luôn rating + khoảng cách để dừng sớm khi
+		# đã đủ top (offset + limit); chỉ nhà hàng thuộc trang kết quả mới được dựng dict
+		if search_index is None:
+			from core.search_index import build_search_index
+			search_index = build_search_index(restaurants_db, menus_db)
+		return _search_bm25(
+			search_index, normalized_query, operator, restaurants_db, columns, rows,
+			(user_lat, user_lon) if located else None, offset, limit,
+		)
+
 	filtered_restaurants = []
-	for r in restaurants_db:
-		# Filter by province
-		if normalized_province:
-			address = normalize_text(r.get('address', ''))
-			if normalized_province not in address:
-				continue
-		
-		# Filter by distance/radius
-		if user_lat is not None and user_lon is not None and radius is not None:
-			rest_lat = r.get('lat')
-			rest_lon = r.get('lon')
-			if rest_lat and rest_lon:
-				dist = calculate_distance(user_lat, user_lon, rest_lat, rest_lon)
-				if dist is not None:
-					if dist > radius:
-						continue
-					distances[str(r['id'])] = dist
-		
-		# Filter by category
-		if categories is not None:
-			if r.get('category_id') not in categories:
-				continue
-		
-		# Filter by price range
-		if min_price is not None or max_price is not None:
-			price_range = r.get('price_range', '')
-			rest_min, rest_max = parse_price_range(price_range)
-			
-			if min_price is not None and rest_max < min_price:
-				continue
-			if max_price is not None and rest_min > max_price:
-				continue
-		
-		# Filter by rating
-		rating = r.get('rating', 0)
-		if min_rating is not None and rating < min_rating:
-			continue
-		if max_rating is not None and rating > max_rating:
-			continue
-		
-		# Filter by tags
-		if tags:
-			restaurant_tags = r.get('tags', [])
-			if not any(tag in restaurant_tags for tag in tags):
-				continue
-		
-		# Passed all filters
+	for row in rows.tolist():
+		r = restaurants_db[row]
 		filtered_restaurants.append(r)
-	
-	# 2. Tính khoảng cách cho tất cả nhà hàng đã lọc (nếu có tọa độ)
-	if user_lat is not None and user_lon is not None:
-		for r in filtered_restaurants:
-			rid = str(r['id'])
-			if rid not in distances:  # Chưa tính trong filter radius
-				rest_lat = r.get('lat')
-				rest_lon = r.get('lon')
-				if rest_lat and rest_lon:
-					dist = calculate_distance(user_lat, user_lon, rest_lat, rest_lon)
-					if dist is not None:
-						distances[rid] = dist
-	
-	# 3. Tính điểm cho từng nhà hàng
-	# Nếu không có query text, tất cả đều có điểm cơ bản
-	if not normalized_query:
-		for restaurant in filtered_restaurants:
-			rid = str(restaurant['id'])
-			scores[rid] = 1  # điểm cơ bản
+		if row in row_distances:
+			distances[str(r['id'])] = row_distances[row]
+
+	# 4. Tính điểm cho từng nhà hàng
+	if normalized_query and fuzzy:
+		# Tìm gần đúng: điểm = độ giống trigram x trọng số trường, nhà hàng không đủ giống bị loại
+		if fuzzy_index is None:
+			from core.fuzzy_index import build_fuzzy_index
+			fuzzy_index = build_fuzzy_index(restaurants_db, menus_db)
+		text_scores = fuzzy_index.match(normalized_query, fuzzy_threshold)
+		filtered_restaurants = [r for r in filtered_restaurants if str(r['id']) in text_scores]
+		base_score = 0
+	elif normalized_query:
+		# Legacy: name +10 / tag +5 / dish +2 lấy từ posting list của inverted index
+		if search_index is None:
+			from core.search_index import build_search_index
+			search_index = build_search_index(restaurants_db, menus_db)
+		text_scores = search_index.match(normalized_query)
+		base_score = 0
 	else:
-		# 2. Tìm trong Tên nhà hàng (ưu tiên cao nhất)
-		for restaurant in filtered_restaurants:
-			rid = str(restaurant['id'])
-			normalized_name = normalize_text(restaurant.get('name'))
-			# Tìm từ chính xác (word boundary)
-			words = normalized_name.split()
-			if normalized_query in words or normalized_query in normalized_name:
-				scores[rid] = scores.get(rid, 0) + 10  # match name: +10
-
-		# 3. Tìm trong Tags nhà hàng (ưu tiên vừa)
-		for restaurant in filtered_restaurants:
-			rid = str(restaurant['id'])
-			normalized_tags = [normalize_text(tag) for tag in restaurant.get('tags', [])]
-			if any(normalized_query in tag for tag in normalized_tags):
-				scores[rid] = scores.get(rid, 0) + 5  # match tag: +5
-
-		# 4. Tìm trong Tên món ăn (ưu tiên thấp hơn)
-		# menus_db bây giờ là MENUS_BY_RESTAURANT_ID (dict: restaurant_id -> [menu items])
-		filtered_ids = {str(r['id']) for r in filtered_restaurants}
-		for restaurant_id, menu_items in menus_db.items():
-			if restaurant_id not in filtered_ids:
-				continue
-			for item in menu_items:
-				normalized_dish = normalize_text(item.get('dish_name'))
-				if normalized_query in normalized_dish:
-					scores[restaurant_id] = scores.get(restaurant_id, 0) + 2  # match dish: +2
-					break
-
-	# 4. Cộng thêm điểm theo rating cho tất cả nhà hàng
+		# Nếu không có query text, tất cả đều có điểm cơ bản
+		text_scores = {}
+		base_score = 1
+
+	# 5. Cộng thêm điểm theo rating (và khoảng cách, chế độ fuzzy) cho tất cả nhà hàng
 	for restaurant in filtered_restaurants:
 		rid = str(restaurant['id'])
-		if rid not in scores:
-			scores[rid] = 0
+		score = text_scores.get(rid, base_score)
 		
 		rating = restaurant.get('rating')
-		if isinstance(rating, (int, float)):
-			scores[rid] += rating * 2  # mỗi 1 điểm rating = +2 điểm
-
-	# 5. Biên soạn kết quả, sắp xếp theo điểm giảm dần, sau đó theo khoảng cách tăng dần
-	restaurants_dict = {str(r['id']): r for r in filtered_restaurants}
-	if distances:
-		# Nếu có khoảng cách, sắp xếp theo score trước, rồi distance
-		sorted_results = sorted(
-			scores.items(), 
-			key=lambda x: (-x[1], distances.get(x[0], float('inf')))
-		)
+		if legacy:
+			if isinstance(rating, (int, float)):
+				score += rating * 2  # mỗi 1 điểm rating = +2 điểm
+		else:
+			if isinstance(rating, (int, float)):
+				score += rating * RATING_BOOST
+			if rid in distances:
+				score += DISTANCE_BOOST / (1 + distances[rid])
+			score = round(score, 4)
+		scores[rid] = (score, restaurant)
+
+	# 6. Sắp xếp theo điểm giảm dần, sau đó theo khoảng cách tăng dần (giữ thứ tự gốc khi bằng nhau).
+	# Có limit thì chỉ chọn top (offset + limit) bằng heap thay vì sort toàn bộ
+	total = len(scores)
+	ranked = (
+		(-score, distances.get(rid, float('inf')), seq, rid)
+		for seq, (rid, (score, _)) in enumerate(scores.items())
+	)
+	if limit is None:
+		selected = sorted(ranked)[offset:]
 	else:
-		# Chỉ sắp xếp theo score
-		sorted_results = sorted(scores.items(), key=lambda x: x[1], reverse=True)
+		selected = heapq.nsmallest(offset + limit, ranked)[offset:]
 	
+	# Chỉ tạo bản sao cho các nhà hàng thuộc trang được yêu cầu
+	final_results = []
+	for neg_score, _, _, res_id in selected:
+		res = dict(scores[res_id][1])
+		res['score'] = -neg_score
+		if res_id in distances:
+			res['distance'] = round(distances[res_id], 2)  # km, làm tròn 2 chữ số
+		final_results.append(res)
+	return final_results, total
+
+
+def _search_bm25(search_index, normalized_query, operator, restaurants_db, columns, rows, location, offset, limit):
+	"""
+	Nhánh bm25 của search_algorithm: rows là mảng row ID đã qua filter, location là (lat, lon)
+	hoặc None. Khoảng cách chỉ tính cho các nhà hàng được index chấm điểm.
+	"""
+	from core.geo import haversine_km
+
+	mask = np.zeros(len(restaurants_db), dtype=bool)
+	mask[rows] = True
+	has_coords = columns.has_coords() if location is not None else None
+
+	def distances_of(candidates):
+		"""Khoảng cách (km) tới các row ID, NaN = nhà hàng không có tọa độ."""
+		distances = np.full(len(candidates), np.nan)
+		if location is not None:
+			located = has_coords[candidates]
+			distances[located] = haversine_km(columns, location[0], location[1], candidates[located])
+		return distances
+
+	def distance_boost(candidates):
+		distances = distances_of(candidates)
+		return np.where(np.isnan(distances), 0.0, DISTANCE_BOOST / (1 + distances))
+
+	row_scores, total = search_index.search(
+		normalized_query, operator=operator, mask=mask,
+		k=None if limit is None else offset + limit,
+		rank_boost=RATING_BOOST,
+		extra=distance_boost if location is not None else None,
+		extra_max=DISTANCE_BOOST if location is not None else 0.0,
+	)
+
+	# Sắp theo điểm giảm dần, rồi khoảng cách tăng dần, rồi vị trí trong list nguồn (thứ tự gốc)
+	scored_rows = np.fromiter(row_scores, dtype=np.int64, count=len(row_scores))
+	distances = dict(zip(scored_rows.tolist(), np.nan_to_num(distances_of(scored_rows), nan=np.inf).tolist()))
+	positions = dict(zip(scored_rows.tolist(), columns.position[scored_rows].tolist()))
+	ranked = ((-score, distances[row], positions[row], row) for row, score in row_scores.items())
+	if limit is None:
+		selected = sorted(ranked)[offset:]
+	else:
+		selected = heapq.nsmallest(offset + limit, ranked)[offset:]
+
 	final_results = []
-	for res_id, score in sorted_results:
-		if res_id in restaurants_dict:
-			res = dict(restaurants_dict[res_id])
-			res['score'] = score
-			if res_id in distances:
-				res['distance'] = round(distances[res_id], 2)  # km, làm tròn 2 chữ số
-			final_results.append(res)
-	return final_results
+	for neg_score, distance, _, row in selected:
+		res = dict(restaurants_db[row])
+		res['score'] = -neg_score
+		if distance != float('inf'):
+			res['distance'] = round(distance, 2)  # km, làm tròn 2 chữ số
+		final_results.append(res)
+	return final_results, total
@@ -0,0 +1,608 @@
+# core/search_index.py
+# --- Inverted index cho tìm kiếm nhà hàng (build 1 lần khi load data) ---
+import copy
+import heapq
+import math
+import os
+import re
+from bisect import bisect_left
+from collections import Counter, defaultdict
+
+import numpy as np
+
+from core.records import PackedIndex, PackedStrings, bisect_strings, pack_strings
+from core.search import fold_text, normalize_text
+from core.versioned import AppendList, LayeredDict, append_to
+
+# Bit đánh dấu token xuất hiện ở trường nào
+FIELD_NAME = 1
+FIELD_TAG = 2
+FIELD_DISH = 4
+FIELDS = (FIELD_NAME, FIELD_TAG, FIELD_DISH)
+
+# Trọng số điểm theo trường (giữ nguyên +10 name, +5 tag, +2 dish)
+FIELD_WEIGHTS = {
+    FIELD_NAME: 10,
+    FIELD_TAG: 5,
+    FIELD_DISH: 2,
+}
+
+# Tham số BM25F (xem SearchIndex.search)
+BM25_K1 = float(os.getenv('BM25_K1', 1.2))
+BM25_B = float(os.getenv('BM25_B', 0.75))
+BM25_FIELD_BOOSTS = {
+    FIELD_NAME: 3.0,
+    FIELD_TAG: 1.5,
+    FIELD_DISH: 1.0,
+}
+
+# Giá trị trong posting: 3 bit thấp là bitmask trường, phía trên là tần suất token ở từng trường
+_TF_SHIFT = {FIELD_NAME: 3, FIELD_TAG: 11, FIELD_DISH: 19}
+_TF_MAX = 255
+_FIELD_MASK = FIELD_NAME | FIELD_TAG | FIELD_DISH
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text):
+    """Tách text đã normalize thành list token (chữ/số)."""
+    return _TOKEN_RE.findall(normalize_text(text))
+
+
+def token_counts(text):
+    """
+    Số lần xuất hiện của từng token đưa vào index: mỗi token tính cả dạng có dấu
+    lẫn dạng bỏ dấu ("phở" -> "phở", "pho").
+    """
+    tokens = tokenize(text)
+    counts = Counter(tokens)
+    for token in tokens:
+        folded = fold_text(token)
+        if folded != token:
+            counts[folded] += 1
+    return counts
+
+
+def index_tokens(text):
+    """
+    Token đưa vào index: mỗi token lưu cả dạng có dấu lẫn dạng bỏ dấu ("phở" -> "phở", "pho").
+    Query có dấu chỉ khớp dạng có dấu, query không dấu khớp cả hai qua dạng bỏ dấu.
+    """
+    return set(token_counts(text))
+
+
+def field_score(mask):
+    """Tổng trọng số của các trường có trong bitmask."""
+    return sum(weight for field, weight in FIELD_WEIGHTS.items() if mask & field)
+
+
+def _tf(value, field):
+    return (value >> _TF_SHIFT[field]) & _TF_MAX
+
+
+def _add_tf(value, field, count):
+    """Cộng tần suất token ở trường field vào giá trị posting (bật luôn bit trường)."""
+    tf = min(_tf(value, field) + count, _TF_MAX)
+    return (value & ~(_TF_MAX << _TF_SHIFT[field])) | field | (tf << _TF_SHIFT[field])
+
+
+def _clear_fields(value, fields):
+    """Bỏ bit + tần suất của các trường trong bitmask fields."""
+    for field in FIELDS:
+        if fields & field:
+            value &= ~(field | (_TF_MAX << _TF_SHIFT[field]))
+    return value
+
+
+def rating_rank(rating):
+    """Thứ hạng tĩnh của nhà hàng (rating, thiếu / không hợp lệ = 0)."""
+    return float(rating) if isinstance(rating, (int, float)) else 0.0
+
+
+def gallop_intersect(small, large):
+    """
+    Giao 2 mảng ordinal đã sort: mỗi phần tử của mảng ngắn được tìm nhị phân trong mảng dài
+    (np.searchsorted) nên chi phí O(m log n) thay vì O(m + n).
+    """
+    if not len(small) or not len(large):
+        return small[:0]
+    positions = np.minimum(np.searchsorted(large, small), len(large) - 1)
+    return small[large[positions] == small]
+
+
+def _intersect_all(lists):
+    lists = sorted(lists, key=len)  # List ngắn nhất trước để các bước giao sau rẻ hơn
+    result = lists[0]
+    for other in lists[1:]:
+        if not len(result):
+            break
+        result = gallop_intersect(result, other)
+    return result
+
+
+def _union_all(lists):
+    return np.unique(np.concatenate(lists))
+
+
+OPERATORS = ('auto', 'and', 'or')
+
+NO_ROW = -1  # Ordinal không ứng với nhà hàng nào (menu của restaurant_id không tồn tại)
+_SCORE_CHUNK = 64  # Số ordinal chấm điểm đợt đầu khi cần top k, các đợt sau gấp đôi
+
+_EMPTY_ORDINALS = np.empty(0, dtype=np.int32)
+_EMPTY_VALUES = np.empty(0, dtype=np.int32)
+_EMPTY_WEIGHTS = np.empty(0, dtype=np.float64)
+
+
+def _sorted_insert(items, value):
+    """List mới = items + value (giữ thứ tự sort), không sửa list cũ."""
+    i = bisect_left(items, value)
+    return list(items[:i]) + [value] + list(items[i:])
+
+
+class SearchIndex:
+    """
+    Inverted index: token -> posting list các ordinal nhà hàng đã sort, kèm giá trị
+    (bitmask trường + tần suất token theo trường) và trọng số BM25F tính sẵn.
+    Query chỉ tra posting list của các token khớp, không quét toàn bộ nhà hàng.
+    Token được index ở cả dạng có dấu và bỏ dấu (xem index_tokens).
+
+    Mỗi nhà hàng có 1 ordinal theo thứ hạng tĩnh (rating giảm dần) và row ID tương ứng
+    (core/columns.py); search() duyệt posting theo ordinal nên gặp nhà hàng rating cao
+    trước và dừng sớm được, lọc theo mask row ID mà không cần tới restaurant_id.
+
+    Sau finalize() posting của mọi token nằm trong vài mảng NumPy dạng CSR theo danh sách
+    token đã sort (_vocab); load từ snapshot thì các mảng này trỏ thẳng vào mmap.
+    Mỗi lần update nhà hàng nhận ordinal mới ở cuối, ordinal cũ chỉ bị đánh dấu chết trong
+    _live (không gỡ khỏi posting, truy vấn tự bỏ qua). Posting và mảng theo ordinal vì thế
+    chỉ ghi thêm (AppendArray, posting đã sửa nằm ở _overlay) nên update() không chép posting
+    và clone() chỉ chép phần đã sửa. Ordinal từ _sorted_count trở đi không theo thứ tự rating:
+    search() chấm hết phần này rồi mới dừng sớm trên phần đầu.
+    """
+
+    def __init__(self):
+        self._building = defaultdict(dict)  # token -> {restaurant_id: giá trị}, chỉ dùng khi add()
+        self._building_lengths = {}  # restaurant_id -> (số token name, tag, dish), chỉ dùng khi add()
+        self._vocab = []  # Token đã sort (list hoặc PackedStrings)
+        self._offsets = np.zeros(1, dtype=np.int64)  # Posting của _vocab[i]: [offsets[i], offsets[i + 1])
+        self._post_ordinals = _EMPTY_ORDINALS
+        self._post_values = _EMPTY_VALUES
+        self._post_weights = _EMPTY_WEIGHTS
+        self._max_weights = _EMPTY_WEIGHTS  # Trọng số lớn nhất của từng token (cận trên để dừng sớm)
+        self._overlay = LayeredDict()  # token -> (ordinals, values, weights, max_weight) sau update, None = đã gỡ
+        self._removed = 0  # Số token của _vocab đã gỡ qua update()
+        self._df = LayeredDict()  # token -> số ordinal còn sống trong posting (token đã sửa qua update())
+        self._new_vocab = []  # Token thêm qua update() không có trong _vocab (đã sort)
+        self._order = AppendList()  # ordinal -> restaurant_id (kể cả ordinal đã gỡ)
+        self._ordinal = LayeredDict()  # restaurant_id -> ordinal hiện tại
+        self._rows = np.empty(0, dtype=np.int64)  # ordinal -> row ID (NO_ROW = không có nhà hàng)
+        self._static = _EMPTY_WEIGHTS  # ordinal -> thứ hạng tĩnh (rating)
+        self._doc_lengths = np.zeros((0, len(FIELDS)), dtype=np.int32)  # ordinal -> số token name, tag, dish
+        self._live = np.empty(0, dtype=bool)  # ordinal -> còn là ordinal hiện tại của nhà hàng
+        self._n_docs = 0  # Số nhà hàng có ít nhất 1 token (N trong IDF)
+        self._avg_lengths = (0.0, 0.0, 0.0)
+        self._sorted_count = 0  # Các ordinal < _sorted_count theo rating giảm dần (từ finalize)
+        self._appenders = LayeredDict()  # Tên mảng / (mảng posting, token) -> AppendArray, xem core/versioned.py
+
+    def __len__(self):
+        """Số token trong index (gồm cả token chỉ còn ordinal chết tới lần build lại)."""
+        return len(self._vocab) + len(self._new_vocab) - self._removed
+
+    def clone(self):
+        """Bản copy-on-write (xem docstring lớp): chỉ chép các tầng delta và danh sách AppendArray."""
+        index = copy.copy(self)
+        index._overlay = self._overlay.clone()
+        index._ordinal = self._ordinal.clone()
+        index._df = self._df.clone()
+        index._appenders = self._appenders.clone()
+        return index
+
+    def _merged(self):
+        """(vocab, offsets, ordinals, values, weights, max_weights) gộp cả _overlay, dạng CSR."""
+        if not self._overlay and self._live.all():
+            return (self._vocab, self._offsets, self._post_ordinals, self._post_values,
+                    self._post_weights, self._max_weights)
+        live = self._live
+        vocab, postings = [], []
+        for token in sorted((set(self._vocab) | set(self._new_vocab)) - {t for t, e in self._overlay.items() if e is None}):
+            ordinals, values, weights, max_weight = self._posting(token)
+            keep = live[ordinals]
+            if keep.any():
+                vocab.append(token)
+                postings.append((ordinals[keep], values[keep], weights[keep], max_weight))
+        offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+        np.cumsum([len(ordinals) for ordinals, _, _, _ in postings], out=offsets[1:])
+        parts = list(zip(*postings)) if postings else [(), (), (), ()]
+        return (
+            vocab, offsets,
+            np.concatenate(parts[0] or [_EMPTY_ORDINALS]).astype(np.int32),
+            np.concatenate(parts[1] or [_EMPTY_VALUES]).astype(np.int32),
+            np.concatenate(parts[2] or [_EMPTY_WEIGHTS]).astype(np.float64),
+            np.array(parts[3], dtype=np.float64),
+        )
+
+    def snapshot_state(self):
+        """
+        Trạng thái để ghi snapshot nhị phân (core/snapshot.py): toàn bộ là mảng (posting CSR,
+        token / restaurant_id gói UTF-8) nên worker đọc thẳng từ mmap.
+        """
+        vocab, offsets, ordinals, values, weights, max_weights = self._merged()
+        vocab, order = pack_strings(vocab), pack_strings(self._order)
+        # restaurant_id -> ordinal hiện tại: vị trí ordinal sort theo restaurant_id (PackedIndex)
+        live = PackedIndex.sorted_positions(order, [self._ordinal[rid] for rid in self._ordinal])
+        return {
+            'vocab_blob': vocab.blob,
+            'vocab_offsets': vocab.offsets,
+            'offsets': offsets,
+            'ordinals': ordinals,
+            'values': values,
+            'weights': weights,
+            'max_weights': max_weights,
+            'order_blob': order.blob,
+            'order_offsets': order.offsets,
+            'rows': self._rows,
+            'static': self._static,
+            'doc_lengths': self._doc_lengths,
+            'live_ordinals': live,
+            'n_docs': self._n_docs,
+            'avg_lengths': list(self._avg_lengths),
+            'sorted_count': self._sorted_count,
+        }
+
+    @classmethod
+    def from_snapshot(cls, state):
+        index = cls()
+        index._vocab = PackedStrings(state['vocab_blob'], state['vocab_offsets'])
+        index._offsets = state['offsets']
+        index._post_ordinals = state['ordinals']
+        index._post_values = state['values']
+        index._post_weights = state['weights']
+        index._max_weights = state['max_weights']
+        order = PackedStrings(state['order_blob'], state['order_offsets'])
+        index._order = AppendList(order)
+        index._ordinal = LayeredDict(PackedIndex(order, state['live_ordinals']))
+        index._rows = state['rows']
+        index._static = state['static']
+        index._doc_lengths = state['doc_lengths']
+        index._n_docs = state['n_docs']
+        index._avg_lengths = tuple(state['avg_lengths'])
+        index._sorted_count = state['sorted_count']
+        index._live = np.zeros(len(order), dtype=bool)
+        index._live[state['live_ordinals']] = True
+        return index
+
+    # --- Build ---
+
+    def _add_tokens(self, rid, text, field):
+        length = len(tokenize(text))
+        if not length:
+            return
+        for token, count in token_counts(text).items():
+            posting = self._building[token]
+            posting[rid] = _add_tf(posting.get(rid, 0), field, count)
+        lengths = list(self._building_lengths.get(rid, (0, 0, 0)))
+        lengths[FIELDS.index(field)] += length
+        self._building_lengths[rid] = tuple(lengths)
+
+    def add(self, rid, name=None, tags=None, dish_names=None):
+        """Thêm các trường tìm kiếm của 1 nhà hàng vào index (gọi finalize() sau khi add xong)."""
+        rid = str(rid)
+        self._add_tokens(rid, name, FIELD_NAME)
+        for tag in tags or []:
+            self._add_tokens(rid, tag, FIELD_TAG)
+        for dish in dish_names or []:
+            self._add_tokens(rid, dish, FIELD_DISH)
+
+    def finalize(self, static_rank=None, rows=None):
+        """
+        Tính độ dài trung bình từng trường, ordinal theo static_rank ({restaurant_id: rating},
+        cao trước) kèm row ID (rows: {restaurant_id: row}) và trọng số BM25F của toàn bộ
+        posting, rồi gói posting thành mảng CSR.
+        """
+        static_rank = static_rank or {}
+        rows = rows or {}
+        doc_lengths = self._building_lengths
+        self._n_docs = len(doc_lengths)
+        if doc_lengths:
+            totals = [sum(lengths[i] for lengths in doc_lengths.values()) for i in range(len(FIELDS))]
+            self._avg_lengths = tuple(total / len(doc_lengths) for total in totals)
+
+        order = sorted(doc_lengths, key=lambda rid: -static_rank.get(rid, 0.0))
+        ordinal = {rid: o for o, rid in enumerate(order)}
+        self._order, self._ordinal = AppendList(order), LayeredDict(ordinal)
+        self._rows = np.array([rows.get(rid, NO_ROW) for rid in order], dtype=np.int64)
+        self._static = np.array([static_rank.get(rid, 0.0) for rid in order], dtype=np.float64)
+        self._doc_lengths = np.array([doc_lengths[rid] for rid in order], dtype=np.int32).reshape(-1, len(FIELDS))
+        self._sorted_count = len(order)
+        self._live = np.ones(len(order), dtype=bool)
+        self._appenders = LayeredDict()
+
+        vocab = sorted(self._building)
+        offsets, ordinals, values, weights, max_weights = [0], [], [], [], []
+        for token in vocab:
+            posting = self._building[token]
+            idf = self._idf(len(posting))
+            entries = sorted((ordinal[rid], value, self._weight(idf, doc_lengths[rid], value))
+                             for rid, value in posting.items())
+            ordinals.extend(entry[0] for entry in entries)
+            values.extend(entry[1] for entry in entries)
+            weights.extend(entry[2] for entry in entries)
+            max_weights.append(max(entry[2] for entry in entries))
+            offsets.append(len(ordinals))
+        self._vocab = vocab
+        self._offsets = np.array(offsets, dtype=np.int64)
+        self._post_ordinals = np.array(ordinals, dtype=np.int32)
+        self._post_values = np.array(values, dtype=np.int32)
+        self._post_weights = np.array(weights, dtype=np.float64)
+        self._max_weights = np.array(max_weights, dtype=np.float64)
+        self._overlay, self._removed, self._new_vocab, self._df = LayeredDict(), 0, [], LayeredDict()
+        self._building, self._building_lengths = defaultdict(dict), {}
+
+    def _idf(self, df):
+        n = self._n_docs
+        return math.log(1 + (n - df + 0.5) / (df + 0.5))
+
+    def _weight(self, idf, lengths, value):
+        """
+        BM25F: tần suất ở từng trường được chuẩn hóa theo độ dài trường (lengths) rồi cộng
+        có trọng số (BM25_FIELD_BOOSTS), sau đó bão hòa bằng k1 như BM25 thường.
+        """
+        tf = 0.0
+        for i, field in enumerate(FIELDS):
+            count = _tf(value, field)
+            if count:
+                avg = self._avg_lengths[i] or 1.0
+                tf += BM25_FIELD_BOOSTS[field] * count / (1 - BM25_B + BM25_B * lengths[i] / avg)
+        return idf * tf * (BM25_K1 + 1) / (tf + BM25_K1)
+
+    # --- Tra posting ---
+
+    def _base_index(self, token):
+        vocab = self._vocab
+        i = bisect_strings(vocab, token)
+        return i if i < len(vocab) and vocab[i] == token else None
+
+    def _posting(self, token):
+        """(ordinals, values, weights, max_weight) của 1 token trong index, không có thì None."""
+        if token in self._overlay:
+            return self._overlay[token]
+        i = self._base_index(token)
+        if i is None:
+            return None
+        start, end = int(self._offsets[i]), int(self._offsets[i + 1])
+        return (self._post_ordinals[start:end], self._post_values[start:end],
+                self._post_weights[start:end], float(self._max_weights[i]))
+
+    def _prefix_tokens(self, token):
+        """Các token trong index bắt đầu bằng `token`."""
+        matches = []
+        for vocab in (self._vocab, self._new_vocab):
+            end = bisect_strings(vocab, token)
+            while end < len(vocab) and vocab[end].startswith(token):
+                matches.append(vocab[end])
+                end += 1
+        overlay = self._overlay
+        return sorted(t for t in matches if t not in overlay or overlay[t] is not None)
+
+    def _term(self, token):
+        """
+        (mảng ordinal đã sort, mảng trọng số tương ứng, trọng số lớn nhất) của 1 token query
+        khớp theo prefix; nhiều token index khớp thì mỗi nhà hàng lấy trọng số cao nhất.
+        """
+        postings = [p for p in map(self._posting, self._prefix_tokens(token)) if p is not None]
+        if not postings:
+            return _EMPTY_ORDINALS, _EMPTY_WEIGHTS, 0.0
+        if len(postings) == 1:
+            ordinals, _, weights, max_weight = postings[0]
+            return ordinals, weights, max_weight
+        ordinals, inverse = np.unique(np.concatenate([p[0] for p in postings]), return_inverse=True)
+        best = np.zeros(len(ordinals))
+        np.maximum.at(best, inverse, np.concatenate([p[2] for p in postings]))
+        return ordinals, best, max(p[3] for p in postings)
+
+    def _expand(self, token):
+        """(mảng ordinal, bitmask trường) gộp của mọi token trong index bắt đầu bằng `token`."""
+        postings = [p for p in map(self._posting, self._prefix_tokens(token)) if p is not None]
+        if not postings:
+            return _EMPTY_ORDINALS, _EMPTY_VALUES
+        ordinals, inverse = np.unique(np.concatenate([p[0] for p in postings]), return_inverse=True)
+        masks = np.zeros(len(ordinals), dtype=np.int64)
+        np.bitwise_or.at(masks, inverse, np.concatenate([p[1] for p in postings]) & _FIELD_MASK)
+        return ordinals, masks
+
+    # --- Cập nhật tăng dần ---
+
+    def _set_posting(self, token, entry):
+        """Ghi posting mới của token vào _overlay (entry None = gỡ token khỏi index)."""
+        in_base = self._base_index(token) is not None
+        if not in_base:
+            i = bisect_left(self._new_vocab, token)
+            listed = i < len(self._new_vocab) and self._new_vocab[i] == token
+            if entry is None:
+                if listed:
+                    self._new_vocab = self._new_vocab[:i] + self._new_vocab[i + 1:]
+                    del self._overlay[token]
+                return
+            if not listed:
+                self._new_vocab = _sorted_insert(self._new_vocab, token)
+        elif (entry is None) != (self._overlay.get(token, ()) is None):
+            self._removed += 1 if entry is None else -1
+        self._overlay[token] = entry
+
+    def update(self, rid, old=(), new=(), rank=None, row=None):
+        """
+        Thay toàn bộ token của 1 nhà hàng: gỡ theo giá trị cũ `old`, thêm theo giá trị mới
+        `new` (list (text, field) của mọi trường, gồm cả tên món). Nhà hàng nhận ordinal mới
+        ở cuối, ordinal cũ thành ordinal chết (_live); mỗi posting của token mới chỉ nối thêm
+        1 phần tử (AppendArray, generation đang phục vụ không thấy). Trọng số BM25F tính theo
+        độ dài trường mới; IDF / độ dài trung bình của các nhà hàng khác giữ nguyên tới lần
+        build lại. rank: thứ hạng tĩnh (rating), row: row ID (None = không có nhà hàng, vd.
+        menu mồ côi). new rỗng thì chỉ gỡ (xóa nhà hàng).
+        """
+        rid = str(rid)
+        previous = self._ordinal.get(rid)
+        old_tokens = set()
+        if previous is not None:
+            old_tokens = {token for text, _ in old for token in index_tokens(text)}
+            del self._ordinal[rid]
+            self._n_docs -= 1
+
+        new_values = {}
+        lengths = [0] * len(FIELDS)
+        for text, field in new:
+            for token, count in token_counts(text).items():
+                new_values[token] = _add_tf(new_values.get(token, 0), field, count)
+            lengths[FIELDS.index(field)] += len(tokenize(text))
+        appenders = self._appenders
+        live = self._live  # Mảng bool 1 byte / ordinal: chép mỗi update như columns.alive
+        if not any(lengths):
+            new_values = {}
+            live = live.copy()
+        else:
+            ordinal = len(self._order)
+            self._order = self._order.append(rid)
+            self._ordinal[rid] = ordinal
+            live = np.append(live, True)
+            self._rows = append_to(appenders, 'rows', self._rows, [NO_ROW if row is None else row])
+            self._static = append_to(appenders, 'static', self._static, [0.0 if rank is None else rank])
+            self._doc_lengths = append_to(appenders, 'doc_lengths', self._doc_lengths, [lengths])
+            self._n_docs += 1
+        if previous is not None:
+            live[previous] = False
+        self._live = live
+
+        for token in old_tokens - set(new_values):
+            df = self._live_df(token, self._posting(token)) - 1
+            if df:
+                self._df[token] = df
+            else:
+                self._set_posting(token, None)
+                self._df.pop(token, None)
+        for token, value in new_values.items():
+            posting = self._posting(token)
+            ordinals, values, weights, max_weight = posting or (_EMPTY_ORDINALS, _EMPTY_VALUES, _EMPTY_WEIGHTS, 0.0)
+            df = self._live_df(token, posting) + (token not in old_tokens)
+            self._df[token] = df
+            weight = self._weight(self._idf(df), lengths, value)
+            # Ordinal mới lớn nhất -> nối vào cuối vẫn giữ posting đã sort; chỉ nâng cận trên
+            # max_weight (không hạ khi gỡ) nên vẫn đúng cho dừng sớm
+            self._set_posting(token, (
+                append_to(appenders, ('ordinals', token), ordinals, [ordinal]),
+                append_to(appenders, ('values', token), values, [value]),
+                append_to(appenders, ('weights', token), weights, [weight]),
+                max(max_weight, weight),
+            ))
+
+    def _live_df(self, token, posting):
+        """Số ordinal còn sống trong posting của token (token chưa sửa: độ dài posting lúc build)."""
+        if posting is None:
+            return 0
+        df = self._df.get(token)
+        return len(posting[0]) if df is None else df
+
+    # --- Truy vấn ---
+
+    def match(self, query):
+        """
+        Trả về {restaurant_id: điểm} cho các nhà hàng khớp query (điểm cố định +10/+5/+2).
+        Mỗi token của query khớp theo prefix; một trường chỉ được tính điểm
+        khi chứa đủ tất cả token của query.
+        """
+        tokens = tokenize(query)
+        if not tokens:
+            return {}
+
+        # Tra posting list ngắn nhất trước để giao nhanh hơn
+        postings = sorted((self._expand(t) for t in set(tokens)), key=lambda posting: len(posting[0]))
+        ordinals, masks = postings[0]
+        for other_ordinals, other_masks in postings[1:]:
+            if not len(ordinals):
+                break
+            ordinals, i, j = np.intersect1d(ordinals, other_ordinals, assume_unique=True, return_indices=True)
+            masks = masks[i] & other_masks[j]
+            ordinals, masks = ordinals[masks != 0], masks[masks != 0]
+
+        keep = self._live[ordinals]
+        order = self._order
+        return {order[o]: field_score(mask) for o, mask in zip(ordinals[keep].tolist(), masks[keep].tolist()) if mask}
+
+    def search(self, query, operator='auto', mask=None, k=None, rank_boost=0.0, extra=None, extra_max=0.0):
+        """
+        Tìm theo nhiều token (mỗi token khớp theo prefix, ở trường bất kỳ) và chấm điểm BM25F.
+            operator: 'and' = chứa mọi token, 'or' = chứa ít nhất 1 token,
+                'auto' = 'and', không nhà hàng nào chứa đủ thì chuyển sang 'or'
+            mask: mask bool theo row ID (đã qua các filter khác), None = mọi nhà hàng
+            k: chỉ cần top k -> chấm theo từng đợt ordinal (rating giảm dần), dừng khi nhà
+                hàng còn lại không thể vượt điểm thứ k
+        Điểm = tổng trọng số các token khớp + rating * rank_boost + extra(rows), với extra()
+        nhận mảng row ID, trả về mảng điểm cộng thêm <= extra_max. Trả về (scores, total):
+        scores = {row: điểm} của các nhà hàng đã chấm (chắc chắn chứa top k), total = tổng số
+        nhà hàng khớp.
+        """
+        tokens = list(dict.fromkeys(tokenize(query)))
+        if not tokens:
+            return {}, 0
+        terms = [self._term(token) for token in tokens]
+        lists = [ordinals for ordinals, _, _ in terms]
+        if operator == 'or':
+            docs = _union_all(lists)
+        else:
+            docs = _intersect_all(lists)
+            if not len(docs) and operator == 'auto' and len(lists) > 1:
+                docs = _union_all(lists)
+
+        # Ordinal -> row ID rồi lọc theo mask, không dựng restaurant_id / nhà hàng nào
+        rows = self._rows[docs]
+        keep = (rows != NO_ROW) & self._live[docs]
+        if mask is not None:
+            # Mask tính trước khi upsert có thể ngắn hơn: row mới không thuộc mask
+            keep &= rows < len(mask)
+            keep[keep] = mask[rows[keep]]
+        docs, rows = docs[keep], rows[keep]
+
+        static = self._static
+        max_text = sum(max_weight for _, _, max_weight in terms) + extra_max + 1e-4
+        scores = {}
+
+        def score_chunk(chunk, chunk_rows):
+            score = np.zeros(len(chunk))
+            for ordinals, weights, _ in terms:
+                if len(ordinals):
+                    positions = np.minimum(np.searchsorted(ordinals, chunk), len(ordinals) - 1)
+                    score += np.where(ordinals[positions] == chunk, weights[positions], 0.0)
+            score = score + static[chunk] * rank_boost
+            if extra is not None:
+                score = score + extra(chunk_rows)
+            scores.update(zip(chunk_rows.tolist(), (round(value, 4) for value in score.tolist())))
+
+        # Ordinal thêm qua update() (phía sau, không theo thứ tự rating) chấm hết 1 lần
+        head = int(np.searchsorted(docs, self._sorted_count))
+        if head < len(docs):
+            score_chunk(docs[head:], rows[head:])
+        kth = None  # Điểm thứ k trong số đã chấm
+        start, size = 0, max(k or 0, _SCORE_CHUNK) if k else head
+        while start < head:
+            if kth is not None and kth > max_text + static[docs[start]] * rank_boost:
+                break
+            end = min(start + size, head)
+            score_chunk(docs[start:end], rows[start:end])
+            if k and len(scores) >= k:
+                kth = heapq.nlargest(k, scores.values())[-1]
+            start = end
+            size *= 2
+        return scores, len(docs)
+
+
+def build_search_index(restaurants, menus_by_restaurant_id):
+    """Build SearchIndex từ list nhà hàng (row ID = vị trí trong list) và menu đã nhóm theo restaurant_id."""
+    index = SearchIndex()
+    static_rank = {}
+    rows = {}
+    for row, r in enumerate(restaurants):
+        index.add(r['id'], name=r.get('name'), tags=r.get('tags', []))
+        static_rank[str(r['id'])] = rating_rank(r.get('rating'))
+        rows[str(r['id'])] = row
+    for restaurant_id, menu_items in menus_by_restaurant_id.items():
+        index.add(restaurant_id, dish_names=[item.get('dish_name') for item in menu_items])
+    index.finalize(static_rank, rows)
+    return index
@@ -0,0 +1,125 @@
+# core/snapshot.py
+# --- Snapshot nhị phân của Dataset để worker khởi động nhanh (không json.load + build index) ---
+#
+# Định dạng file:
+#   MAGIC (8 bytes) | độ dài header (uint64 little-endian) | header msgpack | các mảng NumPy
+# Header gồm version, fingerprint file nguồn, vị trí từng mảng (căn lề ALIGN bytes)
+# và các giá trị không phải mảng (dict, bytes...) theo từng thành phần.
+#
+# Các mảng (cột số kể cả cột dẫn xuất, bảng chuỗi UTF-8 + offsets, CSR posting, cây KD, ô lưới,
+# body JSON + bản nén của payload, menu dạng JSON gói) được đọc qua mmap
+# chỉ đọc: mọi worker gunicorn map cùng 1 file nên OS chia sẻ chung các trang nhớ,
+# RAM không tăng theo số worker. Ghi snapshot mới luôn qua file tạm + rename,
+# worker đang chạy vẫn giữ mapping tới file cũ.
+import hashlib
+import mmap
+import os
+import struct
+
+import msgpack
+import numpy as np
+
+from core.dataset import Dataset
+
+MAGIC = b'FOODSNAP'
+SNAPSHOT_VERSION = 15  # Tăng khi đổi định dạng / snapshot_state() của bất kỳ thành phần nào
+ALIGN = 64
+
+_HEADER_LEN = struct.Struct('<Q')
+
+
+class SnapshotError(Exception):
+    """Snapshot hỏng, sai version hoặc không khớp file nguồn."""
+
+
+def source_fingerprint(source_paths):
+    """sha256 nội dung từng file nguồn, dùng để biết snapshot còn khớp data/*.json không."""
+    fingerprint = {}
+    for path in source_paths:
+        with open(path, 'rb') as f:
+            fingerprint[os.path.basename(path)] = hashlib.sha256(f.read()).hexdigest()
+    return fingerprint
+
+
+def _aligned(offset):
+    return (offset + ALIGN - 1) // ALIGN * ALIGN
+
+
+def write_snapshot(path, dataset, source_paths):
+    """Ghi Dataset ra file snapshot (ghi file tạm rồi rename để worker không đọc file dở)."""
+    arrays = []  # (component, name, ndarray)
+    objects = {}
+    for component, state in dataset.snapshot_components().items():
+        objects[component] = {}
+        for name, value in state.items():
+            if isinstance(value, np.ndarray):
+                arrays.append((component, name, np.ascontiguousarray(value)))
+            else:
+                objects[component][name] = value
+
+    layout = {}
+    offset = 0
+    for component, name, array in arrays:
+        offset = _aligned(offset)
+        layout.setdefault(component, {})[name] = [array.dtype.str, list(array.shape), offset, array.nbytes]
+        offset += array.nbytes
+
+    header = msgpack.packb({
+        'version': SNAPSHOT_VERSION,
+        'sources': source_fingerprint(source_paths),
+        'arrays': layout,
+        'objects': objects,
+    }, use_bin_type=True)
+    data_start = _aligned(len(MAGIC) + _HEADER_LEN.size + len(header))
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC + _HEADER_LEN.pack(len(header)) + header)
+        for component, name, array in arrays:
+            f.seek(data_start + layout[component][name][2])
+            f.write(array.tobytes())
+        f.truncate(data_start + offset)  # Mảng rỗng ở cuối vẫn phải nằm trong file
+    os.replace(tmp_path, path)
+    return data_start + offset
+
+
+def read_snapshot(path):
+    """Map snapshot vào bộ nhớ, trả về (header, components) với mảng NumPy chỉ đọc trỏ thẳng vào mmap."""
+    with open(path, 'rb') as f:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    if buffer[:len(MAGIC)] != MAGIC:
+        raise SnapshotError(f"{path} không phải snapshot hợp lệ")
+    header_start = len(MAGIC) + _HEADER_LEN.size
+    (header_len,) = _HEADER_LEN.unpack_from(buffer, len(MAGIC))
+    header = msgpack.unpackb(buffer[header_start:header_start + header_len], raw=False, strict_map_key=False)
+    if header.get('version') != SNAPSHOT_VERSION:
+        raise SnapshotError(f"Snapshot version {header.get('version')} != {SNAPSHOT_VERSION}")
+
+    data_start = _aligned(header_start + header_len)
+    components = header['objects']
+    for component, arrays in header['arrays'].items():
+        for name, (dtype, shape, offset, nbytes) in arrays.items():
+            if data_start + offset + nbytes > len(buffer):
+                raise SnapshotError(f"Snapshot bị cắt cụt ở {component}/{name}")
+            array = np.frombuffer(buffer, dtype=np.dtype(dtype), count=int(np.prod(shape)), offset=data_start + offset)
+            components.setdefault(component, {})[name] = array.reshape(shape)
+    return header, components
+
+
+def load_snapshot(path, source_paths):
+    """
+    Dataset từ snapshot nếu file tồn tại, đúng version và khớp fingerprint file nguồn.
+    Ngược lại trả về None (kèm log lý do) để caller build lại từ JSON.
+    """
+    if not os.path.exists(path):
+        return None
+    try:
+        header, components = read_snapshot(path)
+        if header['sources'] != source_fingerprint(source_paths):
+            print(f" Snapshot {os.path.basename(path)} đã cũ so với data/*.json, build lại từ JSON.")
+            return None
+        return Dataset.from_snapshot_components(components)
+    except (OSError, ValueError, KeyError, SnapshotError, msgpack.UnpackException) as e:
+        print(f" LỖI khi đọc snapshot {path}: {e}")
+        return None
@@ -0,0 +1,392 @@
+# core/spatial_index.py
+# --- Spatial index dạng lưới lat/lon cho truy vấn bán kính / bounding box ---
+import copy
+import heapq
+import math
+from collections import defaultdict
+
+import numpy as np
+
+from core.geo import EARTH_RADIUS_KM, haversine_km, radius_bbox
+from core.versioned import LayeredDict
+
+DEFAULT_CELL_DEG = 0.01  # ~1.1 km mỗi ô theo vĩ độ
+KD_LEAF_SIZE = 16  # Số nhà hàng tối đa trong 1 lá của KD-tree
+
+_EMPTY_ROWS = np.empty(0, dtype=np.int64)
+
+
+def _valid_coords(lat, lon):
+    """Cùng tiêu chí với RestaurantColumns.has_coords() cho 1 điểm."""
+    return not (math.isnan(lat) or math.isnan(lon)) and lat != 0 and lon != 0
+
+
+class GridIndex:
+    """
+    Chia mặt phẳng lat/lon thành các ô vuông cell_deg độ, mỗi ô giữ row ID
+    (xem core/columns.py) của các nhà hàng nằm trong ô. Truy vấn chỉ duyệt
+    các ô giao với vùng tìm kiếm nên chi phí phụ thuộc mật độ quanh điểm hỏi.
+    """
+
+    def __init__(self, columns, cell_deg=DEFAULT_CELL_DEG):
+        self.columns = columns
+        self.cell_deg = cell_deg
+
+        buckets = defaultdict(list)
+        rows = columns.has_coords().nonzero()[0]
+        for row, lat, lon in zip(rows.tolist(), columns.lat[rows].tolist(), columns.lon[rows].tolist()):
+            buckets[self._cell(lat, lon)].append(row)
+        self._cells = LayeredDict({cell: np.array(cell_rows, dtype=np.int64) for cell, cell_rows in buckets.items()})
+
+    def __len__(self):
+        """Số ô có ít nhất 1 nhà hàng."""
+        return len(self._cells)
+
+    def snapshot_state(self):
+        """Trạng thái để ghi snapshot nhị phân: các ô dạng CSR (key, offsets, rows)."""
+        cells = list(self._cells.items())
+        sizes = [len(cell_rows) for _, cell_rows in cells]
+        return {
+            'cell_deg': self.cell_deg,
+            'cell_keys': np.array([cell for cell, _ in cells], dtype=np.int64).reshape(-1, 2),
+            'cell_offsets': np.concatenate(([0], np.cumsum(sizes, dtype=np.int64))),
+            'cell_rows': np.concatenate([cell_rows for _, cell_rows in cells]) if cells else _EMPTY_ROWS,
+        }
+
+    @classmethod
+    def from_snapshot(cls, state, columns):
+        index = cls.__new__(cls)
+        index.columns = columns
+        index.cell_deg = state['cell_deg']
+        offsets = state['cell_offsets'].tolist()
+        rows = state['cell_rows']
+        index._cells = LayeredDict({
+            (x, y): rows[offsets[i]:offsets[i + 1]]
+            for i, (x, y) in enumerate(state['cell_keys'].tolist())
+        })
+        return index
+
+    def clone(self, columns):
+        """Bản copy-on-write trên columns của generation mới (move() thay mảng của ô, chỉ chép ô đã sửa)."""
+        index = copy.copy(self)
+        index.columns = columns
+        index._cells = self._cells.clone()
+        return index
+
+    def _cell(self, lat, lon):
+        return (math.floor(lat / self.cell_deg), math.floor(lon / self.cell_deg))
+
+    def _row_cell(self, row):
+        if row is None:
+            return None
+        lat, lon = float(self.columns.lat[row]), float(self.columns.lon[row])
+        return self._cell(lat, lon) if _valid_coords(lat, lon) else None
+
+    def move(self, old_row, new_row):
+        """
+        Thay old_row bằng new_row (upsert ghi nhà hàng sang dòng mới, xem core/columns.py;
+        None = không có), ô theo tọa độ của từng dòng trong columns.
+        Chỉ chép lại mảng của các ô liên quan, các ô khác giữ nguyên.
+        """
+        old_cell = self._row_cell(old_row)
+        if old_cell in self._cells:
+            cell_rows = self._cells[old_cell]
+            remaining = cell_rows[cell_rows != old_row]
+            if len(remaining):
+                self._cells[old_cell] = remaining
+            else:
+                del self._cells[old_cell]
+        new_cell = self._row_cell(new_row)
+        if new_cell is not None:
+            self._cells[new_cell] = np.append(self._cells.get(new_cell, _EMPTY_ROWS), new_row)
+
+    def _candidate_rows(self, south, west, north, east):
+        """Row ID trong các ô giao với bbox (chưa lọc chính xác theo tọa độ)."""
+        min_x, min_y = self._cell(south, west)
+        max_x, max_y = self._cell(north, east)
+        n_cells = (max_x - min_x + 1) * (max_y - min_y + 1)
+
+        if n_cells <= len(self._cells):
+            cells = self._cells
+            chunks = [
+                cell_rows
+                for cell_rows in (cells.get((x, y)) for x in range(min_x, max_x + 1) for y in range(min_y, max_y + 1))
+                if cell_rows is not None
+            ]
+        else:
+            # Vùng hỏi rộng hơn số ô có dữ liệu -> duyệt các ô có dữ liệu
+            chunks = [
+                cell_rows for (x, y), cell_rows in list(self._cells.items())
+                if min_x <= x <= max_x and min_y <= y <= max_y
+            ]
+        if not chunks:
+            return _EMPTY_ROWS
+        return np.concatenate(chunks)
+
+    def query_bbox(self, south, west, north, east, mask=None):
+        """
+        Row ID (tăng dần) của nhà hàng nằm trong bbox (south, west, north, east).
+        west > east nghĩa là bbox vắt qua kinh tuyến 180.
+        """
+        if west > east:
+            return np.union1d(
+                self.query_bbox(south, west, north, 180.0, mask),
+                self.query_bbox(south, -180.0, north, east, mask),
+            )
+
+        rows = self._candidate_rows(south, west, north, east)
+        lat = self.columns.lat[rows]
+        lon = self.columns.lon[rows]
+        inside = (lat >= south) & (lat <= north) & (lon >= west) & (lon <= east)
+        if mask is not None:
+            inside &= mask[rows]
+        return np.sort(rows[inside])
+
+    def query_radius(self, lat, lon, radius_km, mask=None):
+        """
+        Trả về (rows, distances) của nhà hàng cách (lat, lon) không quá radius_km,
+        rows tăng dần. Chỉ tính haversine cho nhà hàng trong bbox của vòng tròn.
+        """
+        rows = self.query_bbox(*radius_bbox(lat, lon, radius_km), mask=mask)
+        distances = haversine_km(self.columns, lat, lon, rows)
+        inside = distances <= radius_km
+        return rows[inside], distances[inside]
+
+
+def build_spatial_index(columns, cell_deg=DEFAULT_CELL_DEG):
+    """Build GridIndex từ RestaurantColumns."""
+    return GridIndex(columns, cell_deg)
+
+
+def _unit_vectors(lat_rad, lon_rad):
+    """Tọa độ (x, y, z) trên mặt cầu đơn vị; khoảng cách dây cung tăng theo khoảng cách thật."""
+    cos_lat = np.cos(lat_rad)
+    return np.column_stack((cos_lat * np.cos(lon_rad), cos_lat * np.sin(lon_rad), np.sin(lat_rad)))
+
+
+class KDTree:
+    """
+    KD-tree trên tọa độ 3D (mặt cầu đơn vị) của nhà hàng, dùng cho truy vấn
+    k nhà hàng gần nhất. Cây lưu dạng mảng: mỗi node giữ đoạn [start, end)
+    trong self._rows, lá có tối đa leaf_size nhà hàng.
+
+    Upsert/delete không sửa cây (upsert ghi nhà hàng sang dòng mới, xem core/columns.py):
+      - tọa độ không đổi: dòng trong cây được trỏ sang dòng mới (_moved[dòng cũ] = dòng mới)
+      - đổi tọa độ / xóa: dòng trong cây bị tách (_moved = -1), dòng có tọa độ mới được quét
+        tuyến tính trong _extra_rows
+    Overlay (_moved + _extra_rows) vượt ngưỡng thì build lại cây ngay trong update_row().
+    """
+
+    def __init__(self, columns, leaf_size=KD_LEAF_SIZE):
+        self.columns = columns
+        self.leaf_size = leaf_size
+        self._rows = columns.has_coords().nonzero()[0]
+        self._points = _unit_vectors(columns.lat_rad[self._rows], columns.lon_rad[self._rows])
+        self._built_rows = len(columns)  # Dòng >= _built_rows chưa có khi build cây
+        self._moved = {}  # Dòng trong cây -> dòng hiện tại (-1 = đã tách)
+        self._slot_of = {}  # Dòng hiện tại -> dòng trong cây (ngược của _moved)
+        self._moved_keys = self._moved_values = _EMPTY_ROWS  # _moved dạng mảng đã sort (cho lá)
+        self._extra_rows = _EMPTY_ROWS
+
+        # Node i: (start, end, split_dim, split_value, left, right); lá có left = -1
+        self._nodes = []
+        if len(self._rows):
+            self._build(0, len(self._rows))
+
+    def __len__(self):
+        detached = sum(1 for row in self._moved.values() if row < 0)
+        return len(self._rows) - detached + len(self._extra_rows)
+
+    def snapshot_state(self):
+        """Trạng thái để ghi snapshot nhị phân (cây đã build sẵn + overlay)."""
+        nodes = self._nodes
+        return {
+            'leaf_size': self.leaf_size,
+            'rows': self._rows,
+            'points': self._points,
+            'node_links': np.array(
+                [(start, end, dim, left, right) for start, end, dim, _, left, right in nodes], dtype=np.int64
+            ).reshape(-1, 5),
+            'node_split': np.array([node[3] for node in nodes], dtype=np.float64),
+            'built_rows': self._built_rows,
+            'moved_keys': self._moved_keys,
+            'moved_values': self._moved_values,
+            'extra_rows': self._extra_rows,
+        }
+
+    @classmethod
+    def from_snapshot(cls, state, columns):
+        tree = cls.__new__(cls)
+        tree.columns = columns
+        tree.leaf_size = state['leaf_size']
+        tree._rows = state['rows']
+        tree._points = state['points']
+        tree._nodes = [
+            (start, end, dim, split, left, right)
+            for (start, end, dim, left, right), split in zip(
+                state['node_links'].tolist(), state['node_split'].tolist()
+            )
+        ]
+        tree._built_rows = state['built_rows']
+        tree._moved_keys, tree._moved_values = state['moved_keys'], state['moved_values']
+        tree._moved = dict(zip(tree._moved_keys.tolist(), tree._moved_values.tolist()))
+        tree._slot_of = {row: slot for slot, row in tree._moved.items() if row >= 0}
+        tree._extra_rows = state['extra_rows']
+        return tree
+
+    def clone(self, columns):
+        """
+        Bản copy-on-write trên columns của generation mới: chỉ chép overlay (giới hạn bởi
+        ngưỡng build lại), cây dùng chung.
+        """
+        index = copy.copy(self)
+        index.columns = columns
+        index._moved = dict(self._moved)
+        index._slot_of = dict(self._slot_of)
+        return index
+
+    def _overlay_limit(self):
+        return max(256, 4 * math.isqrt(len(self._rows)))
+
+    def _valid(self, row):
+        return row is not None and _valid_coords(float(self.columns.lat[row]), float(self.columns.lon[row]))
+
+    def update_row(self, old_row, new_row):
+        """
+        Thay old_row bằng new_row (None = không có) sau upsert / delete. Tọa độ không đổi thì
+        chỉ trỏ dòng trong cây sang dòng mới, không tách khỏi cây.
+        """
+        columns = self.columns
+        slot = None
+        if old_row is not None:
+            slot = self._slot_of.pop(old_row, None)
+            if slot is None and old_row < self._built_rows and old_row not in self._moved and self._valid(old_row):
+                slot = old_row
+            if slot is None:
+                self._extra_rows = self._extra_rows[self._extra_rows != old_row]
+
+        same_point = (
+            slot is not None and new_row is not None
+            and columns.lat[new_row] == columns.lat[old_row] and columns.lon[new_row] == columns.lon[old_row]
+        )
+        if slot is not None:
+            self._moved[slot] = new_row if same_point else -1
+            if same_point:
+                self._slot_of[new_row] = slot
+        if not same_point and self._valid(new_row):
+            self._extra_rows = np.append(self._extra_rows, new_row)
+
+        if len(self._moved) + len(self._extra_rows) > self._overlay_limit():
+            self._rebuild()
+        elif slot is not None:
+            moved = sorted(self._moved.items())
+            self._moved_keys = np.array([key for key, _ in moved], dtype=np.int64)
+            self._moved_values = np.array([value for _, value in moved], dtype=np.int64)
+
+    def _rebuild(self):
+        """Build lại cây theo columns hiện tại (overlay quá lớn làm truy vấn chậm)."""
+        rebuilt = KDTree(self.columns, self.leaf_size)
+        self.__dict__.update(rebuilt.__dict__)
+
+    def _attached(self, rows):
+        """Dòng trong cây của 1 lá -> dòng hiện tại (bỏ dòng đã tách)."""
+        keys = self._moved_keys
+        if not len(keys):
+            return rows, None
+        positions = np.minimum(np.searchsorted(keys, rows), len(keys) - 1)
+        hit = keys[positions] == rows
+        if not hit.any():
+            return rows, None
+        rows = rows.copy()
+        rows[hit] = self._moved_values[positions[hit]]
+        keep = rows >= 0
+        return rows[keep], keep
+
+    def _build(self, start, end):
+        node_id = len(self._nodes)
+        self._nodes.append(None)
+        if end - start <= self.leaf_size:
+            self._nodes[node_id] = (start, end, -1, 0.0, -1, -1)
+            return node_id
+
+        points = self._points[start:end]
+        dim = int(np.argmax(points.max(axis=0) - points.min(axis=0)))
+        mid = (end - start) // 2
+        order = np.argpartition(points[:, dim], mid)
+        self._points[start:end] = points[order]
+        self._rows[start:end] = self._rows[start:end][order]
+        split = float(self._points[start + mid, dim])
+
+        left = self._build(start, start + mid)
+        right = self._build(start + mid, end)
+        self._nodes[node_id] = (start, end, dim, split, left, right)
+        return node_id
+
+    def query_knn(self, lat, lon, k, max_km=None, predicate=None):
+        """
+        Trả về (rows, distances) của tối đa k nhà hàng gần (lat, lon) nhất,
+        sắp xếp theo khoảng cách tăng dần.
+
+        max_km: chỉ lấy nhà hàng trong bán kính này (None = không giới hạn)
+        predicate: hàm nhận mảng rows, trả về mask bool; chỉ gọi trên các lá
+            được duyệt (VD lọc category, min_rating) thay vì lọc toàn bộ trước
+        """
+        if k <= 0 or not len(self):
+            return np.empty(0, dtype=np.int64), np.empty(0)
+
+        query = _unit_vectors(np.radians([lat]), np.radians([lon]))[0]
+        if max_km is None:
+            bound = np.inf
+        else:
+            # Khoảng cách dây cung (bình phương) tương ứng max_km
+            bound = (2 * math.sin(min(max_km / EARTH_RADIUS_KM, math.pi) / 2)) ** 2
+
+        heap = []  # max-heap (-chord², row) giữ k ứng viên tốt nhất
+        extra_rows = self._extra_rows
+
+        def worst():
+            return -heap[0][0] if len(heap) == k else bound
+
+        def offer(rows, d2):
+            keep = d2 <= worst()
+            if not keep.any():
+                return
+            rows, d2 = rows[keep], d2[keep]
+            if predicate is not None:
+                ok = predicate(rows)
+                rows, d2 = rows[ok], d2[ok]
+            for row, dist2 in zip(rows.tolist(), d2.tolist()):
+                if len(heap) < k:
+                    heapq.heappush(heap, (-dist2, -row))
+                elif dist2 < -heap[0][0]:
+                    heapq.heapreplace(heap, (-dist2, -row))
+
+        def visit(node_id):
+            start, end, dim, split, left, right = self._nodes[node_id]
+            if left < 0:
+                rows, keep = self._attached(self._rows[start:end])
+                d2 = ((self._points[start:end] - query) ** 2).sum(axis=1)
+                offer(rows, d2 if keep is None else d2[keep])
+                return
+
+            diff = query[dim] - split
+            near, far = (left, right) if diff < 0 else (right, left)
+            visit(near)
+            if diff * diff <= worst():
+                visit(far)
+
+        # Row upsert sau khi build: quét tuyến tính theo tọa độ hiện tại
+        if len(extra_rows):
+            points = _unit_vectors(self.columns.lat_rad[extra_rows], self.columns.lon_rad[extra_rows])
+            offer(extra_rows, ((points - query) ** 2).sum(axis=1))
+        if self._nodes:
+            visit(0)
+
+        best = sorted((-neg_d2, -neg_row) for neg_d2, neg_row in heap)
+        rows = np.array([row for _, row in best], dtype=np.int64)
+        return rows, haversine_km(self.columns, lat, lon, rows)
+
+
+def build_knn_index(columns, leaf_size=KD_LEAF_SIZE):
+    """Build KDTree từ RestaurantColumns."""
+    return KDTree(columns, leaf_size)
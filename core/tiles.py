@@ -0,0 +1,94 @@
+# core/tiles.py
+# --- Tile điểm nhà hàng z/x/y dạng nhị phân gọn (little-endian) cho bản đồ ---
+#
+# Định dạng 1 tile:
+#   header (20 bytes, '<4sBBBBIII'): MAGIC, TILE_FORMAT_VERSION, z, flags (bit 0 = bị cắt bớt
+#       vì quá TILE_MAX_POINTS), 0, x, y, count
+#   count bản ghi điểm (6 bytes, '<HHbB'): vị trí trong tile (0..65535, gốc ở góc tây bắc,
+#       y tăng về phía nam), category_id (-1 = không rõ), rating x 20 (0..100)
+#   count ID nhà hàng: mỗi ID 1 byte độ dài + UTF-8
+# Điểm sắp theo thứ hạng tĩnh (rating cao trước), cùng thứ tự với bảng ID.
+import math
+import os
+import struct
+
+import numpy as np
+
+from core.geo import GRID_BITS, MAX_MERCATOR_LAT
+
+MAGIC = b'FTIL'
+TILE_FORMAT_VERSION = 1
+MAX_TILE_ZOOM = 22
+TILE_MAX_POINTS = int(os.getenv('MAP_TILE_MAX_POINTS', 4096))  # Tối đa điểm / tile
+FLAG_TRUNCATED = 1
+
+_HEADER = struct.Struct('<4sBBBBIII')
+POINT_DTYPE = np.dtype([('x', '<u2'), ('y', '<u2'), ('category', 'i1'), ('rating', 'u1')])
+_EXTENT_BITS = 16  # Vị trí trong tile: 16 bit mỗi chiều
+
+
+def valid_tile(z, x, y):
+    return 0 <= z <= MAX_TILE_ZOOM and 0 <= x < (1 << z) and 0 <= y < (1 << z)
+
+
+def tile_bbox(z, x, y, margin=0.0):
+    """(south, west, north, east) của tile z/x/y (Web Mercator), nới thêm margin độ mỗi phía."""
+    n = 1 << z
+
+    def lat(tile_y):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * tile_y / n))))
+
+    south = max(lat(y + 1), -MAX_MERCATOR_LAT) - margin
+    north = min(lat(y), MAX_MERCATOR_LAT) + margin
+    return south, x / n * 360.0 - 180.0 - margin, north, (x + 1) / n * 360.0 - 180.0 + margin
+
+
+def in_tile(columns, rows, z, x, y):
+    """Chỉ giữ rows có ô lưới thuộc đúng tile (biên tile tính theo lưới, không trùng giữa 2 tile)."""
+    shift = GRID_BITS - z
+    inside = (columns.grid_x[rows] >> shift == x) & (columns.grid_y[rows] >> shift == y)
+    return rows[inside]
+
+
+def _local(grid, z):
+    """Vị trí trong tile từ ô lưới mịn nhất, đổi về thang 16 bit."""
+    bits = GRID_BITS - z
+    local = grid.astype(np.uint32) & np.uint32((1 << bits) - 1)
+    if bits >= _EXTENT_BITS:
+        return (local >> np.uint32(bits - _EXTENT_BITS)).astype(np.uint16)
+    return (local << np.uint32(_EXTENT_BITS - bits)).astype(np.uint16)
+
+
+def encode_tile(columns, rows, z, x, y, truncated=False):
+    """Bytes của tile z/x/y chứa các nhà hàng `rows` (đã sắp theo thứ tự muốn trả về)."""
+    points = np.empty(len(rows), dtype=POINT_DTYPE)
+    points['x'] = _local(columns.grid_x[rows], z)
+    points['y'] = _local(columns.grid_y[rows], z)
+    points['category'] = np.clip(columns.category_id[rows], -1, 127)
+    points['rating'] = np.clip(np.round(columns.rating[rows] * 20), 0, 100)
+
+    ids = bytearray()
+    for row in rows.tolist():
+        encoded = columns.ids[row].encode('utf-8')[:255]
+        ids.append(len(encoded))
+        ids += encoded
+
+    flags = FLAG_TRUNCATED if truncated else 0
+    header = _HEADER.pack(MAGIC, TILE_FORMAT_VERSION, z, flags, 0, x, y, len(rows))
+    return header + points.tobytes() + bytes(ids)
+
+
+def decode_tile(data):
+    """Đọc lại tile (dùng cho test / debug): dict header + mảng điểm + list ID."""
+    magic, version, z, flags, _, x, y, count = _HEADER.unpack_from(data)
+    if magic != MAGIC or version != TILE_FORMAT_VERSION:
+        raise ValueError("Không phải tile hợp lệ")
+    offset = _HEADER.size
+    points = np.frombuffer(data, dtype=POINT_DTYPE, count=count, offset=offset)
+    offset += count * POINT_DTYPE.itemsize
+    ids = []
+    for _ in range(count):
+        length = data[offset]
+        ids.append(data[offset + 1:offset + 1 + length].decode('utf-8'))
+        offset += 1 + length
+    return {'z': z, 'x': x, 'y': y, 'truncated': bool(flags & FLAG_TRUNCATED), 'points': points, 'ids': ids}
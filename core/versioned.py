@@ -0,0 +1,198 @@
+# core/versioned.py
+# --- Cấu trúc dùng chung giữa các generation dữ liệu: clone() rẻ, upsert không chép cả catalogue ---
+import math
+from collections.abc import MutableMapping, Sequence
+from itertools import chain, islice
+
+import numpy as np
+
+_DELETED = object()  # Key đã xóa ở tầng trên (che key của tầng dưới)
+_ABSENT = object()
+_MIN_DELTA = 32  # delta nhỏ hơn thì không gộp vào mid
+
+
+class LayeredDict(MutableMapping):
+    """
+    Dict copy-on-write cho các generation. 3 tầng, tra từ trên xuống:
+      - delta: dict riêng của generation này, chỉ tầng này bị ghi
+      - mid: dict dùng chung giữa các generation, không bao giờ bị sửa tại chỗ
+      - root: Mapping lớn chỉ đọc (dict lúc build hoặc view trên mảng snapshot)
+    clone() chỉ chép delta; delta lớn hơn ~sqrt(len(mid)) thì gộp thành mid mới, nên mỗi lần
+    ghi tốn O(sqrt(số key đã sửa từ lúc build)) khấu hao, không phụ thuộc kích thước root.
+    """
+
+    __slots__ = ('_root', '_mid', '_delta', '_len')
+
+    def __init__(self, root=None, mid=None, delta=None, length=None):
+        self._root = root if root is not None else {}
+        self._mid = mid if mid is not None else {}
+        self._delta = delta if delta is not None else {}
+        self._len = len(self._root) if length is None else length
+
+    def clone(self):
+        mid, delta = self._mid, self._delta
+        if len(delta) > max(_MIN_DELTA, math.isqrt(len(mid))):
+            mid = {**mid, **delta}
+            delta = {}
+        return LayeredDict(self._root, mid, dict(delta), self._len)
+
+    def sealed(self):
+        """Bản mới có toàn bộ key ở root (gọi 1 lần sau khi build xong bằng cách ghi từng key)."""
+        if not self._root and not self._mid and not any(v is _DELETED for v in self._delta.values()):
+            return LayeredDict(self._delta)
+        return LayeredDict(dict(self.items()))
+
+    def _lookup(self, key):
+        value = self._delta.get(key, _ABSENT)
+        if value is _ABSENT:
+            value = self._mid.get(key, _ABSENT)
+            if value is _ABSENT:
+                return self._root.get(key, _ABSENT)
+        return _ABSENT if value is _DELETED else value
+
+    def get(self, key, default=None):
+        value = self._lookup(key)
+        return default if value is _ABSENT else value
+
+    def __getitem__(self, key):
+        value = self._lookup(key)
+        if value is _ABSENT:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        return self._lookup(key) is not _ABSENT
+
+    def __setitem__(self, key, value):
+        if self._lookup(key) is _ABSENT:
+            self._len += 1
+        self._delta[key] = value
+
+    def __delitem__(self, key):
+        if self._lookup(key) is _ABSENT:
+            raise KeyError(key)
+        self._len -= 1
+        self._delta[key] = _DELETED
+
+    def __len__(self):
+        return self._len
+
+    def __iter__(self):
+        root, mid, delta = self._root, self._mid, self._delta
+        for key in root:
+            if key not in mid and key not in delta:
+                yield key
+        for key, value in mid.items():
+            if key not in delta and value is not _DELETED:
+                yield key
+        for key, value in delta.items():
+            if value is not _DELETED:
+                yield key
+
+
+class AppendList(Sequence):
+    """
+    List chỉ ghi thêm dùng chung giữa các generation: base (list / PackedStrings / mảng chỉ đọc)
+    + list extra dùng chung, mỗi generation chỉ thấy n phần tử đầu. append() trả về bản mới;
+    ghi từ bản không phải mới nhất thì tách extra riêng (giống AppendArray).
+    """
+
+    __slots__ = ('_base', '_extra', '_n')
+
+    def __init__(self, base=(), extra=None, n=None):
+        self._base = base
+        self._extra = extra if extra is not None else []
+        self._n = len(base) + len(self._extra) if n is None else n
+
+    def __len__(self):
+        return self._n
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self._n))]
+        index = int(index)
+        if index < 0:
+            index += self._n
+        if not 0 <= index < self._n:
+            raise IndexError(index)
+        base = len(self._base)
+        return self._base[index] if index < base else self._extra[index - base]
+
+    def __iter__(self):
+        base = self._base
+        base = base.tolist() if hasattr(base, 'tolist') else base
+        return chain(base, islice(self._extra, self._n - len(self._base)))
+
+    @property
+    def base(self):
+        return self._base
+
+    def append(self, value):
+        """Bản mới = bản này + value (bản này không đổi)."""
+        k = self._n - len(self._base)
+        extra = self._extra if len(self._extra) == k else self._extra[:k]
+        extra.append(value)
+        return AppendList(self._base, extra, self._n + 1)
+
+    def take(self, indices):
+        """Các phần tử tại `indices` (mảng số nguyên không âm); base có take() thì đọc 1 lần."""
+        indices = np.asarray(indices, dtype=np.int64)
+        base, extra = self._base, self._extra
+        n = len(base)
+        if not hasattr(base, 'take') or isinstance(base, np.ndarray):
+            return [base[i] if i < n else extra[i - n] for i in indices.tolist()]
+        in_base = indices < n
+        values = base.take(indices[in_base])
+        if in_base.all():
+            return values
+        result = iter(values)
+        return [next(result) if i < n else extra[i - n] for i in indices.tolist()]
+
+
+class AppendArray:
+    """
+    Buffer có capacity dư của 1 mảng chỉ ghi thêm (theo dòng), dùng chung giữa các generation
+    cùng dòng dõi. Mỗi generation giữ view [:n] của mình; generation mới nhất (n == size) ghi
+    thêm vào chỗ trống phía sau nên các generation cũ không thấy. Ghi từ 1 generation không
+    phải mới nhất (vd. bản clone bị bỏ do change lỗi) hoặc từ mảng không nằm trên buffer
+    (đã bị thay bằng bản chép) thì tách sang buffer riêng.
+    """
+
+    __slots__ = ('_buffer', '_size')
+
+    def __init__(self, view):
+        self._buffer = view
+        self._size = len(view)
+
+    def append(self, view, values):
+        """view (mảng hiện tại của generation) + values -> (AppendArray, view mới)."""
+        n, k = len(view), len(values)
+        buffer = self._buffer
+        tip = n == self._size and (view is buffer or view.base is buffer)
+        owner = self if tip else AppendArray(view)
+        buffer = owner._buffer
+        if n + k > len(buffer) or not buffer.flags.writeable:
+            # Mảng build sẵn / mmap snapshot vừa khít -> chép 1 lần sang buffer gấp đôi
+            buffer = np.empty((max(n + k, 2 * n, 16),) + view.shape[1:], dtype=view.dtype)
+            buffer[:n] = view
+            owner._buffer = buffer
+        buffer[n:n + k] = values
+        owner._size = n + k
+        return owner, buffer[:n + k]
+
+
+def append_to(appenders, key, view, values):
+    """
+    view + values qua AppendArray appenders[key] (dict riêng của generation, chép khi clone).
+    Trả về view mới.
+    """
+    appender = appenders.get(key) or AppendArray(view)
+    appenders[key], view = appender.append(view, values)
+    return view
+
+
+def append_rows(holder, appenders, name, values):
+    """Ghi thêm values vào mảng holder.<name> (xem append_to)."""
+    view = append_to(appenders, name, getattr(holder, name), values)
+    setattr(holder, name, view)
+    return view
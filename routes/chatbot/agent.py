@@ -10,11 +10,15 @@ from uuid import uuid4
 import os
 import json
 import requests
+import numpy as np
 from typing import List, Dict, Optional
+from collections.abc import Mapping
 
 # Import data từ backend
-from core.database import DB_RESTAURANTS, MENUS_BY_RESTAURANT_ID, DB_CATEGORIES
-from core.search import normalize_text
+from core.database import DATA, DB_CATEGORIES
+from core.filters import top_ranked
+from core.search import fold_text, normalize_text
+from core.search_index import tokenize
 
 # Load environment variables
 from dotenv import load_dotenv, dotenv_values
@@ -44,9 +48,10 @@ conversations: Dict[str, List[Dict]] = {}
 def get_restaurant_context() -> str:
     """Lấy thông tin nhà hàng để đưa vào prompt"""
     restaurants_context = ""
-    if DB_RESTAURANTS:
+    restaurants = DATA.current.restaurants
+    if restaurants:
         restaurants_context = "\n\n📍 Danh sách các nhà hàng trong hệ thống (mẫu):\n"
-        for r in DB_RESTAURANTS[:10]:  # Lấy top 10
+        for r in restaurants[:10]:  # Lấy top 10
             try:
                 name = r.get('name', 'N/A')
                 address = r.get('address', 'N/A')
@@ -59,6 +64,17 @@ def get_restaurant_context() -> str:
                 continue
     return restaurants_context
 
+def _has_keyword(tokens: List[str], keywords: List[str]) -> bool:
+    """
+    Query (list token đã bỏ dấu) có chứa nguyên cụm từ khóa nào không, so theo ranh giới từ:
+    "re" khớp "quan re" nhưng không khớp "tren".
+    """
+    for keyword in keywords:
+        words = keyword.split()
+        if any(tokens[i:i + len(words)] == words for i in range(len(tokens) - len(words) + 1)):
+            return True
+    return False
+
 def _parse_price(price_range: str) -> int:
     """Parse price range string và trả về giá trung bình để sort"""
     try:
@@ -81,11 +97,12 @@ def find_restaurants_by_dish(query: str) -> List[Dict]:
         
         # Build a dict: numeric restaurant_id -> Restaurant object
         restaurants_by_numeric_id = {}
-        for idx, restaurant in enumerate(DB_RESTAURANTS, start=1):
+        dataset = DATA.current
+        for idx, restaurant in enumerate(dataset.restaurants, start=1):
             restaurants_by_numeric_id[str(idx)] = restaurant
         
         # Tìm kiếm trong menus
-        for restaurant_id, menu_items in MENUS_BY_RESTAURANT_ID.items():
+        for restaurant_id, menu_items in dataset.menus_by_restaurant_id.items():
             if not isinstance(menu_items, list):
                 continue
                 
@@ -124,8 +141,8 @@ def find_restaurants_by_name(query: str) -> List[Dict]:
         query_normalized = normalize_text(query)
         query_words = query_normalized.split()
         
-        for restaurant in DB_RESTAURANTS:
-            if not isinstance(restaurant, dict):
+        for restaurant in DATA.current.restaurants:
+            if not isinstance(restaurant, Mapping):
                 continue
             
             name_normalized = normalize_text(restaurant.get("name", ""))
@@ -145,12 +162,14 @@ def find_restaurants_by_name(query: str) -> List[Dict]:
         return []
 
 def find_restaurants_by_location(query: str) -> List[Dict]:
-    """Tìm nhà hàng theo ĐỊA ĐIỂM từ user query - sử dụng normalize_text()"""
+    """Tìm nhà hàng theo ĐỊA ĐIỂM từ user query - so sánh dạng bỏ dấu (fold_text())"""
     try:
         print(f"🔍 Searching restaurants by location: {query}")
         
-        results = []
-        query_normalized = normalize_text(query)  # Chuyển thành: "ho chi minh"
+        dataset = DATA.current
+        restaurants = dataset.restaurants
+        query_normalized = fold_text(query)  # "Hồ Chí Minh" -> "ho chi minh"
+        query_tokens = tokenize(query_normalized)
         
         print(f"📍 Normalized query: {query_normalized}")
         
@@ -165,53 +184,38 @@ def find_restaurants_by_location(query: str) -> List[Dict]:
         
         # Kiểm tra "gần tôi" / "nearby"
         nearby_keywords = ["gan toi", "gan day", "nearby", "near me", "o day"]
-        is_nearby_query = any(keyword in query_normalized for keyword in nearby_keywords)
+        is_nearby_query = _has_keyword(query_tokens, nearby_keywords)
         
         if is_nearby_query:
             print("📍 Detected 'nearby' query - returning top restaurants")
-            # Trả về top restaurants (có thể sort theo rating)
-            sorted_restaurants = sorted(
-                [r for r in DB_RESTAURANTS if isinstance(r, dict)],
-                key=lambda x: x.get('rating', 0),
-                reverse=True
-            )
-            return sorted_restaurants[:10]
+            # Trả về top restaurants theo rating (thứ hạng tĩnh tính sẵn của columns)
+            rows = top_ranked(dataset.columns, dataset.columns.alive.nonzero()[0], 10)
+            return [restaurants[row] for row in rows.tolist()]
         
         # Tìm location nào match với query
         matched_location = None
         for location_key, variants in location_variants.items():
             for variant in variants:
-                if variant in query_normalized:
+                if _has_keyword(query_tokens, [variant]):
                     matched_location = location_key
                     print(f"✅ Matched location key: {location_key} (variant: {variant})")
                     break
             if matched_location:
                 break
         
-        # Nếu tìm được location, lọc nhà hàng
+        # Nếu tìm được location, lọc nhà hàng qua mask tỉnh (địa chỉ) / tag tính sẵn của FacetIndex
+        results = []
         if matched_location:
-            for restaurant in DB_RESTAURANTS:
-                if not isinstance(restaurant, dict):
-                    continue
-                    
-                address_normalized = normalize_text(restaurant.get("address", ""))
-                tags = restaurant.get("tags", [])
-                
-                # Xử lý tags có thể là list hoặc string
-                if isinstance(tags, list):
-                    tags_normalized = [normalize_text(tag) for tag in tags]
-                else:
-                    tags_normalized = [normalize_text(str(tags))]
-                
-                # Kiểm tra tất cả variants của location trong address hoặc tags
-                for variant in location_variants[matched_location]:
-                    if variant in address_normalized or any(variant in tag for tag in tags_normalized):
-                        results.append(restaurant)
-                        print(f"  ✅ Found: {restaurant.get('name')} at {restaurant.get('address')}")
-                        break
+            n = len(restaurants)
+            mask = np.zeros(n, dtype=bool)
+            for variant in location_variants[matched_location]:
+                mask |= dataset.facets.province_mask(variant, restaurants)
+                mask |= dataset.facets.tag_text_mask(variant, n)
+            mask &= dataset.columns.alive
+            results = [restaurants[row] for row in mask.nonzero()[0][:10].tolist()]
         
         print(f"📊 Total found: {len(results)} restaurants by location")
-        return results[:10]  # Return top 10
+        return results  # Top 10
         
     except Exception as e:
         print(f"❌ Error in find_restaurants_by_location: {e}")
@@ -246,15 +250,17 @@ def chat():
         name_results = find_restaurants_by_name(user_message)
         
         # Phát hiện từ khóa đặc biệt để sắp xếp
-        query_normalized = normalize_text(user_message)
+        query_normalized = fold_text(user_message)  # Từ khóa bên dưới đều ở dạng không dấu
+        
+        query_tokens = tokenize(query_normalized)  # So từ khóa theo ranh giới từ
         
         # Từ khóa liên quan đến giá
         price_keywords = ["gia re", "re nhat", "re", "binh dan", "tiet kiem", "cheap"]
-        has_price_filter = any(keyword in query_normalized for keyword in price_keywords)
+        has_price_filter = _has_keyword(query_tokens, price_keywords)
         
         # Từ khóa liên quan đến đánh giá
         rating_keywords = ["ngon nhat", "tot nhat", "diem cao", "danh gia cao", "best", "top rated", "ngon", "chat luong"]
-        has_rating_filter = any(keyword in query_normalized for keyword in rating_keywords)
+        has_rating_filter = _has_keyword(query_tokens, rating_keywords)
         
         # Logic tìm kiếm theo thứ tự ưu tiên:
         # 1. Địa điểm + Món ăn -> lọc theo địa điểm trước, sau đó món ăn
@@ -543,6 +549,6 @@ def chat_status():
         "status": "running",
         "api_key_configured": bool(API_KEY),
         "total_conversations": len(conversations),
-        "total_restaurants": len(DB_RESTAURANTS),
+        "total_restaurants": len(DATA.current.restaurants_by_id),
         "timestamp": datetime.now().isoformat()
     })
\ No newline at end of file
@@ -13,4 +13,7 @@ from . import detail_route  # /restaurants/<place_id> - MUST BE LAST to avoid ca
 from . import direction_route
 from . import reviews_route
 from . import food_search_route
-from . import category_route
\ No newline at end of file
+from . import category_route
+from . import cache_route
+from . import data_route
+from . import autocomplete_route
\ No newline at end of file
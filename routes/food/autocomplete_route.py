@@ -0,0 +1,27 @@
+# routes/food/autocomplete_route.py
+from flask import Response, request
+from routes.food import food_bp
+from core.database import DATA
+from core.autocomplete import MAX_SUGGESTIONS
+from core.payload import dumps
+
+DEFAULT_LIMIT = 5
+
+
+@food_bp.route('/autocomplete', methods=['GET'])
+def autocomplete():
+    """
+    Gợi ý cho thanh search theo từng phím gõ (tên nhà hàng, tên món, tag).
+    Params:
+        - q: str - Phần đã gõ (có dấu hoặc không dấu)
+        - limit: int (optional) - Số gợi ý, default: 5, tối đa 20
+    Response nhỏ (JSON gọn, không escape tiếng Việt): mỗi gợi ý chỉ gồm text,
+    type (restaurant / dish / tag) và id nhà hàng.
+    """
+    query = request.args.get('q', '')
+    limit = request.args.get('limit', DEFAULT_LIMIT, type=int)
+    limit = max(0, min(limit, MAX_SUGGESTIONS))
+
+    suggestions = DATA.current.autocomplete.suggest(query, limit)
+    body = dumps({"success": True, "query": query, "suggestions": suggestions})
+    return Response(body, status=200, mimetype='application/json')
@@ -0,0 +1,15 @@
+# routes/food/cache_route.py
+from flask import jsonify
+from routes.food import food_bp
+from routes.food.data_route import _is_admin
+from core.cache import cache_stats
+
+@food_bp.route('/cache/stats', methods=['GET'])
+def get_cache_stats():
+    """Thống kê hit/miss/eviction của cache kết quả (dùng để chỉnh kích thước cache). Header: X-Admin-Token."""
+    if not _is_admin():
+        return jsonify({"error": "Unauthorized"}), 401
+    return jsonify({
+        "success": True,
+        "caches": cache_stats()
+    }), 200
@@ -0,0 +1,46 @@
+# routes/food/data_route.py
+import hmac
+import os
+
+from flask import request, jsonify
+from routes.food import food_bp
+from core.database import DATA
+from core.registry import ReloadInProgress
+
+ADMIN_TOKEN = os.getenv('ADMIN_TOKEN', '')  # Để trống = tắt các API admin
+
+
+def _is_admin():
+    token = request.headers.get('X-Admin-Token', '')
+    return bool(ADMIN_TOKEN) and hmac.compare_digest(token, ADMIN_TOKEN)
+
+
+@food_bp.route('/admin/data/reload', methods=['POST'])
+def reload_data():
+    """
+    Load lại restaurants.json / menus.json (hoặc snapshot) ở nền rồi swap sang generation mới.
+    Header: X-Admin-Token. Params:
+        - wait: bool (optional) - Chờ reload xong mới trả về
+    Chỉ reload worker nhận request; chạy nhiều worker thì bật DATA_WATCH=1.
+    """
+    if not _is_admin():
+        return jsonify({"error": "Unauthorized"}), 401
+
+    wait = request.args.get('wait', 'false').lower() in ('1', 'true', 'yes')
+    try:
+        DATA.reload(wait=wait)
+    except ReloadInProgress as e:
+        return jsonify({"error": str(e)}), 409
+
+    status = DATA.status()
+    if wait and status["last_error"]:
+        return jsonify({"success": False, "data": status}), 500
+    return jsonify({"success": True, "data": status}), 200 if wait else 202
+
+
+@food_bp.route('/admin/data/status', methods=['GET'])
+def get_data_status():
+    """Generation dữ liệu hiện tại (version, thời điểm load, số nhà hàng, lỗi reload gần nhất)."""
+    if not _is_admin():
+        return jsonify({"error": "Unauthorized"}), 401
+    return jsonify({"success": True, "data": DATA.status()}), 200
@@ -1,6 +1,8 @@
 from flask import jsonify, request
 from routes.food import food_bp
-from core.database import DB_MENUS
+from core.database import DATA
+from core.fuzzy_index import fuzzy_key
+from core.search_index import FIELD_DISH
 
 @food_bp.route('/foods/<int:food_id>', methods=['GET'])
 def get_food_detail(food_id):
@@ -9,7 +11,7 @@ def get_food_detail(food_id):
         # Tìm món ăn trong DB_MENUS
         # Lưu ý: DB_MENUS là list dict, không có index theo ID sẵn nên phải loop
         # Nếu data lớn, nên tạo index bên core/database.py
-        food = next((f for f in DB_MENUS if str(f.get('id')) == str(food_id)), None)
+        food = next((f for f in DATA.current.menus if str(f.get('id')) == str(food_id)), None)
         
         if not food:
             return jsonify({"error": "Food not found"}), 404
@@ -20,16 +22,37 @@ def get_food_detail(food_id):
 
 @food_bp.route('/foods/search', methods=['GET'])
 def search_foods():
-    """Tìm kiếm món ăn theo tên."""
+    """
+    Tìm kiếm món ăn theo tên.
+    Params:
+        - q: str - Từ khóa
+        - fuzzy: bool (optional) - Tìm gần đúng theo trigram, xếp theo độ giống
+        - threshold: float (optional) - Độ giống tối thiểu (0..1] khi fuzzy, default: FUZZY_THRESHOLD
+    """
     try:
         query = request.args.get('q', '').lower().strip()
         if not query:
             return jsonify({"success": True, "foods": []})
-            
-        results = [
-            f for f in DB_MENUS 
-            if query in f.get('name', '').lower()
-        ]
+        
+        dataset = DATA.current
+        if request.args.get('fuzzy', 'false').lower() in ('1', 'true', 'yes'):
+            threshold = request.args.get('threshold', type=float)
+            if threshold is not None and not 0 < threshold <= 1:
+                threshold = None
+            # Tên món giống query (từ trigram index) -> các món mang tên đó của từng nhà hàng
+            results = []
+            for _, text, owners in dataset.fuzzy_index.similar(query, threshold, fields=FIELD_DISH):
+                for restaurant_id, mask in owners.items():
+                    if mask & FIELD_DISH:
+                        results.extend(
+                            f for f in dataset.menus_by_restaurant_id.get(restaurant_id, [])
+                            if fuzzy_key(f.get('dish_name')) == text
+                        )
+        else:
+            results = [
+                f for f in dataset.menus 
+                if query in (f.get('dish_name') or f.get('name') or '').lower()
+            ]
         
         return jsonify({
             "success": True,
@@ -51,7 +74,7 @@ def get_foods_by_category(category_id):
         # Tuy nhiên, để đơn giản và nhanh, ta check key category_id trong menu item trước
         
         results = [
-            f for f in DB_MENUS 
+            f for f in DATA.current.menus 
             if str(f.get('category_id')) == str(category_id)
         ]
         
@@ -68,7 +91,7 @@ def get_foods_by_restaurant(restaurant_id):
     """Lấy danh sách món ăn của một nhà hàng."""
     try:
         results = [
-            f for f in DB_MENUS 
+            f for f in DATA.current.menus 
             if str(f.get('restaurant_id')) == str(restaurant_id)
         ]
         
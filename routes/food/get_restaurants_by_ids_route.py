@@ -2,13 +2,20 @@
 
 from flask import request, jsonify
 from . import food_bp
-from core.database import RESTAURANTS 
+from core.database import DATA
+from core.projection import ProjectionError, parse_fields, projected_response
 
 @food_bp.route("/restaurants/details-by-ids", methods=["POST"])
 def get_restaurants_by_ids():
     data = request.get_json(force=True, silent=True) or {}
     restaurant_ids = data.get("ids", []) # Frontend gửi list IDs trong body
 
+    # Projection: "fields" trong body hoặc ?fields= (VD "id,lat,lon,category_id,rating")
+    try:
+        fields = parse_fields(data.get("fields", request.args.get("fields")))
+    except ProjectionError as e:
+        return jsonify({"error": str(e)}), 400
+
     # 1. Kiểm tra format
     if not isinstance(restaurant_ids, list):
         return jsonify({"error": "Invalid 'ids' list format. Must be a list."}), 400
@@ -21,16 +28,20 @@ def get_restaurants_by_ids():
             "count": 0
         }), 200
 
+    restaurants = DATA.current.restaurants_by_id
     results = []
     
     # 2. Xử lý các IDs còn lại (không rỗng)
     for res_id in restaurant_ids:
-        res_data = RESTAURANTS.get(str(res_id).strip())
+        res_data = restaurants.get(str(res_id).strip())
         if res_data:
             results.append(res_data)
 
+    if fields:
+        return projected_response(results, fields)
+
     return jsonify({
         "success": True,
-        "restaurants": results,
+        "restaurants": [r.to_dict() for r in results],
         "count": len(results)
     }), 200
\ No newline at end of file
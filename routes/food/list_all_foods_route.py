@@ -1,6 +1,6 @@
 from flask import jsonify, request
 from routes.food import food_bp
-from core.database import DB_MENUS
+from core.database import DATA
 
 @food_bp.route('/foods', methods=['GET'])
 def get_foods():
@@ -10,7 +10,7 @@ def get_foods():
         limit = request.args.get('limit', 50, type=int)
         
         # Chỉ trả về số lượng món ăn giới hạn
-        foods = DB_MENUS[:limit]
+        foods = DATA.current.menus[:limit]
         
         return jsonify({
             "success": True,
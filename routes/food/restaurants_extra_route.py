@@ -1,7 +1,8 @@
 from flask import request, jsonify
 from . import food_bp
-from core.database import RESTAURANTS, DB_RESTAURANTS
-import math
+from core.database import DATA
+from core.filters import FilterPlan
+from core.projection import ProjectionError, parse_fields, projected_response
 
 @food_bp.route('/restaurants/nearby', methods=['GET'])
 def get_nearby_restaurants():
@@ -10,12 +11,21 @@ def get_nearby_restaurants():
     Params:
         - latitude: float
         - longitude: float
-        - radius: float (km, optional, default=5)
+        - radius: float (m, optional, default=5000)
+        - k: int (optional) - Chỉ trả về k nhà hàng gần nhất (KD-tree),
+          khi đó radius chỉ giới hạn nếu được truyền vào
+        - category: int (optional) - Lọc theo category ID
+        - min_rating: float (optional) - Rating tối thiểu
+        - fields: str (optional) - Chỉ trả về các trường này (có thể gồm distance)
     """
     try:
+        fields = parse_fields(request.args.get('fields'), extra_fields=('distance',))
         lat = request.args.get('latitude')
         lon = request.args.get('longitude')
         radius = float(request.args.get('radius', 5000.0)) # Default 5000m (5km)
+        k = request.args.get('k', type=int)
+        category = request.args.get('category', type=int)
+        min_rating = request.args.get('min_rating', type=float)
 
         if not lat or not lon:
             return jsonify({"error": "Missing latitude or longitude"}), 400
@@ -26,40 +36,46 @@ def get_nearby_restaurants():
         # ⭐️ FIX UNIT: Convert Meters -> Km
         search_radius_km = radius / 1000.0
         
-        results = []
+        # category / min_rating (bitset + cột số) rồi k gần nhất (KD-tree, chỉ xét row qua filter)
+        # hoặc bán kính (grid index), qua FilterPlan dùng chung với /api/search và /api/map/filter
+        dataset = DATA.current
+        plan = FilterPlan(
+            categories=[category] if category is not None else None,
+            min_rating=min_rating,
+            lat=user_lat, lon=user_lon,
+            radius_km=search_radius_km if k is None or 'radius' in request.args else None,
+            k=k,
+        )
+        rows, distances = plan.run(dataset)
         
-        for r in DB_RESTAURANTS:
-            r_lat = r.get('lat')
-            r_lon = r.get('lon')
-            
-            if r_lat is None or r_lon is None:
-                continue
-                
-            # Haversine formula
-            R = 6371 # Earth radius in km
-            dLat = math.radians(r_lat - user_lat)
-            dLon = math.radians(r_lon - user_lon)
-            a = math.sin(dLat/2) * math.sin(dLat/2) + \
-                math.cos(math.radians(user_lat)) * math.cos(math.radians(r_lat)) * \
-                math.sin(dLon/2) * math.sin(dLon/2)
-            c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
-            d = R * c
-            
-            if d <= search_radius_km:
-                # Tạo bản sao để không ảnh hưởng DB gốc nếu muốn thêm distance
-                res_copy = r.copy()
-                res_copy['distance'] = round(d, 2)
-                results.append(res_copy)
+        results = [(dataset.restaurants[row], round(distances[row], 2)) for row in rows.tolist()]
         
         # Sort by distance
-        results.sort(key=lambda x: x['distance'])
+        results.sort(key=lambda x: x[1])
+        
+        if fields:
+            # Projection: serialize thẳng các trường được chọn, không copy dict nhà hàng
+            return projected_response(
+                [r for r, _ in results],
+                fields,
+                [{"distance": d} for _, d in results]
+            )
+        
+        restaurants = []
+        for r, d in results:
+            # Tạo bản sao để không ảnh hưởng DB gốc nếu muốn thêm distance
+            res_copy = r.copy()
+            res_copy['distance'] = d
+            restaurants.append(res_copy)
         
         return jsonify({
             "success": True,
-            "count": len(results),
-            "restaurants": results
+            "count": len(restaurants),
+            "restaurants": restaurants
         })
 
+    except ProjectionError as e:
+        return jsonify({"error": str(e)}), 400
     except ValueError:
         return jsonify({"error": "Invalid parameters"}), 400
     except Exception as e:
@@ -68,17 +84,27 @@ def get_nearby_restaurants():
 
 @food_bp.route('/restaurants/category/<int:category_id>', methods=['GET'])
 def get_restaurants_by_category(category_id):
-    """Lấy danh sách nhà hàng theo category ID."""
+    """
+    Lấy danh sách nhà hàng theo category ID.
+    Params:
+        - fields: str (optional) - Chỉ trả về các trường này
+    """
     try:
-        results = [
-            r for r in DB_RESTAURANTS 
-            if r.get('category_id') == category_id
-        ]
+        fields = parse_fields(request.args.get('fields'))
+        dataset = DATA.current
+        # Bitset category (FacetIndex) qua FilterPlan: nhà hàng đã xóa không còn trong mask
+        rows, _ = FilterPlan(categories=[category_id]).run(dataset)
+        results = [dataset.restaurants[row] for row in rows.tolist()]
+        
+        if fields:
+            return projected_response(results, fields)
         
         return jsonify({
             "success": True,
             "count": len(results),
-            "restaurants": results
+            "restaurants": [r.to_dict() for r in results]
         })
+    except ProjectionError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
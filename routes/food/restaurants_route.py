@@ -3,25 +3,46 @@
 from flask import request, jsonify
 from . import food_bp
 # ⭐️ IMPORT ĐÃ ĐƯỢC KHẮC PHỤC ⭐️
-from core.database import RESTAURANTS 
+from core.database import DATA
+from core.cache import PROJECTION_CACHE
+from core.payload import CachedPayload
+from core.projection import ProjectionError, parse_fields, projected_body
 
 @food_bp.route("/restaurants", methods=["GET"])
 def get_all_restaurants():
-    """Trả về toàn bộ danh sách nhà hàng đã load từ restaurants.json."""
+    """
+    Trả về toàn bộ danh sách nhà hàng đã load từ restaurants.json.
+    Params:
+        - fields: str (optional) - Chỉ trả về các trường này, VD "id,lat,lon,category_id,rating"
+    """
+    try:
+        fields = parse_fields(request.args.get('fields'))
+    except ProjectionError as e:
+        return jsonify({"error": str(e)}), 400
     
-    # Lấy toàn bộ giá trị (data) từ dictionary RESTAURANTS
-    restaurant_list = list(RESTAURANTS.values())
-
-    return jsonify({
-        "success": True,
-        "count": len(restaurant_list),
-        "restaurants": restaurant_list
-    }), 200
+    dataset = DATA.current
+    
+    # Body đã serialize + nén sẵn khi load data, hỗ trợ ETag / If-None-Match -> 304
+    if fields is None:
+        return dataset.payload.to_response()
+    
+    # Mỗi projection cũng chỉ serialize + nén 1 lần rồi cache lại (theo generation dữ liệu)
+    payload = PROJECTION_CACHE.get_or_compute(
+        {"version": dataset.version, "fields": fields},
+        lambda: CachedPayload(projected_body(dataset.restaurants, fields))
+    )
+    return payload.to_response()
 
 
 @food_bp.route("/restaurants/search", methods=["GET"])
 def search_restaurants():
-    """Tìm kiếm nhà hàng theo query (dành cho thanh search)."""
+    """
+    Tìm kiếm nhà hàng theo query (dành cho thanh search).
+    Params:
+        - q: str - Từ khóa
+        - fuzzy: bool (optional) - Tìm gần đúng theo trigram trên tên / tag / món, xếp theo độ giống
+        - threshold: float (optional) - Độ giống tối thiểu (0..1] khi fuzzy, default: FUZZY_THRESHOLD
+    """
     
     query = request.args.get('q', '').lower()
     
@@ -29,11 +50,21 @@ def search_restaurants():
     if not query:
         return get_all_restaurants()
 
-    # Logic tìm kiếm đơn giản (lọc theo tên hoặc địa chỉ)
-    results = [
-        r for r in list(RESTAURANTS.values())
-        if query in r.get('name', '').lower() or query in r.get('address', '').lower()
-    ]
+    dataset = DATA.current
+    if request.args.get('fuzzy', 'false').lower() in ('1', 'true', 'yes'):
+        threshold = request.args.get('threshold', type=float)
+        if threshold is not None and not 0 < threshold <= 1:
+            threshold = None
+        # Ứng viên lấy từ trigram index, điểm cao (giống nhiều, khớp tên) lên trước
+        scores = dataset.fuzzy_index.match(query, threshold)
+        ranked = sorted(scores, key=lambda rid: -scores[rid])
+        results = [dataset.restaurants_by_id[rid].to_dict() for rid in ranked if rid in dataset.restaurants_by_id]
+    else:
+        # Logic tìm kiếm đơn giản (lọc theo tên hoặc địa chỉ)
+        results = [
+            r.to_dict() for r in dataset.restaurants
+            if query in r.get('name', '').lower() or query in r.get('address', '').lower()
+        ]
 
     return jsonify({
         "success": True,
@@ -4,7 +4,7 @@ from flask import request, jsonify
 from firebase_admin import db
 from . import food_bp  
 from core.auth_service import get_uid_from_auth_header 
-from core.database import RESTAURANTS 
+from core.database import DATA
 import time
 
 # ⭐️ HỆ SỐ TIN CẬY (N_MIN): Trọng số của điểm rating ban đầu ⭐️
@@ -21,7 +21,7 @@ def _calculate_new_rating(restaurant_id):
     reviews_dict = reviews_ref.get()
     
     # 2. Lấy điểm ban đầu (Source Rating) từ data tĩnh
-    res_data = RESTAURANTS.get(restaurant_id)
+    res_data = DATA.current.restaurants_by_id.get(restaurant_id)
     if not res_data:
         return None 
         
@@ -190,7 +190,7 @@ def get_single_restaurant_rating(restaurant_id):
         
         # Nếu chưa có điểm tính toán, trả về điểm gốc từ data tĩnh
         if current_rating is None:
-            res_data = RESTAURANTS.get(restaurant_id)
+            res_data = DATA.current.restaurants_by_id.get(restaurant_id)
             source_rating = float(res_data.get('rating', 0)) if res_data else 0
             current_rating = source_rating
 
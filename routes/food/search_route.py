@@ -1,6 +1,9 @@
 from flask import request, jsonify, current_app
-from core.database import DB_RESTAURANTS, MENUS_BY_RESTAURANT_ID
-from core.search import search_algorithm
+from core.database import DATA
+from core.search import SCORING_MODES, search_algorithm
+from core.search_index import OPERATORS
+from core.cache import SEARCH_CACHE, canonical_list, round_coord
+from core.markers import to_marker
 from routes.food import food_bp
 
 @food_bp.route('/search', methods=['POST'])
@@ -17,6 +20,17 @@ def search_food():
 		- min_price, max_price: int (optional) - Khoảng giá (VND)
 		- min_rating, max_rating: float (optional) - Khoảng rating
 		- tags: list[str] (optional) - Lọc theo tags
+		- limit: int (optional) - Số kết quả mỗi trang, mặc định trả về tất cả
+		- offset: int (optional) - Vị trí bắt đầu của trang, default: 0
+		- fuzzy: bool (optional) - Tìm gần đúng theo trigram (gõ sai / thiếu dấu), default: false
+		- fuzzy_threshold: float (optional) - Độ giống tối thiểu (0..1] cho fuzzy, default: FUZZY_THRESHOLD
+		- scoring: string (optional) - "bm25" hoặc "legacy" (điểm cố định cũ, để A/B), default: SEARCH_SCORING
+		- operator: string (optional) - Ghép các từ của query: "and" (đủ mọi từ), "or" (ít nhất 1 từ),
+			"auto" (and, không có kết quả thì or), default: auto; chỉ áp dụng cho scoring bm25
+	
+	Response:
+		- total: tổng số nhà hàng khớp (không phụ thuộc limit/offset)
+		- places: các nhà hàng thuộc trang được yêu cầu
 	"""
 	try:
 		data = request.get_json(force=True, silent=True)
@@ -40,6 +54,9 @@ def search_food():
 				user_lon = float(user_lon)
 			except (ValueError, TypeError):
 				user_lon = None
+		# Làm tròn tọa độ để các request gần nhau dùng chung kết quả cache
+		user_lat = round_coord(user_lat)
+		user_lon = round_coord(user_lon)
 		
 		# Parse filter parameters
 		radius = data.get('radius')
@@ -87,6 +104,41 @@ def search_food():
 		tags = data.get('tags')
 		if tags is not None and not isinstance(tags, list):
 			tags = None
+		
+		# Parse pagination
+		limit = data.get('limit')
+		if limit is not None:
+			try:
+				limit = int(limit)
+				if limit < 0:
+					limit = None
+			except (ValueError, TypeError):
+				limit = None
+		
+		offset = data.get('offset', 0)
+		try:
+			offset = max(int(offset), 0)
+		except (ValueError, TypeError):
+			offset = 0
+		
+		# Parse fuzzy mode
+		fuzzy = data.get('fuzzy') is True or str(data.get('fuzzy')).lower() in ('1', 'true', 'yes')
+		fuzzy_threshold = data.get('fuzzy_threshold')
+		if fuzzy_threshold is not None:
+			try:
+				fuzzy_threshold = float(fuzzy_threshold)
+				if not 0 < fuzzy_threshold <= 1:
+					fuzzy_threshold = None
+			except (ValueError, TypeError):
+				fuzzy_threshold = None
+		
+		scoring = data.get('scoring')
+		if scoring not in SCORING_MODES:
+			scoring = None
+
+		operator = str(data.get('operator') or 'auto').lower()
+		if operator not in OPERATORS:
+			operator = 'auto'
 
 		# Debug logging (Removed)
 		# print("--- BẮT ĐẦU DEBUG REQUEST ---")
@@ -95,63 +147,72 @@ def search_food():
 		# print(f"3. Location: lat={user_lat}, lon={user_lon}, radius={radius}")
 		# print(f"4. Filters: categories={categories}, price={min_price}-{max_price}, rating={min_rating}-{max_rating}")
 
-		results = search_algorithm(
-			query, 
-			DB_RESTAURANTS, 
-			MENUS_BY_RESTAURANT_ID,
-			province=province,
-			user_lat=user_lat,
-			user_lon=user_lon,
-			radius=radius,
-			categories=categories,
-			min_price=min_price,
-			max_price=max_price,
-			min_rating=min_rating,
-			max_rating=max_rating,
-			tags=tags
-		)
-		
-		# Format results để match frontend expect
-		category_map = {
-			1: {"dishType": "dry", "pinColor": "red"},
-			2: {"dishType": "soup", "pinColor": "blue"},
-			3: {"dishType": "vegetarian", "pinColor": "green"},
-			4: {"dishType": "salty", "pinColor": "orange"},
-			5: {"dishType": "seafood", "pinColor": "purple"}
+		# Generation dữ liệu dùng cho cả request (không đổi giữa chừng khi reload)
+		dataset = DATA.current
+
+		# Cache kết quả theo tham số đã chuẩn hóa (categories/tags sort, tọa độ đã làm tròn)
+		cache_params = {
+			"version": dataset.version,
+			"query": query,
+			"province": province,
+			"lat": user_lat,
+			"lon": user_lon,
+			"radius": radius,
+			"categories": canonical_list(categories),
+			"min_price": min_price,
+			"max_price": max_price,
+			"min_rating": min_rating,
+			"max_rating": max_rating,
+			"tags": canonical_list(tags),
+			"offset": offset,
+			"limit": limit,
+			"fuzzy": fuzzy,
+			"fuzzy_threshold": fuzzy_threshold,
+			"scoring": scoring,
+			"operator": operator
 		}
+
+		def run_search():
+			results, total = search_algorithm(
+				query, 
+				dataset.restaurants, 
+				dataset.menus_by_restaurant_id,
+				province=province,
+				user_lat=user_lat,
+				user_lon=user_lon,
+				radius=radius,
+				categories=categories,
+				min_price=min_price,
+				max_price=max_price,
+				min_rating=min_rating,
+				max_rating=max_rating,
+				tags=tags,
+				search_index=dataset.search_index,
+				columns=dataset.columns,
+				spatial_index=dataset.spatial_index,
+				offset=offset,
+				limit=limit,
+				fuzzy=fuzzy,
+				fuzzy_threshold=fuzzy_threshold,
+				fuzzy_index=dataset.fuzzy_index,
+				facets=dataset.facets,
+				version=dataset.version,
+				scoring=scoring,
+				operator=operator
+			)
 		
-		formatted_results = []
-		for r in results:
-			category_id = r.get('category_id', 1)
-			category_info = category_map.get(category_id, {"dishType": "dry", "pinColor": "red"})
-			
-			formatted = {
-				"id": r.get('id'),
-				"name": r.get('name'),
-				"address": r.get('address'),
-				"position": {
-					"lat": r.get('lat'),
-					"lon": r.get('lon')
-				},
-				"dishType": category_info["dishType"],
-				"pinColor": category_info["pinColor"],
-				"rating": r.get('rating', 0),
-				"price_range": r.get('price_range'),
-				"phone_number": r.get('phone_number'),
-				"open_hours": r.get('open_hours'),
-				"main_image_url": r.get('main_image_url'),
-				"tags": r.get('tags', [])
-			}
+			# Format results để match frontend expect
+			formatted_results = [to_marker(r, r.get('distance')) for r in results]
 			
-			# Thêm distance nếu có
-			if 'distance' in r:
-				formatted['distance'] = r['distance']
-			
-			formatted_results.append(formatted)
+			return formatted_results, total
+
+		formatted_results, total = SEARCH_CACHE.get_or_compute(cache_params, run_search)
 		
 		return jsonify({
 			"success": True,
-			"total": len(formatted_results),
+			"total": total,
+			"offset": offset,
+			"limit": limit,
 			"places": formatted_results
 		})
 	except Exception as e:
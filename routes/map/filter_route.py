@@ -1,7 +1,12 @@
 # routes/map/filter_route.py
 from flask import jsonify, request
 from routes.map import map_bp
-from core.database import DB_RESTAURANTS, DB_CATEGORIES
+from core.database import DATA, DB_CATEGORIES
+from core.cache import MAP_FILTER_CACHE, canonical_list, round_coord
+from core.clusters import CLUSTER_MAX_ZOOM, cluster_rows
+from core.filters import FilterPlan, top_ranked
+from core.geo import parse_bbox
+from core.markers import marker_delta, parse_view_token, to_marker, view_token, viewport_cap
 
 @map_bp.route("/map/filter", methods=["POST"])
 def filter_map_markers():
@@ -19,6 +24,22 @@ def filter_map_markers():
         - max_rating: float (optional) - Rating tối đa
         - tags: list[str] (optional) - Danh sách tags cần filter
         - limit: int (optional) - Số lượng kết quả tối đa, default: None (không giới hạn)
+        - bbox: [south, west, north, east] (optional) - Chế độ khung nhìn: chỉ trả về markers
+          trong khung (bỏ qua radius), sắp theo thứ hạng tĩnh (rating), tối đa theo zoom
+          (west > east = khung vắt qua kinh tuyến 180)
+        - zoom: float (optional) - Mức zoom bản đồ, zoom nhỏ thì trả ít markers hơn
+        - cluster: bool (optional) - Gộp markers thành cluster (count, trọng tâm, số nhà hàng theo
+          category) khi zoom < MAP_CLUSTER_MAX_ZOOM; cần zoom. Nhà hàng đứng 1 mình trong ô vẫn
+          trả về như marker trong places
+        - previous_bbox: [south, west, north, east] (optional) - Chế độ khung nhìn: khung nhìn lần trước
+          (cùng filters, zoom lần trước = previous_zoom, mặc định = zoom); chỉ trả về phần thay đổi.
+          Cần kèm version của kết quả lần trước; version khác dữ liệu hiện tại thì trả về đầy đủ
+        - version: str (optional) - Trường version trong kết quả khung nhìn lần trước (dùng với previous_bbox)
+        - since: str (optional) - Thay cho previous_bbox: token của kết quả khung nhìn lần trước.
+          Token khác version dữ liệu / filters thì trả về đầy đủ (delta = false)
+    
+    Chế độ khung nhìn luôn trả về token và version (version dữ liệu). Khi có previous_bbox / since: delta = true, places được thay
+    bằng added (markers mới vào khung nhìn) và removed (ID markers không còn trong khung nhìn).
     
     Returns:
         JSON với danh sách markers đã lọc
@@ -37,157 +58,203 @@ def filter_map_markers():
         max_rating = data.get('max_rating', 5)
         filter_tags = data.get('tags', [])
         limit = data.get('limit', None)  # None = không giới hạn
+        bbox = data.get('bbox')
+        zoom = data.get('zoom')
+        cluster = data.get('cluster') is True or str(data.get('cluster')).lower() in ('1', 'true', 'yes')
+        previous_bbox = data.get('previous_bbox')
+        previous_zoom = data.get('previous_zoom', zoom)
+        since = data.get('since')
+        previous_version = data.get('version')
+        try:
+            if bbox is not None:
+                bbox = parse_bbox(bbox)
+            if previous_bbox is not None:
+                previous_bbox = parse_bbox(previous_bbox)
+            zoom = float(zoom) if zoom is not None else None
+            previous_zoom = float(previous_zoom) if previous_zoom is not None else None
+            for value in (zoom, previous_zoom):
+                if value is not None and not 0 <= value <= 30:
+                    raise ValueError("zoom ngoài khoảng 0..30")
+        except (TypeError, ValueError) as e:
+            return jsonify({"success": False, "message": f"bbox / zoom không hợp lệ: {e}"}), 400
+        if cluster and zoom is None:
+            return jsonify({"success": False, "message": "Chế độ cluster cần zoom"}), 400
+        cluster = cluster and zoom < CLUSTER_MAX_ZOOM
         
-        # Hàm parse price_range string thành số
-        def parse_price_range(price_range_str):
-            """
-            Parse "50,000đ-150,000đ" -> (50000, 150000)
-            Parse "300,000đ+" -> (300000, float('inf'))
-            """
-            if not price_range_str:
-                return (0, float('inf'))
-            
-            try:
-                # Remove "đ" và spaces
-                price_str = price_range_str.replace('đ', '').replace(' ', '').replace(',', '')
-                
-                if '+' in price_str:
-                    # "300000+" -> min=300000, max=inf
-                    min_val = int(price_str.replace('+', ''))
-                    return (min_val, float('inf'))
-                elif '-' in price_str:
-                    # "50000-150000" -> (50000, 150000)
-                    parts = price_str.split('-')
-                    return (int(parts[0]), int(parts[1]))
-                else:
-                    # Single value
-                    val = int(price_str)
-                    return (val, val)
-            except:
-                return (0, float('inf'))
-        
-        # Hàm tính khoảng cách (Haversine formula)
-        def calculate_distance(lat1, lon1, lat2, lon2):
-            import math
-            R = 6371  # Bán kính trái đất (km)
-            
-            dlat = math.radians(lat2 - lat1)
-            dlon = math.radians(lon2 - lon1)
-            
-            a = (math.sin(dlat / 2) ** 2 + 
-                 math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * 
-                 math.sin(dlon / 2) ** 2)
-            c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-            
-            return R * c
+        # Làm tròn tọa độ để các request gần nhau (pan nhẹ) dùng chung kết quả cache
+        user_lat = round_coord(user_lat)
+        user_lon = round_coord(user_lon)
+        dataset = DATA.current
+        cache_params = {
+            "version": dataset.version,
+            "lat": user_lat,
+            "lon": user_lon,
+            "radius": radius,
+            "categories": canonical_list(filter_categories),
+            "min_price": min_price,
+            "max_price": max_price,
+            "min_rating": min_rating,
+            "max_rating": max_rating,
+            "tags": canonical_list(filter_tags),
+            "limit": limit,
+            "bbox": bbox,
+            "zoom": zoom,
+            "cluster": cluster
+        }
         
-        # Lọc restaurants
-        filtered_restaurants = []
+        def run_filter():
+            # Chỉ nhà hàng có tọa độ; category / tags (bitset) -> giá / rating -> bán kính qua FilterPlan
+            # filter_categories = None: không lọc category, [] hoặc [1,2,3]: lọc strict
+            has_location = bool(user_lat and user_lon)
+            plan = FilterPlan(
+                categories=filter_categories, tags=filter_tags,
+                min_price=min_price, max_price=max_price, min_rating=min_rating, max_rating=max_rating,
+                require_coords=True,
+                lat=user_lat if has_location else None, lon=user_lon if has_location else None,
+                radius_km=radius,
+            )
+            rows, row_distances = plan.run(dataset)
+
+            filtered_restaurants = []
+            for row in rows.tolist():
+                distance = row_distances.get(row)
+                filtered_restaurants.append(to_marker(
+                    dataset.restaurants[row], round(distance, 2) if distance is not None else None
+                ))
         
-        for restaurant in DB_RESTAURANTS:
-            rest_lat = restaurant.get('lat')
-            rest_lon = restaurant.get('lon')
-            
-            if not rest_lat or not rest_lon:
-                continue
-            
-            # Filter by radius nếu có vị trí người dùng
+            # Sắp xếp theo khoảng cách nếu có vị trí người dùng
             if user_lat and user_lon:
-                distance = calculate_distance(user_lat, user_lon, rest_lat, rest_lon)
-                if distance > radius:
-                    continue
-            else:
-                distance = None
-            
-            # Filter by category
-            # If filter_categories is explicitly set (empty list or values), apply strict filtering
-            # If filter_categories is None, don't filter by category (show all)
-            if filter_categories is not None:
-                if restaurant.get('category_id') not in filter_categories:
-                    continue
-            
-            # Filter by price range
-            if min_price is not None or max_price is not None:
-                price_range = restaurant.get('price_range', '')
-                rest_min, rest_max = parse_price_range(price_range)
-                
-                # Kiểm tra overlap: restaurant price range có giao với filter range không
-                if min_price is not None and rest_max < min_price:
-                    continue
-                if max_price is not None and rest_min > max_price:
-                    continue
-            
-            # Filter by rating
-            rating = restaurant.get('rating', 0)
-            if rating < min_rating or rating > max_rating:
-                continue
-            
-            # Filter by tags
-            if filter_tags:
-                restaurant_tags = restaurant.get('tags', [])
-                if not any(tag in restaurant_tags for tag in filter_tags):
-                    continue
-            
-            # Tạo marker object với format frontend expect
-            category_id = restaurant.get('category_id', 1)
-            
-            # Map category_id sang dishType và pinColor
-            category_map = {
-                1: {"dishType": "dry", "pinColor": "red"},
-                2: {"dishType": "soup", "pinColor": "blue"},
-                3: {"dishType": "vegetarian", "pinColor": "green"},
-                4: {"dishType": "salty", "pinColor": "orange"},
-                5: {"dishType": "seafood", "pinColor": "purple"}
-            }
-            category_info = category_map.get(category_id, {"dishType": "dry", "pinColor": "red"})
-            
-            marker = {
-                "id": restaurant.get('id'),
-                "name": restaurant.get('name'),
-                "address": restaurant.get('address'),
-                "position": {
-                    "lat": rest_lat,
-                    "lon": rest_lon
-                },
-                "dishType": category_info["dishType"],
-                "pinColor": category_info["pinColor"],
-                "rating": rating,
-                "price_range": restaurant.get('price_range'),
-                "phone_number": restaurant.get('phone_number'),
-                "open_hours": restaurant.get('open_hours'),
-                "main_image_url": restaurant.get('main_image_url'),
-                "tags": restaurant.get('tags', [])
-            }
-            
-            # Thêm khoảng cách nếu có
-            if distance is not None:
-                marker['distance'] = round(distance, 2)
-            
-            filtered_restaurants.append(marker)
+                filtered_restaurants.sort(key=lambda x: x.get('distance', float('inf')))
         
-        # Sắp xếp theo khoảng cách nếu có vị trí người dùng
-        if user_lat and user_lon:
-            filtered_restaurants.sort(key=lambda x: x.get('distance', float('inf')))
+            # Giới hạn số lượng kết quả nếu có limit
+            if limit is not None:
+                filtered_restaurants = filtered_restaurants[:limit]
         
-        # Giới hạn số lượng kết quả nếu có limit
-        if limit is not None:
-            filtered_restaurants = filtered_restaurants[:limit]
+            return {
+                "success": True,
+                "total": len(filtered_restaurants),
+                "places": filtered_restaurants,
+                "filters_applied": {
+                    "has_location": user_lat is not None and user_lon is not None,
+                    "radius_km": radius if user_lat and user_lon else None,
+                    "categories": filter_categories,
+                    "min_price": min_price,
+                    "max_price": max_price,
+                    "min_rating": min_rating,
+                    "max_rating": max_rating,
+                    "tags": filter_tags
+                }
+            }
         
-        return jsonify({
-            "success": True,
-            "total": len(filtered_restaurants),
-            "places": filtered_restaurants,
-            "filters_applied": {
-                "has_location": user_lat is not None and user_lon is not None,
-                "radius_km": radius if user_lat and user_lon else None,
-                "categories": filter_categories,
-                "min_price": min_price,
-                "max_price": max_price,
-                "min_rating": min_rating,
-                "max_rating": max_rating,
-                "tags": filter_tags
+        def run_viewport(bbox=bbox, zoom=zoom):
+            # Markers trong khung nhìn (grid index), thứ hạng tĩnh cao trước, cắt theo cap của zoom
+            has_location = bool(user_lat and user_lon)
+            plan = FilterPlan(
+                categories=filter_categories, tags=filter_tags,
+                min_price=min_price, max_price=max_price, min_rating=min_rating, max_rating=max_rating,
+                require_coords=True,
+                lat=user_lat if has_location else None, lon=user_lon if has_location else None,
+                bbox=bbox,
+            )
+            rows, row_distances = plan.run(dataset)
+            cap = viewport_cap(zoom, limit)
+            top = top_ranked(dataset.columns, rows, cap)
+
+            markers = []
+            for row in top.tolist():
+                distance = row_distances.get(row)
+                markers.append(to_marker(
+                    dataset.restaurants[row], round(distance, 2) if distance is not None else None
+                ))
+            return {
+                "success": True,
+                "total": len(markers),
+                "total_in_view": len(rows),
+                "truncated": len(rows) > len(markers),
+                "places": markers,
+                "filters_applied": {
+                    "has_location": has_location,
+                    "bbox": bbox,
+                    "zoom": zoom,
+                    "max_markers": cap,
+                    "categories": filter_categories,
+                    "min_price": min_price,
+                    "max_price": max_price,
+                    "min_rating": min_rating,
+                    "max_rating": max_rating,
+                    "tags": filter_tags
+                }
+            }
+        
+        def run_clusters():
+            # Zoom thấp: gộp theo ô lưới phân cấp, chỉ ô có 1 nhà hàng mới trả về marker đầy đủ
+            has_location = bool(user_lat and user_lon)
+            plan = FilterPlan(
+                categories=filter_categories, tags=filter_tags,
+                min_price=min_price, max_price=max_price, min_rating=min_rating, max_rating=max_rating,
+                require_coords=True,
+                lat=user_lat if has_location else None, lon=user_lon if has_location else None,
+                radius_km=radius if bbox is None else None, bbox=bbox,
+            )
+            rows, row_distances = plan.run(dataset)
+            clusters, singles = cluster_rows(dataset.columns, rows, zoom)
+
+            markers = []
+            for row in top_ranked(dataset.columns, singles).tolist():
+                distance = row_distances.get(row)
+                markers.append(to_marker(
+                    dataset.restaurants[row], round(distance, 2) if distance is not None else None
+                ))
+            return {
+                "success": True,
+                "total": len(rows),
+                "clusters": clusters,
+                "places": markers,
+                "filters_applied": {
+                    "has_location": has_location,
+                    "radius_km": radius if has_location and bbox is None else None,
+                    "bbox": bbox,
+                    "zoom": zoom,
+                    "categories": filter_categories,
+                    "min_price": min_price,
+                    "max_price": max_price,
+                    "min_rating": min_rating,
+                    "max_rating": max_rating,
+                    "tags": filter_tags
+                }
             }
-        }), 200
+        
+        if cluster or bbox is None:
+            compute = run_clusters if cluster else run_filter
+            return jsonify(MAP_FILTER_CACHE.get_or_compute(cache_params, compute)), 200
+
+        # Chế độ khung nhìn: token để lần pan sau chỉ nhận markers vào / ra khỏi khung nhìn
+        result = MAP_FILTER_CACHE.get_or_compute(cache_params, run_viewport)
+        view_filters = {key: value for key, value in cache_params.items() if key not in ('version', 'bbox', 'zoom')}
+        tag = dataset.content_tag
+        previous = None
+        if previous_bbox is not None:
+            # Dữ liệu đã đổi (upsert / reload) từ lần trước thì không diff được: trả về đầy đủ
+            if previous_version == tag:
+                previous = (previous_bbox, previous_zoom)
+        elif since is not None:
+            try:
+                previous = parse_view_token(since, tag, view_filters)
+            except ValueError as e:
+                return jsonify({"success": False, "message": str(e)}), 400
+        response = {
+            **result, "delta": previous is not None,
+            "token": view_token(tag, bbox, zoom, view_filters), "version": tag,
+        }
+        if previous is not None:
+            # Kết quả khung nhìn trước thường vẫn còn trong cache (client vừa gọi)
+            previous_result = MAP_FILTER_CACHE.get_or_compute(
+                {**cache_params, "bbox": previous[0], "zoom": previous[1]},
+                lambda: run_viewport(*previous),
+            )
+            del response["places"]
+            response["added"], response["removed"] = marker_delta(previous_result["places"], result["places"])
+        return jsonify(response), 200
         
     except Exception as e:
         return jsonify({
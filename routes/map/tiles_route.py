@@ -0,0 +1,84 @@
+# routes/map/tiles_route.py
+from flask import Response, jsonify, redirect, request, url_for
+from routes.map import map_bp
+from core.cache import TILE_CACHE, canonical_list
+from core.database import DATA
+from core.filters import FilterPlan, top_ranked
+from core.tiles import (MAX_TILE_ZOOM, POINT_DTYPE, TILE_FORMAT_VERSION, TILE_MAX_POINTS,
+                        encode_tile, in_tile, tile_bbox, valid_tile)
+
+# URL tile có version dữ liệu (?v=) nên nội dung không bao giờ đổi -> CDN / trình duyệt cache lâu
+IMMUTABLE = 'public, max-age=31536000, immutable'
+_BBOX_MARGIN = 1e-7  # Nới bbox khi tra grid index, tile nào chứa điểm do ô lưới quyết định
+
+
+def _parse_categories(value):
+    """"1,2" -> [1, 2]; không truyền -> None (không lọc). ValueError nếu có giá trị không phải số."""
+    if value is None:
+        return None
+    return sorted({int(part) for part in value.split(',') if part.strip()})
+
+
+@map_bp.route("/map/tiles", methods=["GET"])
+def get_tiles_info():
+    """
+    Thông tin lấy tile điểm nhà hàng: URL mẫu (đã gắn version dữ liệu hiện tại), zoom tối đa
+    và định dạng bản ghi. Client gọi lại khi cần để biết version mới.
+    """
+    tag = DATA.current.content_tag
+    response = jsonify({
+        "success": True,
+        "version": tag,
+        "tiles": f"/api/map/tiles/{{z}}/{{x}}/{{y}}?v={tag}",
+        "minzoom": 0,
+        "maxzoom": MAX_TILE_ZOOM,
+        "format": {
+            "version": TILE_FORMAT_VERSION,
+            "header": "<4sBBBBIII (magic, format version, z, flags, 0, x, y, count)",
+            "point": f"{POINT_DTYPE.itemsize} bytes <HHbB (x, y trong tile 0..65535, category_id, rating x 20)",
+            "ids": "count x (uint8 độ dài + UTF-8)",
+            "max_points": TILE_MAX_POINTS,
+        },
+    })
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+@map_bp.route("/map/tiles/<int:z>/<int:x>/<int:y>", methods=["GET"])
+def get_tile(z, x, y):
+    """
+    Tile nhị phân các nhà hàng trong tile z/x/y (định dạng xem core/tiles.py), rating cao trước.
+    Params:
+        - v: str - Version dữ liệu (lấy từ /api/map/tiles); thiếu hoặc đã cũ thì redirect sang URL mới
+        - categories: str (optional) - Lọc category, vd "1,2"
+    Tile được build khi có request đầu tiên rồi giữ trong LRU theo version dữ liệu.
+    """
+    if not valid_tile(z, x, y):
+        return jsonify({"success": False, "message": "Tile không hợp lệ"}), 404
+    try:
+        categories = _parse_categories(request.args.get('categories'))
+    except ValueError:
+        return jsonify({"success": False, "message": "categories phải là danh sách số, vd 1,2"}), 400
+
+    dataset = DATA.current
+    tag = dataset.content_tag
+    if request.args.get('v') != tag:
+        params = {'v': tag}
+        if categories is not None:
+            params['categories'] = ','.join(map(str, categories))
+        response = redirect(url_for('map.get_tile', z=z, x=x, y=y, **params), code=302)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+
+    def build():
+        plan = FilterPlan(categories=categories, require_coords=True, bbox=tile_bbox(z, x, y, _BBOX_MARGIN))
+        rows, _ = plan.run(dataset)
+        rows = in_tile(dataset.columns, rows, z, x, y)
+        top = top_ranked(dataset.columns, rows, TILE_MAX_POINTS)
+        return encode_tile(dataset.columns, top, z, x, y, truncated=len(top) < len(rows))
+
+    cache_params = {"v": tag, "z": z, "x": x, "y": y, "categories": canonical_list(categories)}
+    response = Response(TILE_CACHE.get_or_compute(cache_params, build), mimetype='application/octet-stream')
+    response.set_etag(f"{tag}-{z}-{x}-{y}-{request.args.get('categories', '')}")
+    response.headers['Cache-Control'] = IMMUTABLE
+    return response.make_conditional(request)
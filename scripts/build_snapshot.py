@@ -0,0 +1,44 @@
+# scripts/build_snapshot.py
+# Build snapshot nhị phân (data/snapshot.bin) từ data/restaurants.json + data/menus.json.
+# Chạy lại mỗi khi sửa data/*.json, VD trong build command khi deploy:
+#     python scripts/build_snapshot.py
+# Backend tự dùng snapshot nếu còn khớp JSON, không thì build từ JSON như cũ.
+import argparse
+import os
+import sys
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from core.dataset import build_dataset  # noqa: E402
+from core.snapshot import source_fingerprint, write_snapshot  # noqa: E402
+
+DATA_DIR = os.path.join(ROOT_DIR, 'data')
+SOURCES = (os.path.join(DATA_DIR, 'restaurants.json'), os.path.join(DATA_DIR, 'menus.json'))
+
+
+def load_json(path):
+    import json
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build snapshot nhị phân cho backend.")
+    parser.add_argument('--output', default=os.getenv('DATA_SNAPSHOT_PATH', os.path.join(DATA_DIR, 'snapshot.bin')))
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    fingerprint = source_fingerprint(SOURCES)
+    dataset = build_dataset(load_json(SOURCES[0]), load_json(SOURCES[1]))
+    size = write_snapshot(args.output, dataset, SOURCES)
+
+    print(f"✅ Đã ghi {args.output} ({size / 1024:.0f} KB) trong {time.perf_counter() - started:.2f}s")
+    print(f"   {len(dataset.restaurants)} nhà hàng, {len(dataset.menus)} món, {len(dataset.search_index)} token")
+    for name, digest in fingerprint.items():
+        print(f"   {name}: {digest[:12]}")
+
+
+if __name__ == '__main__':
+    main()
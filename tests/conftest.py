@@ -0,0 +1,53 @@
+# tests/conftest.py
+# --- Fixture chung: app Flask + dataset build từ data/*.json (không dùng snapshot build sẵn) ---
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+# Snapshot trong data/ có thể cũ / chưa build -> luôn build từ JSON để test ổn định
+os.environ.setdefault('DATA_SNAPSHOT_PATH', os.path.join(ROOT, 'tests', 'no-snapshot.bin'))
+
+from App import app  # noqa: E402
+from core.database import DATA  # noqa: E402
+
+
+@pytest.fixture
+def client():
+    return app.test_client()
+
+
+@pytest.fixture
+def dataset():
+    return DATA.current
+
+
+@pytest.fixture
+def restore_data():
+    """Test có upsert / delete: trả lại generation ban đầu sau khi chạy."""
+    original = DATA.current
+    yield original
+    DATA.swap(original)
+
+
+def sample_restaurant(**overrides):
+    """Nhà hàng mới (tên không trùng dữ liệu thật) để thử upsert."""
+    restaurant = {
+        'id': 'test-zzyzx-1',
+        'name': 'Quán Zzyzx Thử Nghiệm',
+        'category_id': 1,
+        'rating': 4.9,
+        'price_range': '50.000-100.000 đ',
+        'address': '1 Tràng Tiền, Hoàn Kiếm, Hà Nội, Vietnam',
+        'lat': 21.0245,
+        'lon': 105.8571,
+        'phone_number': None,
+        'open_hours': None,
+        'opening_hours_full': [],
+        'image_url': None,
+        'tags': ['Phở/Bún'],
+    }
+    restaurant.update(overrides)
+    return restaurant
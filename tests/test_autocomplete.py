@@ -0,0 +1,118 @@
+# tests/test_autocomplete.py
+# --- Gợi ý theo tiền tố cho thanh search: tên nhà hàng / món / tag, có dấu hoặc không dấu ---
+import pytest
+
+from conftest import sample_restaurant
+import numpy as np
+
+from core.autocomplete import _SCAN_LIMIT, MAX_SUGGESTIONS, _key
+from core.search import fold_text
+
+
+def _starts_word(label, query, folded=True):
+    """query là tiền tố của phần label bắt đầu từ 1 từ nào đó."""
+    text, prefix = (_key(fold_text(label)), _key(fold_text(query))) if folded else (_key(label), _key(query))
+    return (' ' + text).find(' ' + prefix) >= 0
+
+
+@pytest.mark.parametrize('query', ['p', 'ph', 'pho', 'pizza 4', '4p', 'com t', 'ca phe', 'bun'])
+def test_suggestions_match_prefix(dataset, query):
+    suggestions = dataset.autocomplete.suggest(query, MAX_SUGGESTIONS)
+    assert suggestions
+    assert all(_starts_word(s['text'], query) for s in suggestions)
+    assert len({(s['type'], s['text'], s.get('id')) for s in suggestions}) == len(suggestions)
+
+
+def test_accented_query_only_matches_accented(dataset):
+    accented = dataset.autocomplete.suggest('phở', MAX_SUGGESTIONS)
+    folded = dataset.autocomplete.suggest('pho', MAX_SUGGESTIONS)
+    assert accented and all(_starts_word(s['text'].lower(), 'phở', folded=False) for s in accented)
+    assert any(not _starts_word(s['text'].lower(), 'phở', folded=False) for s in folded)
+    assert dataset.autocomplete.suggest('cơm tấm', 5) == dataset.autocomplete.suggest('Cơm Tấm', 5)
+
+
+def test_heavy_prefix_tops_match_full_ranking(dataset):
+    """Top tính sẵn cho mọi tiền tố khớp > _SCAN_LIMIT key phải giống xếp hạng tính trực tiếp."""
+    index = dataset.autocomplete
+    prefixes = list(index._top_prefixes)
+    assert {'p', 'c', 'b'} <= set(prefixes)
+    for prefix in prefixes:
+        lo, hi = index._range(prefix)
+        assert hi - lo > _SCAN_LIMIT
+        assert index._top(prefix).tolist() == index._rank(prefix, MAX_SUGGESTIONS).tolist()
+    # Tiền tố không tính sẵn thì duyệt ít key
+    for prefix in ('pizza 4', 'com t', 'zz'):
+        if prefix not in prefixes:
+            lo, hi = index._range(prefix)
+            assert hi - lo <= _SCAN_LIMIT
+
+
+def test_ties_at_cutoff_are_deterministic(dataset):
+    """Thứ tự toàn phần (trọng số giảm, loại, thứ tự build): gợi ý bị cắt luôn đứng sau gợi ý cuối."""
+    index = dataset.autocomplete
+    for prefix in ('p', 'pho', 'com', 'ca phe'):
+        lo, hi = index._range(prefix)
+        candidates = np.unique(index._key_targets[lo:hi])
+        top = index._top(prefix)[:5].tolist()
+        rank = lambda i: (-index._weights[i], index._kinds[i], i)
+        assert [rank(i) for i in top] == sorted(rank(i) for i in top)
+        assert all(rank(i) > rank(top[-1]) for i in set(candidates.tolist()) - set(top))
+
+
+def test_ranked_by_weight(dataset):
+    index = dataset.autocomplete
+    for prefix in ('p', 'pizza', 'com'):
+        top = index._rank(prefix, MAX_SUGGESTIONS)
+        weights = index._weights[top].tolist()
+        assert weights == sorted(weights, reverse=True)
+
+
+def test_restaurant_ids(dataset):
+    suggestions = dataset.autocomplete.suggest('pizza', MAX_SUGGESTIONS)
+    restaurants = [s for s in suggestions if s['type'] == 'restaurant']
+    assert restaurants
+    for s in restaurants:
+        assert dataset.restaurants_by_id[s['id']]['name'] == s['text']
+    assert all('id' not in s for s in suggestions if s['type'] != 'restaurant')
+
+
+def test_limits(client, dataset):
+    assert dataset.autocomplete.suggest('p', 3) == dataset.autocomplete.suggest('p', MAX_SUGGESTIONS)[:3]
+    assert dataset.autocomplete.suggest('p', 0) == []
+    assert dataset.autocomplete.suggest('   ', 5) == []
+    assert dataset.autocomplete.suggest('zzzz', 5) == []
+    response = client.get('/api/autocomplete?q=p&limit=100').get_json()
+    assert response['success'] and len(response['suggestions']) == MAX_SUGGESTIONS
+    assert len(client.get('/api/autocomplete?q=p').get_json()['suggestions']) == 5
+    assert client.get('/api/autocomplete?q=').get_json()['suggestions'] == []
+
+
+def test_patched_after_upsert(dataset):
+    dataset = dataset.clone()
+    dataset.upsert_restaurant(sample_restaurant())
+    assert [s['id'] for s in dataset.autocomplete.suggest('zzyzx', 5)] == ['test-zzyzx-1']
+    assert {'text': 'Phở/Bún', 'type': 'tag'} in dataset.autocomplete.suggest('pho', MAX_SUGGESTIONS)
+    dataset.delete_restaurant('test-zzyzx-1')
+    assert dataset.autocomplete.suggest('zzyzx', 5) == []
+
+
+def test_heavy_prefix_tops_after_updates(dataset):
+    """Sau khi hạ / nâng rating hoặc xóa nhà hàng, top của tiền tố nặng vẫn giống xếp hạng đầy đủ."""
+    dataset = dataset.clone()
+    index = dataset.autocomplete
+    top = [index._ids[i] for i in index._top('p').tolist() if index._ids[i] is not None]
+    dataset.delete_restaurant(top[0])
+    for rid in top[1:]:
+        dataset.upsert_restaurant(dict(dataset.restaurants_by_id[rid].to_dict(), rating=1.0))
+    low = [r for r in dataset.restaurants if r['name'].lower().startswith('p')][-1]
+    dataset.upsert_restaurant(dict(low.to_dict(), rating=5.0))
+
+    index = dataset.autocomplete
+    for prefix in list(index._top_prefixes) + ['pho', 'pizza 4', 'zz']:
+        lo, hi = index._range(prefix)
+        extra = [t for k, t in zip(index._extra_keys, index._extra_targets) if k.startswith(prefix)]
+        candidates = np.concatenate((index._key_targets[lo:hi], np.array(extra, dtype=np.int32)))
+        assert index._top(prefix).tolist() == index._ranked(candidates, MAX_SUGGESTIONS).tolist()
+    suggestions = index.suggest('p', MAX_SUGGESTIONS)
+    assert top[0] not in [s.get('id') for s in suggestions]
+    assert {'text': low['name'], 'type': 'restaurant', 'id': low['id']} in suggestions
@@ -0,0 +1,14 @@
+from routes.food import data_route
+
+
+def test_cache_stats_requires_admin_token(client, monkeypatch):
+    monkeypatch.setattr(data_route, 'ADMIN_TOKEN', '')
+    assert client.get('/api/cache/stats').status_code == 401
+
+    monkeypatch.setattr(data_route, 'ADMIN_TOKEN', 'secret')
+    assert client.get('/api/cache/stats').status_code == 401
+    assert client.get('/api/cache/stats', headers={'X-Admin-Token': 'wrong'}).status_code == 401
+
+    res = client.get('/api/cache/stats', headers={'X-Admin-Token': 'secret'})
+    assert res.status_code == 200
+    assert res.get_json()['success'] is True
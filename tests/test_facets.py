@@ -0,0 +1,22 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from core import facets
+
+
+def test_custom_province_lru_is_thread_safe(dataset, monkeypatch):
+    monkeypatch.setattr(facets, '_CUSTOM_CACHE_SIZE', 4)
+    index = dataset.facets.clone()
+    restaurants = dataset.restaurants
+    provinces = ["quận 1", "quận 3", "phường", "huyện", "thị xã", "thị trấn"]
+    expected = {p: index.province_mask(p, restaurants).copy() for p in provinces}
+
+    def lookup(i):
+        province = provinces[i % len(provinces)]
+        return province, index.province_mask(province, restaurants)
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        for province, mask in pool.map(lookup, range(300)):
+            assert np.array_equal(mask, expected[province])
+    assert len(index._custom) <= 4
@@ -0,0 +1,66 @@
+# tests/test_fuzzy.py
+# --- Tìm kiếm gần đúng bằng trigram: gõ sai chính tả, thiếu dấu, thừa/thiếu khoảng trắng ---
+import pytest
+
+from conftest import sample_restaurant
+from core.fuzzy_index import fuzzy_key, similarity, trigrams
+from core.search import fold_text
+
+
+def _names(dataset, scores):
+    return [dataset.restaurants_by_id[rid]['name'] for rid in scores if rid in dataset.restaurants_by_id]
+
+
+def test_helpers():
+    assert fuzzy_key('Phở Bò!') == 'pho bo'
+    assert trigrams('hai di lao') == trigrams('haidilao')
+    assert similarity('pizza', 'pizza 4p s') == 1.0
+    assert similarity('haidilao', 'haidilao hot pot') == 1.0
+    assert 0 < similarity('piza', 'pizza') < 1
+
+
+@pytest.mark.parametrize('query, expected', [
+    ('piza', 'pizza'),
+    ('hai di lao', 'haidilao'),
+    ('haidilao', 'haidilao'),
+    ('pho bo', 'pho bo'),
+    ('com tam', 'com tam'),
+])
+def test_typos_and_missing_diacritics(dataset, query, expected):
+    scores = dataset.fuzzy_index.match(query)
+    assert scores
+    best = max(scores.values())
+    top = [rid for rid, score in scores.items() if score == best]
+    assert all(expected in fuzzy_key(name) for name in _names(dataset, top))
+
+
+def test_name_beats_tag(dataset):
+    scores = dataset.fuzzy_index.match('piza')
+    by_name = [rid for rid in scores if 'pizza' in fold_text(dataset.restaurants_by_id[rid]['name'])]
+    by_tag_only = set(scores) - set(by_name)
+    assert by_name and by_tag_only
+    assert min(scores[rid] for rid in by_name) > max(scores[rid] for rid in by_tag_only)
+
+
+def test_threshold(dataset):
+    loose = dataset.fuzzy_index.match('piza', threshold=0.3)
+    strict = dataset.fuzzy_index.match('piza', threshold=0.9)
+    assert set(strict) <= set(loose) and len(strict) < len(loose)
+    assert dataset.fuzzy_index.match('qxjw') == {}
+
+
+def test_fuzzy_route(client):
+    exact = client.post('/api/search', json={'query': 'piza'}).get_json()
+    fuzzy = client.post('/api/search', json={'query': 'piza', 'fuzzy': True, 'limit': 5}).get_json()
+    assert exact['total'] == 0
+    assert fuzzy['total'] > 0 and all('pizza' in fold_text(p['name']) for p in fuzzy['places'])
+    accented = client.post('/api/search', json={'query': 'hải đi lao', 'fuzzy': True, 'limit': 3}).get_json()
+    assert all('haidilao' in fold_text(p['name']) for p in accented['places'])
+
+
+def test_fuzzy_after_upsert(dataset):
+    dataset = dataset.clone()
+    dataset.upsert_restaurant(sample_restaurant())
+    assert 'test-zzyzx-1' in dataset.fuzzy_index.match('zyzx thu nghiem')
+    dataset.delete_restaurant('test-zzyzx-1')
+    assert 'test-zzyzx-1' not in dataset.fuzzy_index.match('zyzx thu nghiem')
@@ -0,0 +1,125 @@
+# tests/test_map.py
+# --- /api/map/filter: khung nhìn (bbox), cluster theo zoom, token / since chỉ trả về phần thay đổi ---
+import numpy as np
+
+from conftest import sample_restaurant
+from core.database import upsert_restaurant
+
+HANOI = [20.98, 105.80, 21.06, 105.88]  # [south, west, north, east]
+HANOI_PANNED = [20.99, 105.83, 21.07, 105.91]
+
+
+def _view(client, **body):
+    response = client.post('/api/map/filter', json=body)
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()
+
+
+def _in_bbox(position, bbox):
+    south, west, north, east = bbox
+    return south <= position['lat'] <= north and west <= position['lon'] <= east
+
+
+def _rows_in_bbox(dataset, bbox):
+    columns = dataset.columns
+    south, west, north, east = bbox
+    with np.errstate(invalid='ignore'):
+        inside = (columns.lat >= south) & (columns.lat <= north) & (columns.lon >= west) & (columns.lon <= east)
+    return np.nonzero(inside & columns.alive)[0]
+
+
+def test_viewport_returns_markers_in_bbox(client, dataset):
+    result = _view(client, bbox=HANOI, zoom=16)
+    expected = {dataset.columns.ids[row] for row in _rows_in_bbox(dataset, HANOI)}
+    assert result['total_in_view'] == len(expected) > 0
+    assert {p['id'] for p in result['places']} == expected
+    assert all(_in_bbox(p['position'], HANOI) for p in result['places'])
+    assert result['delta'] is False and result['token']
+
+
+def test_viewport_cap_keeps_top_ranked(client, dataset):
+    full = _view(client, bbox=HANOI, zoom=16)
+    capped = _view(client, bbox=HANOI, zoom=16, limit=5)
+    assert capped['total'] == 5 and capped['truncated'] is True
+    ratings = sorted((p['rating'] or 0 for p in full['places']), reverse=True)
+    assert sorted((p['rating'] or 0 for p in capped['places']), reverse=True) == ratings[:5]
+
+
+def test_clusters_cover_every_restaurant(client, dataset):
+    result = _view(client, bbox=HANOI, zoom=10, cluster=True)
+    assert result['total'] == len(_rows_in_bbox(dataset, HANOI))
+    assert sum(c['count'] for c in result['clusters']) + len(result['places']) == result['total']
+    counts = [c['count'] for c in result['clusters']]
+    assert counts == sorted(counts, reverse=True) and min(counts) >= 2
+    for c in result['clusters']:
+        assert sum(c['categories'].values()) == c['count']
+        assert _in_bbox(c['position'], c['bounds'])
+        assert _in_bbox(c['position'], HANOI)
+
+
+def test_clusters_split_when_zooming_in(client):
+    low = _view(client, bbox=HANOI, zoom=8, cluster=True)
+    high = _view(client, bbox=HANOI, zoom=15, cluster=True)
+    assert len(low['clusters']) + len(low['places']) < len(high['clusters']) + len(high['places'])
+    assert low['total'] == high['total']
+
+
+def _check_delta(delta, old, new):
+    old_ids = {p['id'] for p in old['places']}
+    new_ids = {p['id'] for p in new['places']}
+    assert delta['delta'] is True and 'places' not in delta
+    assert {p['id'] for p in delta['added']} == new_ids - old_ids
+    assert set(delta['removed']) == old_ids - new_ids
+    assert delta['total'] == new['total'] and delta['token'] == new['token']
+
+
+def test_since_token_returns_delta(client):
+    old = _view(client, bbox=HANOI, zoom=16)
+    new = _view(client, bbox=HANOI_PANNED, zoom=16)
+    delta = _view(client, bbox=HANOI_PANNED, zoom=16, since=old['token'])
+    _check_delta(delta, old, new)
+    assert delta['added'] and delta['removed']
+
+
+def test_previous_bbox_returns_delta(client):
+    old = _view(client, bbox=HANOI, zoom=16, categories=[1])
+    new = _view(client, bbox=HANOI_PANNED, zoom=16, categories=[1])
+    delta = _view(
+        client, bbox=HANOI_PANNED, zoom=16, categories=[1],
+        previous_bbox=HANOI, previous_zoom=16, version=old['version'],
+    )
+    _check_delta(delta, old, new)
+    # Thiếu version: không biết dữ liệu lúc đó nên trả về đầy đủ
+    full = _view(client, bbox=HANOI_PANNED, zoom=16, categories=[1], previous_bbox=HANOI, previous_zoom=16)
+    assert full['delta'] is False and full['places'] == new['places']
+
+
+def test_token_with_other_filters_is_ignored(client):
+    old = _view(client, bbox=HANOI, zoom=16, categories=[1])
+    result = _view(client, bbox=HANOI_PANNED, zoom=16, since=old['token'])
+    assert result['delta'] is False and 'places' in result
+
+
+def test_token_from_old_data_version_is_ignored(client, restore_data):
+    old = _view(client, bbox=HANOI, zoom=16)
+    upsert_restaurant(sample_restaurant())
+    result = _view(client, bbox=HANOI_PANNED, zoom=16, since=old['token'])
+    assert result['delta'] is False and result['token'] != old['token']
+    assert 'test-zzyzx-1' in {p['id'] for p in result['places']}
+
+
+def test_upsert_between_delta_calls_returns_full_result(client, restore_data):
+    old = _view(client, bbox=HANOI, zoom=16)
+    first = _view(client, bbox=HANOI_PANNED, zoom=16, since=old['token'])
+    assert first['delta'] is True
+
+    upsert_restaurant(sample_restaurant(lat=21.03, lon=105.87))  # Trong cả 2 khung nhìn
+    for body in ({'since': first['token']}, {'previous_bbox': HANOI, 'version': first['version']}):
+        result = _view(client, bbox=HANOI_PANNED, zoom=16, **body)
+        assert result['delta'] is False and result['version'] != first['version']
+        assert 'test-zzyzx-1' in {p['id'] for p in result['places']}
+
+
+def test_invalid_requests(client):
+    assert client.post('/api/map/filter', json={'bbox': HANOI, 'zoom': 16, 'since': '!!'}).status_code == 400
+    assert client.post('/api/map/filter', json={'bbox': [21.1, 105.8, 20.9, 105.9], 'zoom': 16}).status_code == 400
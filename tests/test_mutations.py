@@ -0,0 +1,219 @@
+# tests/test_mutations.py
+# --- Upsert / delete tăng dần: mọi endpoint thấy cùng 1 generation mới, generation cũ không đổi ---
+import json
+import math
+import threading
+
+import numpy as np
+
+import core.registry as registry
+from conftest import sample_restaurant
+from core.database import DATA, delete_restaurant, upsert_restaurant
+from core.dataset import MenuList, build_dataset, build_restaurants_payload
+from core.payload import COMPRESSOR, ListPayload
+from core.spatial_index import KDTree
+from core.tiles import decode_tile
+
+TILE_ZOOM = 14
+
+
+def _tile_of(lat, lon, z=TILE_ZOOM):
+    n = 1 << z
+    x = int((lon + 180.0) / 360.0 * n)
+    y = int((1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * n)
+    return x, y
+
+
+def _visible(client, restaurant):
+    """Nhà hàng có mặt ở endpoint nào (tên endpoint -> bool)."""
+    rid, lat, lon = restaurant['id'], restaurant['lat'], restaurant['lon']
+    seen = {}
+
+    payload = client.get('/api/restaurants').get_json()
+    seen['list'] = any(r['id'] == rid for r in payload['restaurants'])
+    seen['detail'] = client.get(f'/api/restaurants/{rid}').status_code == 200
+    category = client.get(f"/api/restaurants/category/{restaurant['category_id']}").get_json()
+    seen['category'] = any(r['id'] == rid for r in category['restaurants'])
+    search = client.post('/api/search', json={'query': 'zzyzx', 'limit': 5}).get_json()
+    seen['search'] = [p['id'] for p in search['places']] == [rid]
+    nearby = client.get(f'/api/restaurants/nearby?latitude={lat}&longitude={lon}&k=1').get_json()
+    seen['nearby'] = [r['id'] for r in nearby['restaurants']] == [rid]
+    suggestions = client.get('/api/autocomplete?q=zzyz').get_json()['suggestions']
+    seen['autocomplete'] = any(s.get('id') == rid for s in suggestions)
+    view = client.post('/api/map/filter', json={
+        'bbox': [lat - 0.001, lon - 0.001, lat + 0.001, lon + 0.001], 'zoom': 17,
+    }).get_json()
+    seen['map'] = any(p['id'] == rid for p in view['places'])
+    version = client.get('/api/map/tiles').get_json()['version']
+    x, y = _tile_of(lat, lon)
+    tile = client.get(f'/api/map/tiles/{TILE_ZOOM}/{x}/{y}?v={version}')
+    seen['tile'] = rid in decode_tile(tile.data)['ids']
+    return seen
+
+
+def test_upsert_then_delete_reaches_every_endpoint(client, restore_data):
+    restaurant = sample_restaurant()
+    before = client.get('/api/restaurants')
+    assert not any(_visible(client, restaurant).values())
+
+    upsert_restaurant(restaurant, [{'id': 990001, 'restaurant_id': restaurant['id'], 'dish_name': 'Bún chả Zzyzx'}])
+    seen = _visible(client, restaurant)
+    assert all(seen.values()), seen
+    after = client.get('/api/restaurants')
+    assert after.get_json()['count'] == before.get_json()['count'] + 1
+    assert after.headers['ETag'] != before.headers['ETag']
+    detail = client.get(f"/api/restaurants/{restaurant['id']}").get_json()
+    assert detail['name'] == restaurant['name']
+    assert [item['dish_name'] for item in detail['menu']] == ['Bún chả Zzyzx']
+
+    assert delete_restaurant(restaurant['id'])
+    seen = _visible(client, restaurant)
+    assert not any(seen.values()), seen
+    assert client.get('/api/restaurants').get_json()['count'] == before.get_json()['count']
+    assert client.get(f"/api/restaurants/{restaurant['id']}").status_code == 404
+    assert not delete_restaurant(restaurant['id'])
+
+
+def test_update_moves_restaurant(client, restore_data):
+    restaurant = sample_restaurant()
+    upsert_restaurant(restaurant)
+    moved = sample_restaurant(lat=10.7769, lon=106.7009, category_id=2, address='Quận 1, Hồ Chí Minh, Vietnam')
+    upsert_restaurant(moved)
+    assert all(_visible(client, moved).values())
+    # Vị trí / category cũ không còn giữ nhà hàng
+    seen = _visible(client, restaurant)
+    assert not seen['category'] and not seen['map'] and not seen['tile'] and not seen['nearby']
+    assert client.get('/api/restaurants').get_json()['count'] == len(restore_data.restaurants_by_id) + 1
+
+
+def test_old_generation_is_unchanged(restore_data):
+    old = DATA.current
+    old_tag, old_count = old.content_tag, len(old.restaurants_by_id)
+    old_results = old.search_index.search('phở', 'or')
+    victim = next(iter(old.restaurants_by_id))
+
+    upsert_restaurant(sample_restaurant())
+    delete_restaurant(victim)
+    new = DATA.current
+    assert new is not old and new.version > old.version
+    assert len(old.restaurants_by_id) == old_count and victim in old.restaurants_by_id
+    assert 'test-zzyzx-1' not in old.restaurants_by_id
+    assert old.search_index.search('phở', 'or') == old_results
+    assert old.search_index.search('zzyzx', 'and')[1] == 0
+    assert old.content_tag == old_tag != new.content_tag
+    assert victim not in new.restaurants_by_id
+
+
+def test_mask_from_previous_generation(restore_data):
+    """Mask row ID tính trên generation cũ (ít row hơn) vẫn dùng được sau upsert."""
+    old = DATA.current
+    mask = np.ones(len(old.columns.ids), dtype=bool)
+    upsert_restaurant(sample_restaurant())
+    new = DATA.current
+    results, total = new.search_index.search('zzyzx', 'and', mask=mask)
+    assert total == 0 and not results
+    results, total = new.search_index.search('zzyzx', 'and', mask=np.ones(len(new.columns.ids), dtype=bool))
+    assert total == 1
+
+
+def test_delete_missing(restore_data):
+    count = len(DATA.current.restaurants_by_id)
+    assert not delete_restaurant('missing-id')
+    assert len(DATA.current.restaurants_by_id) == count
+
+
+def test_update_keeps_order(client, restore_data):
+    """Upsert ghi sang row ID mới nhưng nhà hàng giữ nguyên vị trí trong mọi list."""
+    before = client.get('/api/restaurants').get_json()['restaurants']
+    target = before[len(before) // 2]
+    restaurant = DATA.current.restaurants_by_id[target['id']].to_dict()
+    old_row = DATA.current.restaurants_by_id[target['id']].row
+    category = f"/api/restaurants/category/{restaurant['category_id']}"
+    category_before = [r['id'] for r in client.get(category).get_json()['restaurants']]
+
+    assert upsert_restaurant({**restaurant, 'phone_number': '0900000000'}) != old_row
+    after = client.get('/api/restaurants').get_json()['restaurants']
+    assert [r['id'] for r in after] == [r['id'] for r in before]
+    assert [r['id'] for r in client.get(category).get_json()['restaurants']] == category_before
+    assert list(DATA.current.restaurants_by_id) == [r['id'] for r in before]
+    assert DATA.current.dead_rows() == restore_data.dead_rows() + 1
+
+
+def test_payload_is_spliced(client, restore_data, monkeypatch):
+    monkeypatch.setattr(COMPRESSOR, 'submit', lambda payload: None)  # Giữ trạng thái chưa nén
+    victim = list(DATA.current.restaurants_by_id)[0]
+    upsert_restaurant(sample_restaurant())
+    delete_restaurant(victim)
+    payload = DATA.current.payload
+    assert payload.body == build_restaurants_payload(DATA.current.restaurants).body
+    assert payload.etag == DATA.current.content_tag
+    # Bản nén chưa xong thì trả body không nén, ETag vẫn đúng
+    assert not payload.variants
+    response = client.get('/api/restaurants', headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in response.headers and response.data == payload.body
+    assert client.get('/api/restaurants', headers={'If-None-Match': f'"{payload.etag}"'}).status_code == 304
+
+
+def test_list_payload_splice():
+    items = [{'id': i} for i in range(600)]
+    payload = ListPayload.build('restaurants', items)
+    spliced = payload.spliced(300, {'id': 'x'}, 600, etag='e1').spliced(0, None, 599, etag='e2')
+    spliced = spliced.spliced(600, {'id': 'y'}, 600, etag='e3')
+    expected = [{'id': 'x'} if i == 300 else item for i, item in enumerate(items)][1:] + [{'id': 'y'}]
+    assert json.loads(spliced.body) == {'success': True, 'count': 600, 'restaurants': expected}
+    assert json.loads(payload.body)['restaurants'] == items
+
+
+def _knn_ids(dataset, lat, lon, k=5):
+    rows, _ = dataset.knn_index.query_knn(lat, lon, k)
+    return [dataset.columns.ids[row] for row in rows]
+
+
+def test_knn_update_keeps_tree_until_limit(restore_data, monkeypatch):
+    dataset = DATA.current
+    restaurant = next(r.to_dict() for r in dataset.restaurants if r.get('lat') is not None)
+    lat, lon = restaurant['lat'], restaurant['lon']
+    expected = _knn_ids(dataset, lat, lon)
+
+    # Tọa độ không đổi: chỉ trỏ dòng trong cây sang dòng mới, không tách
+    upsert_restaurant({**restaurant, 'rating': 1.0})
+    tree = DATA.current.knn_index
+    assert not len(tree._extra_rows) and all(row >= 0 for row in tree._moved.values())
+    assert _knn_ids(DATA.current, lat, lon) == expected
+
+    # Đổi tọa độ: tách khỏi cây; overlay vượt ngưỡng thì build lại cây
+    monkeypatch.setattr(KDTree, '_overlay_limit', lambda self: 2)
+    for i in range(3):
+        upsert_restaurant(sample_restaurant(id=f'test-zzyzx-{i}', lat=lat + 0.0001 * (i + 1), lon=lon))
+    tree = DATA.current.knn_index
+    assert len(tree._moved) + len(tree._extra_rows) <= 2
+    nearest = _knn_ids(DATA.current, lat + 0.0001, lon, k=1)
+    assert nearest == ['test-zzyzx-0']
+
+
+def test_menu_list_patch():
+    base = [{'id': 1, 'restaurant_id': 'a'}, {'id': 2, 'restaurant_id': 'b'}, {'id': 3, 'restaurant_id': 'a'}]
+    menus = MenuList(base)
+    patched = menus.clone()
+    patched.patch('a', [base[0], base[2]], [{'id': 4, 'restaurant_id': 'a'}])
+    assert [item['id'] for item in patched] == [2, 4]
+    assert len(patched) == 2 and patched[-1]['id'] == 4 and [item['id'] for item in patched[:1]] == [2]
+    assert [item['id'] for item in menus] == [1, 2, 3]
+
+
+def test_background_compaction(monkeypatch):
+    restaurants = [sample_restaurant(id=f'r{i}', name=f'Quán {i}') for i in range(3)]
+    data = registry.DataRegistry(lambda: build_dataset(restaurants, [{'id': 1, 'restaurant_id': 'r1', 'dish_name': 'Phở'}]))
+    monkeypatch.setattr(registry, 'COMPACT_MIN_DEAD', 2)
+
+    for rating in (1.0, 2.0, 3.0, 4.0):
+        data.apply(lambda dataset: dataset.upsert_restaurant({**restaurants[0], 'rating': rating}))
+    tag = data.current.content_tag
+    for thread in threading.enumerate():
+        if thread.name == 'data-compact':
+            thread.join()
+    current = data.current
+    assert current.dead_rows() == 0 and current.content_tag == tag
+    assert [r['id'] for r in current.restaurants] == ['r0', 'r1', 'r2']
+    assert current.restaurants_by_id['r0']['rating'] == 4.0
+    assert [item['dish_name'] for item in current.menus_by_restaurant_id['r1']] == ['Phở']
@@ -0,0 +1,50 @@
+# tests/test_projection.py
+# --- Projection fields=: serializer tính sẵn phải cho đúng JSON như dumps dict từng nhà hàng ---
+import json
+
+import pytest
+
+from conftest import sample_restaurant
+from core.payload import dumps
+from core.projection import ProjectionError, parse_fields, projected_body
+from core.records import RESTAURANT_FIELDS
+
+
+def _expected(restaurants, fields, extras=None):
+    items = []
+    for i, restaurant in enumerate(restaurants):
+        item = {field: restaurant.get(field) for field in fields}
+        if extras:
+            item.update((field, extras[i][field]) for field in fields if field in extras[i])
+        items.append(item)
+    return dumps({"success": True, "count": len(items), "restaurants": items}).encode('utf-8')
+
+
+@pytest.mark.parametrize('fields', [('id',), ('id', 'lat', 'lon', 'category_id', 'rating'), RESTAURANT_FIELDS])
+def test_body_matches_dumps(dataset, fields):
+    # Dòng lệch schema (override): rating chuỗi, thiếu lat, tag None, ký tự cần escape
+    dataset = dataset.clone()
+    dataset.upsert_restaurant(sample_restaurant(rating='4,5', lat=None, tags=['50% "ngon"\n', None]))
+    restaurants = list(dataset.restaurants)
+    sample = restaurants[:50] + restaurants[-1:]
+    assert projected_body(sample, fields) == _expected(sample, fields)
+    assert projected_body(dataset.restaurants, fields) == _expected(restaurants, fields)
+    plain = [r.to_dict() for r in sample]
+    assert projected_body(plain, fields) == _expected(plain, fields)
+
+
+def test_extras_override_fields(dataset):
+    restaurants = list(dataset.restaurants)[:20]
+    fields = ('id', 'distance', 'rating')
+    extras = [{'distance': i / 3} if i % 2 else {} for i in range(len(restaurants))]
+    body = projected_body(restaurants, fields, extras)
+    assert body == _expected(restaurants, fields, extras)
+    assert json.loads(body)['restaurants'][1]['distance'] == pytest.approx(1 / 3)
+
+
+def test_parse_fields():
+    assert parse_fields('id, lat,id,,lon') == ('id', 'lat', 'lon')
+    assert parse_fields('') is None
+    with pytest.raises(ProjectionError):
+        parse_fields('id,distance')
+    assert parse_fields('id,distance', extra_fields=('distance',)) == ('id', 'distance')
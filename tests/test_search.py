@@ -0,0 +1,107 @@
+# tests/test_search.py
+# --- search_algorithm: BM25 so với điểm cố định cũ (legacy) ---
+import pytest
+
+from core.search import RATING_BOOST, search_algorithm
+from core.search_index import tokenize
+
+
+def _search(dataset, query, **kwargs):
+    return search_algorithm(
+        query, dataset.restaurants, dataset.menus_by_restaurant_id,
+        search_index=dataset.search_index, columns=dataset.columns, spatial_index=dataset.spatial_index,
+        fuzzy_index=dataset.fuzzy_index, facets=dataset.facets, **kwargs
+    )
+
+
+def _rating(restaurant):
+    rating = restaurant.get('rating')
+    return rating if isinstance(rating, (int, float)) else 0
+
+
+@pytest.mark.parametrize('query', ['phở', 'pizza', 'bún bò', 'cafe'])
+def test_bm25_returns_only_matches(dataset, query):
+    results, total = _search(dataset, query, scoring='bm25')
+    matched = set.intersection(*(set(dataset.search_index.match(token)) for token in tokenize(query)))
+    matched &= set(dataset.restaurants_by_id)  # Menu mồ côi (restaurant_id không tồn tại) không tính
+    assert total == len(results) == len(matched) > 0
+    assert {str(r['id']) for r in results} == matched
+    scores = [r['score'] for r in results]
+    assert scores == sorted(scores, reverse=True)
+    # Điểm văn bản luôn dương, rating chỉ cộng thêm
+    assert all(r['score'] - _rating(r) * RATING_BOOST > 0 for r in results)
+
+
+@pytest.mark.parametrize('query', ['phở', 'pizza'])
+def test_legacy_scores(dataset, query):
+    results, total = _search(dataset, query, scoring='legacy')
+    text_scores = dataset.search_index.match(query)
+    assert total == len(dataset.restaurants_by_id)
+    for r in results:
+        assert r['score'] == pytest.approx(text_scores.get(str(r['id']), 0) + _rating(r) * 2)
+    scores = [r['score'] for r in results]
+    assert scores == sorted(scores, reverse=True)
+
+
+def test_bm25_ranks_name_matches_first(dataset):
+    results, _ = _search(dataset, 'pizza', scoring='bm25', limit=10)
+    assert all('pizza' in r['name'].lower() for r in results)
+
+
+def test_scoring_param_on_route(client):
+    bm25 = client.post('/api/search', json={'query': 'phở', 'limit': 5}).get_json()
+    legacy = client.post('/api/search', json={'query': 'phở', 'limit': 5, 'scoring': 'legacy'}).get_json()
+    unknown = client.post('/api/search', json={'query': 'phở', 'limit': 5, 'scoring': 'nope'}).get_json()
+    assert bm25['total'] < legacy['total']
+    assert unknown['places'] == bm25['places']
+
+
+def _ids(results):
+    return [str(r['id']) for r in results]
+
+
+def test_operators(dataset):
+    restaurants = set(dataset.restaurants_by_id)
+    per_token = [set(dataset.search_index.match(token)) & restaurants for token in tokenize('lẩu nướng')]
+    both, _ = _search(dataset, 'lẩu nướng', operator='and')
+    either, _ = _search(dataset, 'lẩu nướng', operator='or')
+    assert set(_ids(both)) == set.intersection(*per_token)
+    assert set(_ids(either)) == set.union(*per_token)
+    assert len(both) < len(either)
+    # Nhà hàng khớp đủ mọi token xếp trên nhà hàng chỉ khớp 1 token (cùng rating)
+    scores = {str(r['id']): r['score'] - _rating(r) * RATING_BOOST for r in either}
+    assert min(scores[rid] for rid in _ids(both)) > max(scores[rid] for rid in set(scores) - set(_ids(both)))
+
+
+def test_auto_operator_falls_back_to_or(dataset):
+    assert _search(dataset, 'pizza zzyzx', operator='and') == ([], 0)
+    auto, total = _search(dataset, 'pizza zzyzx', operator='auto')
+    assert (auto, total) == _search(dataset, 'pizza zzyzx', operator='or') and total > 0
+    assert _search(dataset, 'pizza hà', operator='auto') == _search(dataset, 'pizza hà', operator='and')
+
+
+def test_filters_apply_to_bm25(dataset):
+    results, total = _search(dataset, 'cafe', operator='or', categories=[1], min_rating=4.5)
+    assert total == len(results) > 0
+    assert all(r['category_id'] == 1 and r['rating'] >= 4.5 for r in results)
+    located, _ = _search(dataset, 'cafe', user_lat=21.0285, user_lon=105.8542, radius=3)
+    assert located and all(r['distance'] <= 3 for r in located)
+
+
+@pytest.mark.parametrize('scoring', ['bm25', 'legacy'])
+def test_pages_match_full_ranking(dataset, scoring):
+    full, total = _search(dataset, 'cafe', scoring=scoring, operator='or')
+    pages = []
+    for offset in range(0, 60, 7):
+        page, page_total = _search(dataset, 'cafe', scoring=scoring, operator='or', offset=offset, limit=7)
+        assert page_total == total
+        pages += page
+    assert _ids(pages) == _ids(full)[:len(pages)] and len(pages) == 63
+    assert [r['score'] for r in pages] == [r['score'] for r in full[:63]]
+
+
+def test_pagination_on_route(client):
+    full = client.post('/api/search', json={'query': 'phở', 'limit': 30}).get_json()
+    page = client.post('/api/search', json={'query': 'phở', 'limit': 10, 'offset': 10}).get_json()
+    assert page['total'] == full['total'] and (page['offset'], page['limit']) == (10, 10)
+    assert page['places'] == full['places'][10:20]
@@ -0,0 +1,114 @@
+# tests/test_snapshot.py
+# --- Snapshot nhị phân: ghi rồi load lại phải ra Dataset giống hệt build từ JSON ---
+import numpy as np
+import pytest
+
+import core.snapshot as snapshot
+from conftest import sample_restaurant
+from core.columns import _DERIVED_COLUMNS
+from core.database import SNAPSHOT_SOURCES
+from core.snapshot import load_snapshot, write_snapshot
+
+
+@pytest.fixture(scope='module')
+def loaded(tmp_path_factory):
+    from core.database import DATA
+    built = DATA.current
+    path = tmp_path_factory.mktemp('snapshot') / 'snapshot.bin'
+    write_snapshot(str(path), built, SNAPSHOT_SOURCES)
+    dataset = load_snapshot(str(path), SNAPSHOT_SOURCES)
+    assert dataset is not None
+    return built, dataset
+
+
+def test_restaurants_and_menus_round_trip(loaded):
+    built, dataset = loaded
+    assert list(dataset.restaurants_by_id) == list(built.restaurants_by_id)
+    for rid, restaurant in built.restaurants_by_id.items():
+        assert dataset.restaurants_by_id[rid].to_dict() == restaurant.to_dict()
+    assert list(dataset.menus) == list(built.menus)
+    assert {rid: list(items) for rid, items in dataset.menus_by_restaurant_id.items()} == \
+        {rid: list(items) for rid, items in built.menus_by_restaurant_id.items()}
+
+
+def test_columns_round_trip(loaded):
+    built, dataset = loaded
+    assert list(dataset.columns.ids) == list(built.columns.ids)
+    assert dataset.columns.row_of == built.columns.row_of
+    for name in ('min_price', 'max_price', 'rating', 'lat', 'lon', 'category_id', 'alive') + tuple(_DERIVED_COLUMNS):
+        np.testing.assert_array_equal(getattr(dataset.columns, name), getattr(built.columns, name), err_msg=name)
+
+
+def test_indexes_round_trip(loaded):
+    built, dataset = loaded
+    for query in ('phở', 'bun bo', 'pizza', 'cafe', 'lẩu nướng'):
+        for operator in ('and', 'or'):
+            assert dataset.search_index.search(query, operator, rank_boost=0.5) == \
+                built.search_index.search(query, operator, rank_boost=0.5), (query, operator)
+        assert dataset.search_index.match(query) == built.search_index.match(query), query
+    for query in ('piza', 'hai di lao', 'pho bo'):
+        assert dataset.fuzzy_index.match(query) == built.fuzzy_index.match(query), query
+    for query in ('p', 'ph', 'phở', 'pizza 4', 'com tam'):
+        assert dataset.autocomplete.suggest(query, 20) == built.autocomplete.suggest(query, 20), query
+
+
+def test_payload_and_content_tag_round_trip(loaded):
+    built, dataset = loaded
+    assert bytes(dataset.payload.body) == bytes(built.payload.body)
+    assert dataset.payload.etag == built.payload.etag
+    assert dataset.content_tag == built.content_tag
+
+
+def test_upsert_on_loaded_snapshot(loaded):
+    built, dataset = loaded
+    dataset = dataset.clone()
+    restaurant = sample_restaurant()
+    dataset.upsert_restaurant(restaurant)
+    assert dataset.restaurants_by_id[restaurant['id']].to_dict()['name'] == restaurant['name']
+    results, _ = dataset.search_index.search('zzyzx', 'and')
+    assert [dataset.columns.ids[row] for row in results] == [restaurant['id']]
+    assert dataset.content_tag != built.content_tag
+    # Generation gốc (mmap, chỉ đọc) không đổi
+    assert restaurant['id'] not in loaded[1].restaurants_by_id
+
+
+def test_round_trip_after_mutations(loaded, tmp_path):
+    built, _ = loaded
+    dataset = built.clone()
+    victim = list(dataset.restaurants_by_id)[3]
+    updated = dataset.restaurants_by_id[list(dataset.restaurants_by_id)[5]].to_dict()
+    dataset.upsert_restaurant(sample_restaurant(), [{'id': 990001, 'restaurant_id': 'test-zzyzx-1', 'dish_name': 'Bún Zzyzx'}])
+    dataset.upsert_restaurant({**updated, 'rating': 1.5})
+    dataset.delete_restaurant(victim)
+    path = tmp_path / 'mutated.bin'
+    write_snapshot(str(path), dataset, SNAPSHOT_SOURCES)
+    reloaded = load_snapshot(str(path), SNAPSHOT_SOURCES)
+
+    assert list(reloaded.restaurants_by_id) == list(dataset.restaurants_by_id)
+    assert reloaded.restaurants_by_id[updated['id']]['rating'] == 1.5 and victim not in reloaded.restaurants_by_id
+    assert list(reloaded.menus) == list(dataset.menus)
+    assert reloaded.content_tag == dataset.content_tag
+    assert bytes(reloaded.payload.body) == dataset.payload.body and reloaded.payload.etag == dataset.payload.etag
+    for query in ('zzyzx', 'phở', 'bun bo'):
+        assert reloaded.search_index.search(query, 'or') == dataset.search_index.search(query, 'or'), query
+        assert reloaded.fuzzy_index.match(query) == dataset.fuzzy_index.match(query), query
+    rows, _ = reloaded.knn_index.query_knn(21.0245, 105.8571, 5)
+    np.testing.assert_array_equal(rows, dataset.knn_index.query_knn(21.0245, 105.8571, 5)[0])
+
+
+def test_version_mismatch_rebuilds(loaded, tmp_path, monkeypatch):
+    path = tmp_path / 'snapshot.bin'
+    write_snapshot(str(path), loaded[0], SNAPSHOT_SOURCES)
+    monkeypatch.setattr(snapshot, 'SNAPSHOT_VERSION', snapshot.SNAPSHOT_VERSION + 1)
+    assert load_snapshot(str(path), SNAPSHOT_SOURCES) is None
+
+
+def test_stale_sources_rebuild(loaded, tmp_path):
+    source = tmp_path / 'restaurants.json'
+    source.write_text('[]', encoding='utf-8')
+    path = tmp_path / 'snapshot.bin'
+    write_snapshot(str(path), loaded[0], (str(source),))
+    assert load_snapshot(str(path), (str(source),)) is not None
+    source.write_text('[{}]', encoding='utf-8')
+    assert load_snapshot(str(path), (str(source),)) is None
+    assert load_snapshot(str(tmp_path / 'missing.bin'), (str(source),)) is None
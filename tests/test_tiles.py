@@ -0,0 +1,96 @@
+# tests/test_tiles.py
+# --- Tile nhị phân z/x/y: định dạng, nội dung khớp dữ liệu, redirect theo version, cache HTTP ---
+import struct
+
+import numpy as np
+
+from core.filters import top_ranked
+from core.tiles import MAGIC, TILE_FORMAT_VERSION, decode_tile, encode_tile, in_tile, tile_bbox
+
+Z, X, Y = 12, 3252, 1803  # Tile chứa trung tâm Hà Nội
+
+
+def _version(client):
+    return client.get('/api/map/tiles').get_json()['version']
+
+
+def _tile_rows(dataset, z, x, y):
+    columns = dataset.columns
+    rows = np.nonzero(columns.alive & columns.has_coords())[0]
+    return in_tile(columns, rows, z, x, y)
+
+
+def test_encode_decode_round_trip(dataset):
+    columns = dataset.columns
+    rows = top_ranked(columns, _tile_rows(dataset, Z, X, Y))
+    assert len(rows) > 0
+    data = encode_tile(columns, rows, Z, X, Y, truncated=True)
+    magic, version, z, flags, _, x, y, count = struct.unpack_from('<4sBBBBIII', data)
+    assert (magic, version, z, flags, x, y, count) == (MAGIC, TILE_FORMAT_VERSION, Z, 1, X, Y, len(rows))
+
+    tile = decode_tile(data)
+    assert (tile['z'], tile['x'], tile['y'], tile['truncated']) == (Z, X, Y, True)
+    assert tile['ids'] == [columns.ids[row] for row in rows.tolist()]
+    np.testing.assert_array_equal(tile['points']['category'], np.clip(columns.category_id[rows], -1, 127))
+    np.testing.assert_array_equal(tile['points']['rating'], np.round(columns.rating[rows] * 20))
+
+
+def test_point_positions_inside_tile(dataset):
+    columns = dataset.columns
+    rows = _tile_rows(dataset, Z, X, Y)
+    tile = decode_tile(encode_tile(columns, rows, Z, X, Y))
+    south, west, north, east = tile_bbox(Z, X, Y)
+    # x tăng về phía đông, y tăng về phía nam (sai số 1 ô lưới)
+    lon = west + tile['points']['x'] / 65536.0 * (east - west)
+    assert np.allclose(lon, columns.lon[rows], atol=(east - west) / 1000)
+    assert ((columns.lat[rows] >= south - 1e-6) & (columns.lat[rows] <= north + 1e-6)).all()
+    order = np.argsort(columns.lat[rows])
+    assert (np.diff(tile['points']['y'][order].astype(int)) <= 0).all()
+
+
+def test_tiles_partition_points(dataset):
+    """Mỗi nhà hàng nằm ở đúng 1 trong 4 tile con."""
+    parent = set(_tile_rows(dataset, Z, X, Y).tolist())
+    children = [
+        set(_tile_rows(dataset, Z + 1, 2 * X + dx, 2 * Y + dy).tolist()) for dx in (0, 1) for dy in (0, 1)
+    ]
+    assert sum(len(child) for child in children) == len(parent)
+    assert set().union(*children) == parent
+
+
+def test_tile_endpoint(client, dataset):
+    version = _version(client)
+    assert version == dataset.content_tag
+    response = client.get(f'/api/map/tiles/{Z}/{X}/{Y}?v={version}')
+    assert response.status_code == 200
+    assert response.mimetype == 'application/octet-stream'
+    assert 'immutable' in response.headers['Cache-Control']
+    tile = decode_tile(response.data)
+    rows = top_ranked(dataset.columns, _tile_rows(dataset, Z, X, Y))
+    assert tile['ids'] == [dataset.columns.ids[row] for row in rows.tolist()]
+    assert tile['truncated'] is False
+
+    conditional = client.get(f'/api/map/tiles/{Z}/{X}/{Y}?v={version}',
+                             headers={'If-None-Match': response.headers['ETag']})
+    assert conditional.status_code == 304
+
+
+def test_tile_categories_filter(client, dataset):
+    version = _version(client)
+    tile = decode_tile(client.get(f'/api/map/tiles/{Z}/{X}/{Y}?v={version}&categories=1').data)
+    assert len(tile['ids']) > 0 and set(tile['points']['category'].tolist()) == {1}
+    assert client.get(f'/api/map/tiles/{Z}/{X}/{Y}?v={version}&categories=a').status_code == 400
+
+
+def test_stale_version_redirects(client):
+    version = _version(client)
+    response = client.get(f'/api/map/tiles/{Z}/{X}/{Y}?v=old&categories=2,1')
+    assert response.status_code == 302
+    assert response.headers['Location'].endswith(f'/api/map/tiles/{Z}/{X}/{Y}?v={version}&categories=1,2')
+    assert client.get(f'/api/map/tiles/{Z}/{X}/{Y}').status_code == 302
+
+
+def test_invalid_tile(client):
+    version = _version(client)
+    assert client.get(f'/api/map/tiles/2/4/0?v={version}').status_code == 404
+    assert client.get(f'/api/map/tiles/23/0/0?v={version}').status_code == 404